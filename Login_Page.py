@@ -39,6 +39,7 @@ st.markdown("""
 
 # Logout function
 def logout():
+    st.session_state.auth_token = None
     st.session_state.authenticated = False
     st.session_state.user = None
     st.session_state.role = None
@@ -67,11 +68,14 @@ with col2:
         Please use the sidebar to navigate through different sections:
         
         - **Milk Entry**: Record daily milk collections
+        - **Daily Dashboard**: Today's and the last 30 days' collection by village
         - **Monthly Report**: View and analyze monthly collection data
         - **Payment Details**: Track farmer payments
         - **Farmer Management**: Manage farmer information
         - **Payment Entry**: Record payments to farmers
         - **Rate Management**: Manage fat rates
+        - **Data Export**: Download entries and payments as CSV or Excel
+        - **Diagnostics**: Cache and database health (admin only)
         
         For any issues or support, please contact the administrator.
         """)
@@ -2,6 +2,16 @@ import streamlit as st
 from db_operations import authenticate_user, get_user_credentials
 from typing import Optional
 from database import init_connection
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+SESSION_TOKEN_TTL_SECONDS = 12 * 60 * 60
+
+_process_secret = None
 
 # Define user roles and passwords
 USERS = {
@@ -20,14 +30,15 @@ USERS = {
 # Define role-based access with correct page names
 ROLE_ACCESS = {
     'admin': {
-        'pages': ['1_Milk_Entry', '3_Monthly_Report', 
+        'pages': ['1_Milk_Entry', '2_Daily_Dashboard', '3_Monthly_Report', 
                  '4_Payment_Details', '5_Farmer_Management', 
                  '6_Payment_Entry', '7_Rate_Management',
-                 '8_Role_Management'],
+                 '8_Role_Management', '9_Diagnostics',
+                 '10_Data_Export'],
         'permissions': ['create', 'read', 'update', 'delete']
     },
     'operator': {
-        'pages': ['1_Milk_Entry', '3_Monthly_Report'],
+        'pages': ['1_Milk_Entry', '2_Daily_Dashboard', '3_Monthly_Report'],
         'permissions': ['create', 'read', 'update']
     }
 }
@@ -35,22 +46,22 @@ ROLE_ACCESS = {
 # Role templates - Updated with correct page names
 ROLE_TEMPLATES = {
     "admin": {
-        "pages": ['Milk_Entry', 'Monthly_Report', 
+        "pages": ['Milk_Entry', 'Daily_Dashboard', 'Monthly_Report', 
                  'Payment_Details', 'Farmer_Management', 
                  'Payment_Entry', 'Rate_Management',
-                 'Role_Management'],
+                 'Role_Management', 'Diagnostics', 'Data_Export'],
         "permissions": ['create', 'read', 'update', 'delete']
     },
     "operator": {
-        "pages": ['Milk_Entry', 'Monthly_Report'],
+        "pages": ['Milk_Entry', 'Daily_Dashboard', 'Monthly_Report'],
         "permissions": ['create', 'read', 'update']
     },
     "accountant": {
-        "pages": ['Monthly_Report', 'Payment_Details', 'Payment_Entry'],
+        "pages": ['Daily_Dashboard', 'Monthly_Report', 'Payment_Details', 'Payment_Entry'],
         "permissions": ['create', 'read', 'update']
     },
     "viewer": {
-        "pages": ['Milk_Entry', 'Monthly_Report', 'Payment_Details'],
+        "pages": ['Milk_Entry', 'Daily_Dashboard', 'Monthly_Report', 'Payment_Details'],
         "permissions": ['read']
     }
 }
@@ -70,17 +81,65 @@ def init_session_state():
     if 'accessible_pages' not in st.session_state:
         st.session_state.accessible_pages = []
 
+def _token_secret() -> bytes:
+    """Get the session token signing key from secrets, or a per-process one"""
+    global _process_secret
+    try:
+        return st.secrets["auth"]["token_secret"].encode('utf-8')
+    except (KeyError, FileNotFoundError):
+        if _process_secret is None:
+            _process_secret = secrets.token_bytes(32)
+        return _process_secret
+
+def issue_session_token(user: dict) -> str:
+    """Sign the user's identity and role into a session token"""
+    payload = json.dumps({
+        "username": user['username'],
+        "role": user.get('role', 'viewer'),
+        "user_id": str(user.get('_id')),
+        "expires": int(time.time()) + SESSION_TOKEN_TTL_SECONDS
+    }, separators=(',', ':')).encode('utf-8')
+    signature = hmac.new(_token_secret(), payload, hashlib.sha256).digest()
+    return (
+        base64.urlsafe_b64encode(payload).decode('ascii') + "." +
+        base64.urlsafe_b64encode(signature).decode('ascii')
+    )
+
+def validate_session_token(token: str) -> Optional[dict]:
+    """Get the token's claims if its signature is valid and it has not expired"""
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = base64.urlsafe_b64decode(encoded_payload)
+        signature = base64.urlsafe_b64decode(encoded_signature)
+    except (AttributeError, ValueError):
+        return None
+    expected = hmac.new(_token_secret(), payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        return None
+    claims = json.loads(payload)
+    if claims["expires"] < time.time():
+        return None
+    return claims
+
+def is_authenticated() -> bool:
+    """Check the session's signed token, without touching the database"""
+    claims = validate_session_token(st.session_state.get("auth_token"))
+    if claims is None:
+        st.session_state.authenticated = False
+        return False
+    st.session_state.authenticated = True
+    st.session_state.current_user = claims['username']
+    st.session_state.role = claims['role']
+    st.session_state.user_id = claims['user_id']
+    return True
+
 def check_password():
     """Returns `True` if the user had a correct password."""
-    if st.session_state.get("authenticated"):
+    if is_authenticated():
         return True
 
-    # Initialize session state
-    if "login_form_submitted" not in st.session_state:
-        st.session_state.login_form_submitted = False
-
-    # Login form
-    with st.form("Credentials"):
+    # Login form, cleared on submit so the password is not kept in session state
+    with st.form("Credentials", clear_on_submit=True):
         input_username = st.text_input("Username", key="input_username")
         input_password = st.text_input("Password", type="password", key="input_password")
         
@@ -92,41 +151,31 @@ def check_password():
                 handle_password_reset()
                 return False
 
-        if submitted:
-            st.session_state.login_form_submitted = True
-            st.session_state.last_username = input_username
-            st.session_state.last_password = input_password
-
-    # Handle login logic
-    if st.session_state.login_form_submitted:
-        username = st.session_state.last_username
-        password = st.session_state.last_password
+    # Verify once, on submit only
+    if not submitted:
+        return False
+    
+    if not input_username or not input_password:
+        st.error("Please enter both username and password")
+        return False
+    
+    # The bcrypt check takes a moment; each session runs on its own script thread
+    with st.spinner("Signing in..."):
+        user = authenticate_user(input_username, input_password)
+    
+    if user:
+        st.session_state.auth_token = issue_session_token(user)
+        is_authenticated()
         
-        if not username or not password:
-            st.error("Please enter both username and password")
-            st.session_state.login_form_submitted = False
-            return False
+        # Debug information
+        st.sidebar.write("Login Success:")
+        st.sidebar.write(f"Username: {input_username}")
+        st.sidebar.write(f"Role: {st.session_state.role}")
         
-        user = authenticate_user(username, password)
-        if user:
-            # Set all necessary session state variables
-            st.session_state.authenticated = True
-            st.session_state.current_user = username
-            st.session_state.role = user.get('role', 'viewer')
-            st.session_state.user_id = str(user.get('_id'))
-            
-            # Debug information
-            st.sidebar.write("Login Success:")
-            st.sidebar.write(f"Username: {username}")
-            st.sidebar.write(f"Role: {st.session_state.role}")
-            
-            return True
-        else:
-            st.error("😕 Invalid username or password")
-            st.session_state.login_form_submitted = False
-            return False
-
-    return False
+        return True
+    else:
+        st.error("😕 Invalid username or password")
+        return False
 
 def handle_password_reset():
     """Handle password reset request"""
@@ -154,9 +203,9 @@ def can_access_page(page_id: str) -> bool:
     user_role = st.session_state.get('role', '')
     
     # Define page access rules
-    admin_pages = ['5_Farmer_Management', '7_Rate_Management', '8_Role_Management','6_Payment_Entry', '4_Payment_Details']
-    user_pages = ['1_Milk_Entry', '3_Monthly_Report' ]
-    viewer_pages = ['3_Monthly_Report', '4_Payment_Details']
+    admin_pages = ['5_Farmer_Management', '7_Rate_Management', '8_Role_Management','6_Payment_Entry', '4_Payment_Details', '9_Diagnostics', '10_Data_Export']
+    user_pages = ['1_Milk_Entry', '2_Daily_Dashboard', '3_Monthly_Report' ]
+    viewer_pages = ['2_Daily_Dashboard', '3_Monthly_Report', '4_Payment_Details']
     
     if user_role == 'admin':
         return True
@@ -0,0 +1,222 @@
+"""Benchmark the data layer against a local mongod at several data sizes.
+
+Each size ("FARMERSxYEARS") is loaded from the deterministic generator in
+benchmarks/synthetic_data.py into a scratch database, which is dropped
+first. The database name must end in "_bench" so a real database is never
+dropped by mistake. Results are written as JSON so runs can be compared:
+
+    python benchmarks/bench_data_layer.py --sizes 20x1,100x1,200x3 --output before.json
+
+The app connects through MILKMAGIC_MONGO_URI / MILKMAGIC_MONGO_DB, which
+this script sets from --uri and --db before importing it.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LOAD_CHUNK_SIZE = 10000
+BULK_INSERT_SIZE = 500
+SAMPLE_FARMERS = 5
+# Only databases with this suffix are dropped and reloaded
+BENCH_DB_SUFFIX = "_bench"
+
+
+def parse_sizes(text: str) -> list:
+    sizes = []
+    for part in text.split(","):
+        farmers, years = part.lower().split("x")
+        sizes.append((int(farmers), int(years)))
+    return sizes
+
+
+def share_process_resources():
+    """Cache st.cache_resource functions for the whole run
+
+    Outside `streamlit run` st.cache_resource does not cache, so without
+    this every call would open a new MongoClient and re-check indexes,
+    which the served app never does.
+    """
+    import functools
+    import connection
+    import db_operations
+    import database
+    import farmer_directory
+
+    connection.get_client = functools.lru_cache(maxsize=None)(connection.get_client)
+    farmer_directory._load_directory = functools.lru_cache(maxsize=1)(farmer_directory._load_directory)
+    ensured = functools.lru_cache(maxsize=None)(lambda: db_operations.migrations.migrate(connection.get_db()))
+    db_operations.ensure_indexes = lambda _db: ensured()
+    database.ensure_indexes = db_operations.ensure_indexes
+
+
+def load_dataset(db, dataset: dict) -> dict:
+    """Insert every collection in chunks and build the derived collections"""
+    import migrations
+    import rollups
+    import ledger
+
+    counts = {}
+    started = time.perf_counter()
+    for collection, docs in dataset.items():
+        for offset in range(0, len(docs), LOAD_CHUNK_SIZE):
+            db[collection].insert_many(docs[offset:offset + LOAD_CHUNK_SIZE], ordered=False)
+        counts[collection] = len(docs)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rollups.rebuild_rollups(db)
+    ledger.rebuild_ledger(db)
+    migrations.migrate(db, force=True)
+    return {
+        "counts": counts,
+        "load_seconds": load_seconds,
+        "derive_seconds": time.perf_counter() - started
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    """Wall time of `repeat` calls in milliseconds"""
+    samples = []
+    for iteration in range(repeat):
+        started = time.perf_counter()
+        func(iteration)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "max_ms": max(samples)
+    }
+
+
+def run_size(farmers: int, years: int, repeat: int, seed: int) -> dict:
+    from connection import get_db
+    from synthetic_data import generate_dataset, START_DATE
+    from db_operations import (
+        get_monthly_report, get_payment_summary, get_outstanding_balances,
+        get_all_farmers, save_milk_entries, make_milk_entry
+    )
+    from farmer_directory import bump_farmer_version
+    from utils.register import build_register
+
+    db = get_db()
+    if not db.name.endswith(BENCH_DB_SUFFIX):
+        raise ValueError(f"Refusing to drop {db.name}: benchmark databases must end in {BENCH_DB_SUFFIX}")
+    db.client.drop_database(db.name)
+    bump_farmer_version()
+
+    started = time.perf_counter()
+    dataset = generate_dataset(farmers, years, seed)
+    generate_seconds = time.perf_counter() - started
+    loaded = load_dataset(db, dataset)
+
+    rng = random.Random(seed)
+    sample = [farmer["name"] for farmer in rng.sample(dataset["farmers"], min(SAMPLE_FARMERS, farmers))]
+    last_month = dataset["milk_entries"][-1]["collection"]["date"]
+    month, year = last_month.month, last_month.year
+    month_start = datetime(year, month, 1).date()
+    cells = get_monthly_report(sample[0], month, year)
+
+    timings = {
+        "monthly_report": measure(
+            lambda i: get_monthly_report(sample[i % len(sample)], month, year), repeat
+        ),
+        "register_build": measure(lambda i: build_register(cells, year, month), repeat),
+        "monthly_report_and_register": measure(
+            lambda i: build_register(get_monthly_report(sample[i % len(sample)], month, year), year, month),
+            repeat
+        ),
+        "payment_totals_month": measure(lambda i: get_payment_summary({
+            "start_date": month_start,
+            "end_date": last_month.date()
+        }), repeat),
+        "payment_totals_farmer": measure(
+            lambda i: get_payment_summary({"farmer_name": sample[i % len(sample)]}), repeat
+        ),
+        "outstanding_balances": measure(lambda i: get_outstanding_balances.__wrapped__(), repeat),
+        "farmer_listing": measure(lambda i: (bump_farmer_version(), get_all_farmers()), repeat),
+    }
+
+    # Inserts run last so they don't change the data the reads see
+    bulk_day = START_DATE + timedelta(days=years * 366 + 30)
+    def bulk_insert(iteration):
+        entries = [
+            make_milk_entry(farmer, 5.0, 4.5, 8.5, 40.0, bulk_day + timedelta(days=iteration), "Morning")
+            for farmer in (dataset["farmers"] * BULK_INSERT_SIZE)[:BULK_INSERT_SIZE]
+        ]
+        save_milk_entries(entries)
+    timings[f"bulk_insert_{BULK_INSERT_SIZE}"] = measure(bulk_insert, repeat)
+
+    return {
+        "farmers": farmers,
+        "years": years,
+        "generate_seconds": generate_seconds,
+        **loaded,
+        "timings": timings
+    }
+
+
+def run_metadata(seed: int, repeat: int) -> dict:
+    import pymongo
+    from connection import get_db
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pymongo": pymongo.version,
+        "mongod": get_db().client.server_info().get("version"),
+        "seed": seed,
+        "repeat": repeat
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="milkmagic_bench", help=f"scratch database, name ending in {BENCH_DB_SUFFIX}")
+    parser.add_argument("--sizes", default="20x1,100x1,200x3", help="FARMERSxYEARS,...")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_data_layer.json")
+    args = parser.parse_args()
+    if not args.db.endswith(BENCH_DB_SUFFIX):
+        parser.error(f"--db must end in {BENCH_DB_SUFFIX}; the database is dropped before each size")
+
+    os.environ["MILKMAGIC_MONGO_URI"] = args.uri
+    os.environ["MILKMAGIC_MONGO_DB"] = args.db
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    share_process_resources()
+
+    results = {"meta": run_metadata(args.seed, args.repeat), "sizes": []}
+    for farmers, years in parse_sizes(args.sizes):
+        print(f"{farmers} farmers x {years} years...")
+        result = run_size(farmers, years, args.repeat, args.seed)
+        results["sizes"].append(result)
+        for name, timing in result["timings"].items():
+            print(f"  {name:<30}{timing['median_ms']:>10.2f} ms median")
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
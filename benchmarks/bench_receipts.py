@@ -0,0 +1,60 @@
+"""Benchmark receipt rendering for a whole shift.
+
+Run from the repository root:
+
+    python benchmarks/bench_receipts.py [receipts]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.receipt import Receipt, render_receipts, render_receipts_parallel, render_receipt_files
+
+
+def make_receipts(count: int) -> list:
+    return [(
+        {
+            'date': '01-01-2024',
+            'shift': 'Morning',
+            'quantity': 5.5,
+            'fat': 4.2,
+            'snf': 8.5,
+            'clr': 28,
+            'amount': f"{5.5 * 39:.2f}"
+        },
+        {'name': f"Farmer {index:04d}"}
+    ) for index in range(count)]
+
+
+def report(label: str, count: int, seconds: float):
+    print(f"{label:<34}{seconds * 1000:>10.1f} ms{count / seconds:>12.1f} receipts/s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    receipts = make_receipts(count)
+
+    started = time.perf_counter()
+    for entry_data, user_data in receipts:
+        Receipt(entry_data, user_data).generate()
+    report("one document per receipt", count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    render_receipts(receipts)
+    report("single multi-page PDF", count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    render_receipts_parallel(receipts, chunk_size=max(1, count // (os.cpu_count() or 1)))
+    report("process pool, chunked PDFs", count, time.perf_counter() - started)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        started = time.perf_counter()
+        render_receipt_files(receipts, out_dir)
+        report("process pool, one file each", count, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
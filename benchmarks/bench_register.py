@@ -0,0 +1,62 @@
+"""Micro-benchmark for the monthly register grid builder.
+
+Run from the repository root:
+
+    python benchmarks/bench_register.py
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.register import build_register
+
+
+def make_entries(farmers: int, days: int, seed: int = 7) -> list:
+    """Make two shifts of raw entries per farmer per day starting 1 Jan 2024"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    entries = []
+    for _ in range(farmers):
+        for day in range(days):
+            for shift in ('morning', 'evening'):
+                liters = round(rng.uniform(1, 15), 1)
+                entries.append({
+                    'date': start + timedelta(days=day),
+                    'shift': shift,
+                    'liters': liters,
+                    'fat': round(rng.uniform(3, 8), 1),
+                    'amount': liters * 39.0
+                })
+    return entries
+
+
+def time_build(entries: list, repeat: int = 5) -> float:
+    """Best-of-n wall time of one register build in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build_register(entries, 2024, 1)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    cases = [
+        ("one farmer, one month", 1, 31),
+        ("one farmer, one year", 1, 366),
+        ("100 farmers, one month", 100, 31),
+        ("500 farmers, one year", 500, 366),
+    ]
+    print(f"{'case':<26}{'entries':>10}{'ms':>10}{'us/entry':>10}")
+    for label, farmers, days in cases:
+        entries = make_entries(farmers, days)
+        ms = time_build(entries)
+        print(f"{label:<26}{len(entries):>10}{ms:>10.2f}{ms * 1000 / len(entries):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare the list-of-dicts and columnar report formats.
+
+Decodes the same aggregated day/shift cells, as the report cursor yields
+them, both ways and reports decode time, peak allocation while decoding
+and the memory the result holds. Run from the repository root:
+
+    python benchmarks/bench_report_columns.py
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from utils.report_columns import decode_report_cells
+
+
+def make_cells(farmers: int, months: int, seed: int = 7) -> list:
+    """Aggregated cells for every farmer, day and shift from Jan 2024"""
+    rng = random.Random(seed)
+    cells = []
+    for farmer in range(farmers):
+        for month in range(1, months + 1):
+            for day in range(1, 29):
+                for shift in ('morning', 'evening'):
+                    liters = round(rng.uniform(1, 15), 1)
+                    cells.append({
+                        '_id': {'farmer': f"Farmer {farmer:04d}", 'year': 2024,
+                                'month': month, 'day': day, 'shift': shift},
+                        'liters': liters,
+                        'fat_liters': liters * round(rng.uniform(3, 8), 1),
+                        'amount': liters * 39.0,
+                        'entries': 1
+                    })
+    return cells
+
+
+def decode_dicts(cells):
+    """The dict format get_monthly_report returns, plus the DataFrame built from it"""
+    rows = [{
+        'farmer': cell['_id']['farmer'],
+        'date': datetime(cell['_id']['year'], cell['_id']['month'], cell['_id']['day']),
+        'shift': cell['_id']['shift'],
+        'liters': float(cell['liters']),
+        'fat': float(cell['fat_liters'] / cell['liters']) if cell['liters'] else 0.0,
+        'amount': float(cell['amount']),
+        'entries': cell['entries']
+    } for cell in cells]
+    return rows, pd.DataFrame(rows)
+
+
+def dict_rows_bytes(rows: list) -> int:
+    """Approximate memory held by a list of flat dicts"""
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    return total
+
+
+def measure(decode, cells):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = decode(iter(cells))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed * 1000, peak
+
+
+def main():
+    cases = [
+        ("one farmer, one year", 1, 12),
+        ("100 farmers, one month", 100, 1),
+        ("100 farmers, one year", 100, 12),
+        ("500 farmers, one year", 500, 12),
+    ]
+    print(f"{'case':<24}{'cells':>9}{'format':>9}{'ms':>10}{'peak MB':>10}{'held MB':>10}")
+    for label, farmers, months in cases:
+        cells = make_cells(farmers, months)
+
+        (rows, frame), ms, peak = measure(decode_dicts, cells)
+        held = dict_rows_bytes(rows) + frame.memory_usage(deep=True).sum()
+        print(f"{label:<24}{len(cells):>9}{'dicts':>9}{ms:>10.1f}{peak / 2**20:>10.1f}{held / 2**20:>10.1f}")
+        del rows, frame
+
+        columns, ms, peak = measure(lambda cursor: decode_report_cells(cursor, with_farmer=True), cells)
+        held = columns.memory_usage(deep=True).sum()
+        print(f"{'':<24}{'':>9}{'columns':>9}{ms:>10.1f}{peak / 2**20:>10.1f}{held / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
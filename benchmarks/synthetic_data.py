@@ -0,0 +1,130 @@
+"""Deterministic synthetic farmers, entries, payments and rate changes.
+
+The same arguments and seed always produce the same documents, so runs
+against different commits load identical data:
+
+    from benchmarks.synthetic_data import generate_dataset
+    dataset = generate_dataset(farmers=100, years=1)
+"""
+import random
+from datetime import date, datetime, timedelta
+
+VILLAGES = ["Chapda", "Kachhaliya"]
+SHIFTS = [("Morning", 6), ("Evening", 18)]
+START_DATE = date(2023, 1, 1)
+# Chance a farmer skips a shift
+ABSENCE_RATE = 0.05
+# Months between rate changes
+RATE_CHANGE_MONTHS = 3
+
+
+def generate_farmers(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    return [{
+        "name": f"Farmer {index:04d}",
+        "father_name": f"Father {index:04d}",
+        "village": VILLAGES[index % len(VILLAGES)],
+        "phone": f"9{rng.randrange(10 ** 8, 10 ** 9)}",
+        "created_at": datetime.combine(START_DATE, datetime.min.time())
+    } for index in range(count)]
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    return date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def generate_rates(years: int, seed: int = 42) -> list:
+    """Rate changes every few months, as stored in the rates collection"""
+    rng = random.Random(seed + 1)
+    rate = 38.0
+    rates = []
+    for months in range(0, years * 12, RATE_CHANGE_MONTHS):
+        effective = _add_months(START_DATE, months)
+        rates.append({
+            "rate_per_liter": rate,
+            "effective_date": datetime.combine(effective, datetime.min.time())
+        })
+        rate = round(rate + rng.choice([-0.5, 0.5, 1.0, 1.5]), 2)
+    return rates
+
+
+def generate_fat_rates() -> list:
+    """The fat rate table kept in settings"""
+    return [{"setting_type": "fat_rate", "value": round(3.0 + step * 0.1, 1)} for step in range(51)]
+
+
+def _rate_on(rates: list, day: date) -> float:
+    moment = datetime.combine(day, datetime.min.time())
+    current = rates[0]["rate_per_liter"]
+    for rate in rates:
+        if rate["effective_date"] <= moment:
+            current = rate["rate_per_liter"]
+    return current
+
+
+def iter_entries(farmers: list, years: int, rates: list, seed: int = 42):
+    """Yield milk entry documents day by day, two shifts per farmer"""
+    from db_operations import make_milk_entry
+
+    rng = random.Random(seed + 2)
+    end = _add_months(START_DATE, years * 12)
+    day = START_DATE
+    while day < end:
+        rate = _rate_on(rates, day)
+        for farmer in farmers:
+            for shift, hour in SHIFTS:
+                if rng.random() < ABSENCE_RATE:
+                    continue
+                entry = make_milk_entry(
+                    farmer,
+                    quantity=round(rng.uniform(2, 15), 1),
+                    fat=round(rng.uniform(3, 8), 1),
+                    snf=round(rng.uniform(7.5, 9.0), 1),
+                    rate_per_liter=rate,
+                    entry_date=day,
+                    shift=shift
+                )
+                entry["timestamp"] = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+                yield entry
+        day += timedelta(days=1)
+
+
+def monthly_earnings(entries) -> dict:
+    totals = {}
+    for entry in entries:
+        moment = entry["collection"]["date"]
+        key = (entry["farmer"]["name"], moment.year, moment.month)
+        totals[key] = totals.get(key, 0.0) + entry["milk"]["total_amount"]
+    return totals
+
+
+def generate_payments(earnings: dict, seed: int = 42) -> list:
+    """One payment per farmer per month, paid early the following month"""
+    rng = random.Random(seed + 3)
+    payments = []
+    for (farmer_name, year, month), earned in sorted(earnings.items()):
+        paid_on = _add_months(date(year, month, 1), 1) + timedelta(days=rng.randrange(0, 7))
+        payments.append({
+            "farmer_name": farmer_name,
+            "year": year,
+            "month": month,
+            "amount_paid": round(earned * rng.uniform(0.8, 1.0), 2),
+            "payment_date": datetime.combine(paid_on, datetime.min.time()),
+            "notes": ""
+        })
+    return payments
+
+
+def generate_dataset(farmers: int, years: int, seed: int = 42) -> dict:
+    """Build every collection's documents for one data size"""
+    farmer_docs = generate_farmers(farmers, seed)
+    rates = generate_rates(years, seed)
+    entries = list(iter_entries(farmer_docs, years, rates, seed))
+    return {
+        "farmers": farmer_docs,
+        "rates": rates,
+        "settings": generate_fat_rates(),
+        "milk_entries": entries,
+        "payments": generate_payments(monthly_earnings(entries), seed)
+    }
@@ -0,0 +1,155 @@
+import os
+import atexit
+import threading
+import streamlit as st
+from pymongo import MongoClient
+from pymongo import monitoring
+import certifi
+from instrumentation import command_listener
+
+DATABASE_NAME = "milk_collection"
+
+# Environment overrides for running against another server without
+# secrets.toml, e.g. a local mongod for benchmarks
+URI_OVERRIDE_ENV = "MILKMAGIC_MONGO_URI"
+DATABASE_OVERRIDE_ENV = "MILKMAGIC_MONGO_DB"
+
+# Pool defaults, each can be overridden under [mongo] in secrets.toml
+DEFAULT_POOL_SETTINGS = {
+    "max_pool_size": 20,
+    "min_pool_size": 1,
+    "max_idle_time_ms": 300000,
+    "wait_queue_timeout_ms": 5000,
+    "connect_timeout_ms": 10000,
+    "server_selection_timeout_ms": 10000,
+    "socket_timeout_ms": 30000,
+    "compressors": "zlib",
+}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running counters of connection pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "wait_queue": 0,
+            "checkout_failed": 0,
+            "pool_cleared": 0,
+        }
+
+    def _add(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["open"] = stats["created"] - stats["closed"]
+        return stats
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("closed")
+
+    def connection_check_out_started(self, event):
+        self._add("wait_queue")
+
+    def connection_check_out_failed(self, event):
+        self._add("wait_queue", -1)
+        self._add("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._add("wait_queue", -1)
+        self._add("checked_out")
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+
+def get_uri_override():
+    """Connection string from the environment, used instead of secrets"""
+    return os.environ.get(URI_OVERRIDE_ENV)
+
+
+def get_database_name() -> str:
+    return os.environ.get(DATABASE_OVERRIDE_ENV, DATABASE_NAME)
+
+
+def get_pool_settings() -> dict:
+    """Merge pool settings from secrets over the defaults"""
+    settings = dict(DEFAULT_POOL_SETTINGS)
+    if get_uri_override():
+        return settings
+    mongo_secrets = st.secrets["mongo"]
+    for key in settings:
+        if key in mongo_secrets:
+            settings[key] = mongo_secrets[key]
+    return settings
+
+
+@st.cache_resource
+def get_client():
+    """Create the single process-wide MongoClient shared by every page"""
+    settings = get_pool_settings()
+    listener = PoolStatsListener()
+    uri = get_uri_override()
+    # Secrets point at Atlas, which needs the certifi CA bundle
+    tls_options = {} if uri else {"tlsCAFile": certifi.where()}
+    client = MongoClient(
+        uri or st.secrets["mongo"]["connection_string"],
+        **tls_options,
+        maxPoolSize=settings["max_pool_size"],
+        minPoolSize=settings["min_pool_size"],
+        maxIdleTimeMS=settings["max_idle_time_ms"],
+        waitQueueTimeoutMS=settings["wait_queue_timeout_ms"],
+        connectTimeoutMS=settings["connect_timeout_ms"],
+        serverSelectionTimeoutMS=settings["server_selection_timeout_ms"],
+        socketTimeoutMS=settings["socket_timeout_ms"],
+        compressors=settings["compressors"],
+        event_listeners=[listener, command_listener],
+    )
+    client.pool_stats_listener = listener
+    # Close sockets cleanly when the Streamlit server process exits
+    atexit.register(client.close)
+    return client
+
+
+def get_db():
+    """Get the application database from the shared client"""
+    return get_client()[get_database_name()]
+
+
+def get_pool_stats() -> dict:
+    """Get connection pool counters for the shared client"""
+    client = get_client()
+    stats = client.pool_stats_listener.snapshot()
+    stats["max_pool_size"] = client.options.pool_options.max_pool_size
+    stats["min_pool_size"] = client.options.pool_options.min_pool_size
+    return stats
+
+
+def close_client():
+    """Close the shared client and drop it from the resource cache"""
+    get_client().close()
+    get_client.clear()
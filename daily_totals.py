@@ -0,0 +1,157 @@
+"""Per-village, per-shift collection totals for the last few weeks.
+
+`DailyTotals` keeps one cell per (date, village, shift) for a rolling
+window. The first refresh, and any refresh after the window moves to a
+new day or the totals are marked stale, groups the window on the server
+with the `collection.date` index. Later refreshes only fetch entries
+stamped shortly before the newest one already counted or later, using
+the `timestamp` index, and skip the ids they have already counted.
+
+Deleted or edited entries, and entries saved long after they were
+stamped (e.g. flushed from the offline journal), can't be seen through
+the timestamp, so `note_writes` marks the totals stale for those.
+"""
+import threading
+from datetime import date, datetime, timedelta
+
+WINDOW_DAYS = 30
+# Entries stamped up to this long before the newest counted one are
+# re-checked on each refresh, to allow for slightly late inserts
+TIMESTAMP_OVERLAP = timedelta(minutes=5)
+UNKNOWN_VILLAGE = "Unknown"
+
+
+def _cell_key(doc: dict):
+    return (
+        doc["date"],
+        doc.get("village") or UNKNOWN_VILLAGE,
+        str(doc.get("shift") or "").lower()
+    )
+
+
+class DailyTotals:
+    """Rolling per-day, per-village, per-shift sums refreshed incrementally"""
+
+    def __init__(self, window_days: int = WINDOW_DAYS):
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._stale = True
+        self.start = None
+        self.since = None
+        self.cells = {}
+        # Ids of counted entries stamped at or after `since`
+        self.counted_ids = {}
+
+    def mark_stale(self):
+        """Recompute the whole window on the next refresh"""
+        self._stale = True
+
+    def note_writes(self, entries, sign: int = 1):
+        """Mark stale for writes the timestamp refresh would miss"""
+        if sign < 0:
+            self.mark_stale()
+            return
+        cutoff = datetime.now() - TIMESTAMP_OVERLAP
+        if any(entry.get("timestamp") is None or entry["timestamp"] < cutoff for entry in entries):
+            self.mark_stale()
+
+    def _window_start(self, today: date) -> datetime:
+        return datetime.combine(today - timedelta(days=self.window_days - 1), datetime.min.time())
+
+    def _recompute(self, db, start: datetime):
+        # Entries stamped from `since` on are left to the incremental pass,
+        # so an insert racing the aggregation is counted exactly once
+        since = datetime.now() - TIMESTAMP_OVERLAP
+        cells = {}
+        for doc in db.milk_entries.aggregate([
+            {
+                "$match": {
+                    "collection.date": {"$gte": start},
+                    "timestamp": {"$not": {"$gte": since}}
+                }
+            },
+            {
+                "$group": {
+                    "_id": {
+                        "date": "$collection.date",
+                        "village": "$farmer.village",
+                        "shift": {"$toLower": "$collection.shift"}
+                    },
+                    "liters": {"$sum": "$milk.quantity"},
+                    "fat_liters": {"$sum": {"$multiply": ["$milk.fat", "$milk.quantity"]}},
+                    "amount": {"$sum": "$milk.total_amount"},
+                    "entries": {"$sum": 1}
+                }
+            }
+        ]):
+            # Null, missing and empty villages group apart but share one cell
+            cell = cells.setdefault(_cell_key(doc["_id"]), [0.0, 0.0, 0.0, 0])
+            cell[0] += float(doc["liters"])
+            cell[1] += float(doc["fat_liters"])
+            cell[2] += float(doc["amount"])
+            cell[3] += doc["entries"]
+        self.cells = cells
+        self.start = start
+        self.since = since
+        self.counted_ids = {}
+        self._apply_new(db)
+
+    def _apply_new(self, db):
+        newest = None
+        for doc in db.milk_entries.find(
+            {"timestamp": {"$gte": self.since}, "collection.date": {"$gte": self.start}},
+            {"timestamp": 1, "collection": 1, "farmer.village": 1, "milk": 1}
+        ):
+            if newest is None or doc["timestamp"] > newest:
+                newest = doc["timestamp"]
+            if doc["_id"] in self.counted_ids:
+                continue
+            self.counted_ids[doc["_id"]] = doc["timestamp"]
+            quantity = float(doc["milk"]["quantity"])
+            cell = self.cells.setdefault(_cell_key({
+                "date": doc["collection"]["date"],
+                "village": doc.get("farmer", {}).get("village"),
+                "shift": doc["collection"]["shift"]
+            }), [0.0, 0.0, 0.0, 0])
+            cell[0] += quantity
+            cell[1] += float(doc["milk"]["fat"]) * quantity
+            cell[2] += float(doc["milk"]["total_amount"])
+            cell[3] += 1
+        # Move the window up behind the newest entry and forget ids below it
+        if newest is not None and newest - TIMESTAMP_OVERLAP > self.since:
+            self.since = newest - TIMESTAMP_OVERLAP
+            self.counted_ids = {
+                entry_id: stamp for entry_id, stamp in self.counted_ids.items() if stamp >= self.since
+            }
+
+    def refresh(self, db, today: date = None):
+        """Bring the totals up to date, incrementally where possible"""
+        start = self._window_start(today or date.today())
+        with self._lock:
+            if self._stale or self.start != start:
+                # Clear the flag first so a write during the recompute marks it again
+                self._stale = False
+                self._recompute(db, start)
+            else:
+                self._apply_new(db)
+
+    def rows(self) -> list:
+        """One row per date, village and shift with liter-weighted fat"""
+        with self._lock:
+            return [{
+                "date": key[0],
+                "village": key[1],
+                "shift": key[2],
+                "liters": liters,
+                "fat": fat_liters / liters if liters else 0.0,
+                "amount": amount,
+                "entries": entries
+            } for key, (liters, fat_liters, amount, entries) in sorted(self.cells.items())]
+
+
+_totals = DailyTotals()
+
+
+def get_daily_totals_state() -> DailyTotals:
+    """The process-wide totals shared by every session"""
+    return _totals
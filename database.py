@@ -1,15 +1,16 @@
 import os
-from pymongo import MongoClient
 import streamlit as st
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
 import pymongo
+from pymongo import ReturnDocument
 from datetime import datetime, date
 from bson import ObjectId
 from password_utils import hash_password, verify_password
 from db_operations import (
     # Authentication
     init_connection,
+    ensure_indexes,
     test_connection,
     get_user_credentials,
     authenticate_user,
@@ -23,52 +24,59 @@ from db_operations import (
     
     # Milk Entries
     save_milk_entry,
+    save_milk_entries,
+    make_milk_entry,
+    get_shift_receipts,
+    get_shift_farmers,
     get_milk_entries,
+    get_recent_entries,
     get_monthly_report,
+    get_monthly_totals,
+    apply_entry_deltas,
+    check_monthly_report_index,
+    count_report_farmers,
+    iter_batch_report_cells,
     
     # Payments
     save_payment,
+    get_outstanding_balances,
     get_payments,
     get_payment_details,
+    get_payments_page,
+    get_payment_summary,
+    open_export_cursor,
+    get_report_columns,
+    get_farmer_statement,
+    get_daily_totals,
     
     # Rates
     save_rate,
     get_rates,
     get_current_rate
 )
-import certifi
+from connection import get_db
+from rates import get_rate_table, invalidate_rate_table
+from farmer_directory import get_farmer_directory, bump_farmer_version
+from farmer_search import refresh_search_keys
+from instrumentation import instrumented
+from tagged_cache import cached, invalidate
 
 load_dotenv()
 
 # Use connection pooling
-@st.cache_resource
 def init_connection():
     """Initialize database connection with connection pooling"""
     try:
-        client = MongoClient(
-            st.secrets["mongo"]["connection_string"],
-            tlsCAFile=certifi.where(),
-            maxPoolSize=5,
-            minPoolSize=1
-        )
-        return client.milk_collection
+        db = get_db()
+        ensure_indexes(db)
+        return db
     except Exception as e:
         st.error("Database connection failed")
         return None
 
 # Cache database queries
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_all_farmers():
-    """Get all farmers with caching"""
-    db = init_connection()
-    if db is not None:
-        try:
-            return list(db.farmers.find({}, {'name': 1, '_id': 0}))
-        except Exception as e:
-            return []
-    return []
-
-@st.cache_data(ttl=60)  # Cache for 1 minute
+@cached(["rates"], ttl=60)  # Cache for 1 minute
+@instrumented
 def get_rates():
     """Get rates with caching"""
     db = init_connection()
@@ -80,37 +88,30 @@ def get_rates():
             return []
     return []
 
-def get_all_farmers():
-    """Get all farmers from database"""
-    db = init_connection()
-    if db is not None:
-        try:
-            return list(db.farmers.find().sort("name", 1))
-        except Exception as e:
-            st.error(f"Error fetching farmers: {e}")
-            return []
-    return []
-
+@instrumented
 def delete_farmer(farmer_name: str) -> bool:
     """Delete farmer from database"""
     db = init_connection()
     if db is not None:
         try:
             result = db.farmers.delete_one({"name": farmer_name})
+            bump_farmer_version()
             return result.deleted_count > 0
         except Exception as e:
             st.error(f"Error deleting farmer: {e}")
             return False
     return False
 
+@instrumented
 def update_farmer(old_name: str, new_data: dict) -> bool:
     """Update farmer details"""
     db = init_connection()
     if db is not None:
         try:
             # Check if new name already exists (if name is being changed)
-            if old_name != new_data['name']:
-                existing = db.farmers.find_one({"name": new_data['name']})
+            new_name = new_data.get('name', old_name)
+            if old_name != new_name:
+                existing = db.farmers.find_one({"name": new_name})
                 if existing:
                     st.error("Farmer with this name already exists")
                     return False
@@ -119,37 +120,31 @@ def update_farmer(old_name: str, new_data: dict) -> bool:
                 {"name": old_name},
                 {"$set": new_data}
             )
+            refresh_search_keys(db, {"name": new_name})
+            bump_farmer_version()
             return result.modified_count > 0
         except Exception as e:
             st.error(f"Error updating farmer: {e}")
             return False
     return False
 
-def save_milk_entry(entry_data: dict) -> bool:
-    """Save new milk entry to database"""
-    db = init_connection()
-    if db is not None:
-        try:
-            # Insert the entry
-            db.milk_entries.insert_one(entry_data)
-            return True
-        except Exception as e:
-            st.error(f"Error saving milk entry: {e}")
-            return False
-    return False
-
-def get_farmer_entries(farmer_name=None):
-    """Get milk entries for a specific farmer or all entries"""
+@instrumented
+def get_farmer_entries(farmer_name=None, limit: int = 100):
+    """Get the latest milk entries for a specific farmer or all entries"""
     db = init_connection()
     if db is not None:
         try:
-            query = {"name": farmer_name} if farmer_name else {}
-            return list(db.milk_entries.find(query).sort("entry_date", -1))
+            query = {"farmer.name": farmer_name} if farmer_name else {}
+            return list(db.milk_entries.find(query).sort([
+                ("timestamp", -1),
+                ("_id", -1)
+            ]).limit(limit))
         except Exception as e:
             st.error(f"Error fetching entries: {e}")
             return []
     return []
 
+@instrumented
 def delete_milk_entry(entry_id) -> bool:
     """Delete milk entry from database"""
     db = init_connection()
@@ -157,13 +152,17 @@ def delete_milk_entry(entry_id) -> bool:
         try:
             if isinstance(entry_id, str):
                 entry_id = ObjectId(entry_id)
-            result = db.milk_entries.delete_one({"_id": entry_id})
-            return result.deleted_count > 0
+            deleted = db.milk_entries.find_one_and_delete({"_id": entry_id})
+            if deleted is None:
+                return False
+            apply_entry_deltas(db, [deleted], -1)
+            return True
         except Exception as e:
             st.error(f"Error deleting entry: {e}")
             return False
     return False
 
+@instrumented
 def update_milk_entry(entry_id, new_data: dict) -> bool:
     """Update milk entry details"""
     db = init_connection()
@@ -171,11 +170,20 @@ def update_milk_entry(entry_id, new_data: dict) -> bool:
         try:
             if isinstance(entry_id, str):
                 entry_id = ObjectId(entry_id)
-            result = db.milk_entries.update_one(
+            old_entry = db.milk_entries.find_one_and_update(
                 {"_id": entry_id},
-                {"$set": new_data}
+                {"$set": new_data},
+                return_document=ReturnDocument.BEFORE
             )
-            return result.modified_count > 0
+            if old_entry is None:
+                return False
+            new_entry = db.milk_entries.find_one({"_id": entry_id})
+            if new_entry == old_entry:
+                return False
+            # Move the entry's contribution out of its old cell into the new one
+            apply_entry_deltas(db, [old_entry], -1)
+            apply_entry_deltas(db, [new_entry], 1)
+            return True
         except Exception as e:
             st.error(f"Error updating entry: {e}")
             return False
@@ -193,46 +201,14 @@ def get_all_villages():
 
 def get_rate_for_fat(fat_content: float) -> float:
     """Get rate for specific fat percentage"""
-    db = init_connection()
-    if db is not None:
-        try:
-            # Find exact match first
-            rate = db.settings.find_one({
-                "setting_type": "fat_rate",
-                "value": float(fat_content)
-            })
-            
-            if rate:
-                return rate['value']
-            
-            # If no exact match, get closest lower rate
-            lower_rate = db.settings.find({
-                "setting_type": "fat_rate",
-                "value": {"$lte": float(fat_content)}
-            }).sort("value", -1).limit(1)
-            
-            lower_rate = list(lower_rate)
-            if lower_rate:
-                return lower_rate[0]['value']
-            
-            return 0.0
-        except Exception as e:
-            st.error(f"Error getting rate for fat content: {e}")
-            return 0.0
-    return 0.0
-
-def save_payment(payment_data: dict) -> bool:
-    """Save new payment entry to database"""
-    db = init_connection()
-    if db is not None:
-        try:
-            db.payments.insert_one(payment_data)
-            return True
-        except Exception as e:
-            st.error(f"Error saving payment: {e}")
-            return False
-    return False
+    try:
+        # Binary search over the in-memory rate table, no database round trip
+        return get_rate_table().rate_for_fat(fat_content)
+    except Exception as e:
+        st.error(f"Error getting rate for fat content: {e}")
+        return 0.0
 
+@instrumented
 def get_farmer_payments(farmer_name: str, month: int = None, year: int = None):
     """Get payments for a specific farmer with optional month/year filter"""
     db = init_connection()
@@ -252,6 +228,7 @@ def get_farmer_payments(farmer_name: str, month: int = None, year: int = None):
             return []
     return []
 
+@instrumented
 def save_fat_rate(rate_data: dict) -> bool:
     """Save new fat rate to database"""
     db = init_connection()
@@ -269,6 +246,7 @@ def save_fat_rate(rate_data: dict) -> bool:
             
             # Insert new fat rate
             db.settings.insert_one(rate_data)
+            invalidate_rate_table()
             return True
         except Exception as e:
             st.error(f"Error saving fat rate: {e}")
@@ -276,19 +254,10 @@ def save_fat_rate(rate_data: dict) -> bool:
     return False
 
 def get_fat_rates():
-    """Get all fat rates from database"""
-    db = init_connection()
-    if db is not None:
-        try:
-            rates = list(db.settings.find(
-                {"setting_type": "fat_rate"}
-            ).sort("value", 1))
-            return rates
-        except Exception as e:
-            st.error(f"Error fetching fat rates: {e}")
-            return []
-    return []
+    """Get all fat rates, sorted by value, from the in-memory rate table"""
+    return list(get_rate_table().fat_docs)
 
+@instrumented
 def delete_fat_rate(rate_id) -> bool:
     """Delete fat rate from database"""
     db = init_connection()
@@ -298,12 +267,14 @@ def delete_fat_rate(rate_id) -> bool:
                 "_id": rate_id,
                 "setting_type": "fat_rate"
             })
+            invalidate_rate_table()
             return result.deleted_count > 0
         except Exception as e:
             st.error(f"Error deleting fat rate: {e}")
             return False
     return False
 
+@instrumented
 def save_user(user_data: dict) -> bool:
     """Save new user to database"""
     db = init_connection()
@@ -323,6 +294,7 @@ def save_user(user_data: dict) -> bool:
             return False
     return False
 
+@instrumented
 def get_all_users():
     """Get all users from database"""
     db = init_connection()
@@ -334,6 +306,7 @@ def get_all_users():
             return []
     return []
 
+@instrumented
 def update_user_role(username: str, updated_data: dict) -> bool:
     """Update user role and permissions"""
     db = init_connection()
@@ -349,6 +322,7 @@ def update_user_role(username: str, updated_data: dict) -> bool:
             return False
     return False
 
+@instrumented
 def delete_user(username: str) -> bool:
     """Delete user from both collections"""
     db = init_connection()
@@ -368,6 +342,7 @@ def delete_user(username: str) -> bool:
             return False
     return False
 
+@instrumented
 def reset_user_password(username: str, new_password: str) -> bool:
     """Reset user's password"""
     db = init_connection()
@@ -393,55 +368,6 @@ def reset_user_password(username: str, new_password: str) -> bool:
             return False
     return False
 
-def get_monthly_report(farmer_name: str, month: int, year: int):
-    """Get monthly report without caching for real-time data"""
-    db = init_connection()
-    if db is not None:
-        try:
-            # Create a pipeline for efficient aggregation
-            pipeline = [
-                {
-                    "$match": {
-                        "farmer.name": farmer_name,
-                        "$expr": {
-                            "$and": [
-                                {"$eq": [{"$month": "$collection.date"}, month]},
-                                {"$eq": [{"$year": "$collection.date"}, year]}
-                            ]
-                        }
-                    }
-                },
-                {
-                    "$project": {
-                        "date": "$collection.date",
-                        "shift": "$collection.shift",
-                        "liters": "$milk.quantity",
-                        "fat": "$milk.fat",
-                        "amount": "$milk.total_amount",
-                        "_id": 0
-                    }
-                },
-                {
-                    "$sort": {"date": 1}
-                }
-            ]
-            
-            entries = list(db.milk_entries.aggregate(pipeline))
-            
-            # Transform the data
-            return [{
-                'date': entry['date'],
-                'shift': entry['shift'].lower(),
-                'liters': float(entry['liters']),
-                'fat': float(entry['fat']),
-                'amount': float(entry['amount'])
-            } for entry in entries]
-            
-        except Exception as e:
-            print(f"Database error: {str(e)}")  # For debugging
-            return []
-    return []
-
 # You can add other database operations here
 
 # Export all the functions from db_operations
@@ -461,13 +387,29 @@ __all__ = [
     
     # Milk Entries
     'save_milk_entry',
+    'save_milk_entries',
+    'make_milk_entry',
+    'get_shift_receipts',
+    'get_shift_farmers',
     'get_milk_entries',
+    'get_recent_entries',
     'get_monthly_report',
+    'get_monthly_totals',
+    'check_monthly_report_index',
+    'count_report_farmers',
+    'iter_batch_report_cells',
     
     # Payments
     'save_payment',
+    'get_outstanding_balances',
     'get_payments',
     'get_payment_details',
+    'get_payments_page',
+    'get_payment_summary',
+    'open_export_cursor',
+    'get_report_columns',
+    'get_farmer_statement',
+    'get_daily_totals',
     
     # Rates
     'save_rate',
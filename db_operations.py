@@ -1,22 +1,40 @@
 import streamlit as st
-from datetime import datetime
-from pymongo import MongoClient
-from password_utils import hash_password, verify_password
+from datetime import datetime, timedelta
+from password_utils import hash_password, verify_password, needs_rehash
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from connection import get_db
+from farmer_directory import get_farmer_directory, bump_farmer_version
+from farmer_search import with_search_keys, refresh_search_keys
+import rollups
+import ledger
+import migrations
+import daily_totals
+from instrumentation import instrumented
+from tagged_cache import cached, invalidate
+from utils.report_columns import decode_report_cells
+
+@st.cache_resource
+def ensure_indexes(_db):
+    """Bring the declared indexes up to date, once per process"""
+    try:
+        migrations.migrate(_db)
+    except Exception as e:
+        print(f"Index creation failed: {str(e)}")
+    return True
 
 def init_connection():
     """Initialize database connection to MongoDB Atlas"""
     try:
-        # Get MongoDB connection string from secrets
-        mongo_uri = st.secrets["mongo"]["connection_string"]
-        
-        # Connect to MongoDB Atlas
-        client = MongoClient(mongo_uri)
-        return client.milk_collection
+        # Reuse the shared pooled client instead of opening a new one
+        db = get_db()
+        ensure_indexes(db)
+        return db
     except Exception as e:
         st.error(f"Could not connect to database: {e}")
         return None
 
+@instrumented
 def create_initial_admin():
     """Create initial admin user if no users exist"""
     db = init_connection()
@@ -41,6 +59,7 @@ def create_initial_admin():
             st.error(f"Error creating initial admin: {e}")
     return False
 
+@instrumented
 def test_connection():
     """Test database connection and initialize admin if needed"""
     db = init_connection()
@@ -50,6 +69,7 @@ def test_connection():
     else:
         st.error("Failed to connect to MongoDB Atlas")
 
+@instrumented
 def get_user_credentials():
     """Get all usernames and passwords from database"""
     db = init_connection()
@@ -62,6 +82,7 @@ def get_user_credentials():
             return []
     return []
 
+@instrumented
 def authenticate_user(username: str, password: str):
     """Authenticate user credentials"""
     db = init_connection()
@@ -69,11 +90,18 @@ def authenticate_user(username: str, password: str):
         try:
             user = db.users.find_one({"username": username})
             if user and verify_password(password, user['password']):
+                # Upgrade hashes made with a different bcrypt cost while we have the password
+                if needs_rehash(user['password']):
+                    db.users.update_one(
+                        {"_id": user['_id']},
+                        {"$set": {"password": hash_password(password)}}
+                    )
                 return user
         except Exception as e:
-            st.error(f"Error authenticating user: {e}")
+            print(f"Error authenticating user: {str(e)}")
     return None
 
+@instrumented
 def save_user_credentials(username: str, password: str, role: str) -> bool:
     """Save new user credentials to database"""
     db = init_connection()
@@ -99,29 +127,24 @@ def save_user_credentials(username: str, password: str, role: str) -> bool:
     return False
 
 def get_all_farmers():
-    """Get all farmers from database"""
-    db = init_connection()
-    if db is not None:
-        try:
-            farmers = list(db.farmers.find({}))
-            return farmers
-        except Exception as e:
-            st.error(f"Error fetching farmers: {e}")
-            return []
-    return []
+    """Get all farmers, sorted by name, from the shared farmer directory"""
+    return get_farmer_directory().farmers
 
+@instrumented
 def save_farmer(farmer_data: dict) -> bool:
     """Save farmer data to database"""
     db = init_connection()
     if db is not None:
         try:
-            result = db.farmers.insert_one(farmer_data)
+            result = db.farmers.insert_one(with_search_keys(farmer_data))
+            bump_farmer_version()
             return bool(result.inserted_id)
         except Exception as e:
             st.error(f"Error saving farmer: {e}")
             return False
     return False
 
+@instrumented
 def update_farmer(farmer_id: str, farmer_data: dict) -> bool:
     db = init_connection()
     if db is not None:
@@ -130,35 +153,165 @@ def update_farmer(farmer_id: str, farmer_data: dict) -> bool:
                 {"_id": ObjectId(farmer_id)},
                 {"$set": farmer_data}
             )
+            refresh_search_keys(db, {"_id": ObjectId(farmer_id)})
+            bump_farmer_version()
             return result.modified_count > 0
         except Exception as e:
             st.error(f"Error updating farmer: {e}")
             return False
     return False
 
+@instrumented
 def delete_farmer(farmer_id: str) -> bool:
     db = init_connection()
     if db is not None:
         try:
             result = db.farmers.delete_one({"_id": ObjectId(farmer_id)})
+            bump_farmer_version()
             return result.deleted_count > 0
         except Exception as e:
             st.error(f"Error deleting farmer: {e}")
             return False
     return False
 
+@instrumented
+def apply_entry_deltas(db, entries, sign: int = 1):
+    """Keep derived collections in step after entries are added or removed"""
+    try:
+        rollups.apply_entries(db, entries, sign)
+    except Exception as e:
+        # Rollups can be reconciled later with `python rollups.py rebuild`
+        print(f"Rollup update failed: {str(e)}")
+    try:
+        ledger.apply_earnings(db, entries, sign)
+    except Exception as e:
+        # The ledger can be reconciled later with `python ledger.py rebuild`
+        print(f"Ledger update failed: {str(e)}")
+    daily_totals.get_daily_totals_state().note_writes(entries, sign)
+    months = {
+        (entry["collection"]["date"].year, entry["collection"]["date"].month)
+        for entry in entries
+    }
+    invalidate("ledger", "dashboard", *[f"entries:{year}-{month}" for year, month in months])
+
+@instrumented
+def apply_payment_deltas(db, payments, sign: int = 1):
+    """Keep the ledger in step after payments are added or removed"""
+    try:
+        ledger.apply_payments(db, payments, sign)
+    except Exception as e:
+        # The ledger can be reconciled later with `python ledger.py rebuild`
+        print(f"Ledger update failed: {str(e)}")
+    invalidate("ledger", "payments", *{f"payments:{payment['farmer_name']}" for payment in payments})
+
+@instrumented
 def save_milk_entry(entry_data: dict) -> bool:
     """Save milk entry to database"""
     db = init_connection()
     if db is not None:
         try:
             result = db.milk_entries.insert_one(entry_data)
+            apply_entry_deltas(db, [entry_data], 1)
             return bool(result.inserted_id)
         except Exception as e:
             st.error(f"Error saving milk entry: {e}")
             return False
     return False
 
+def make_milk_entry(farmer: dict, quantity: float, fat: float, snf: float,
+                    rate_per_liter: float, entry_date, shift: str) -> dict:
+    """Build a milk entry document in the shape stored in milk_entries"""
+    return {
+        "farmer": {
+            "name": farmer['name'],
+            "father_name": farmer.get('father_name', ''),
+            "village": farmer.get('village', '')
+        },
+        "milk": {
+            "quantity": quantity,
+            "fat": fat,
+            "snf": snf,
+            "rate_per_liter": rate_per_liter,
+            "total_amount": quantity * rate_per_liter
+        },
+        "collection": {
+            "date": datetime.combine(entry_date, datetime.min.time()),
+            "shift": shift
+        },
+        "timestamp": datetime.now()
+    }
+
+@instrumented
+def insert_milk_entries(db, entries: list, duplicates_ok: bool = False):
+    """Insert entries with one unordered insert_many
+
+    Returns `(inserted_count, errors)` where `errors` maps the row index of
+    each rejected entry to its error message. With `duplicates_ok`, entries
+    rejected as duplicate keys count as already written and are left out of
+    both. Connection errors are raised.
+
+    Entries are stored with a `deltas_pending` marker that is cleared once
+    they are counted in the derived collections. If a batch is cut off
+    partway, the rows that did land come back as duplicates on retry and
+    are counted then.
+    """
+    for entry in entries:
+        entry["deltas_pending"] = True
+    errors = {}
+    duplicates = set()
+    try:
+        db.milk_entries.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details['writeErrors']:
+            if duplicates_ok and error.get('code') == 11000:
+                duplicates.add(error['index'])
+            else:
+                errors[error['index']] = error['errmsg']
+    written = [
+        entry for index, entry in enumerate(entries)
+        if index not in errors and index not in duplicates
+    ]
+    if written:
+        db.milk_entries.update_many(
+            {"_id": {"$in": [entry["_id"] for entry in written]}},
+            {"$unset": {"deltas_pending": ""}}
+        )
+    uncounted = claim_uncounted_entries(db, [entries[index] for index in duplicates])
+    apply_entry_deltas(db, written + uncounted, 1)
+    return len(written), errors
+
+def claim_uncounted_entries(db, entries: list) -> list:
+    """Stored copies of duplicate entries not yet counted in derived data
+
+    Each copy is claimed by clearing its marker first, so it is counted once.
+    """
+    claimed = []
+    for entry in entries:
+        if entry.get("entry_key") is None:
+            continue
+        stored = db.milk_entries.find_one_and_update(
+            {"entry_key": entry["entry_key"], "deltas_pending": True},
+            {"$unset": {"deltas_pending": ""}}
+        )
+        if stored is not None:
+            claimed.append(stored)
+    return claimed
+
+@instrumented
+def save_milk_entries(entries: list):
+    """Save a batch of milk entries, reporting errors per row"""
+    if not entries:
+        return 0, {}
+    db = init_connection()
+    if db is not None:
+        try:
+            return insert_milk_entries(db, entries)
+        except Exception as e:
+            st.error(f"Error saving milk entries: {e}")
+            return 0, {index: str(e) for index in range(len(entries))}
+    return 0, {index: "Database connection failed" for index in range(len(entries))}
+
+@instrumented
 def get_milk_entries(start_date: datetime, end_date: datetime):
     db = init_connection()
     if db is not None:
@@ -175,63 +328,408 @@ def get_milk_entries(start_date: datetime, end_date: datetime):
             return []
     return []
 
-def get_monthly_report(farmer_name: str, month: int, year: int):
-    """Get monthly report with optimized query"""
+@instrumented
+def get_shift_farmers(entry_date, shift: str) -> set:
+    """Names of farmers who already have an entry for a date and shift"""
     db = init_connection()
     if db is not None:
         try:
-            # Create index if it doesn't exist
-            db.milk_entries.create_index([
-                ("farmer.name", 1),
-                ("collection.date", 1)
-            ])
-            
-            # Optimized query with projection
-            entries = list(db.milk_entries.find(
+            return set(db.milk_entries.distinct("farmer.name", {
+                "collection.date": datetime.combine(entry_date, datetime.min.time()),
+                "collection.shift": shift
+            }))
+        except Exception as e:
+            st.error(f"Error fetching shift entries: {e}")
+            return set()
+    return set()
+
+@instrumented
+def get_shift_receipts(entry_date, shift: str):
+    """Get `(entry_data, user_data)` receipt pairs for every entry in a shift"""
+    db = init_connection()
+    if db is not None:
+        try:
+            collection_date = datetime.combine(entry_date, datetime.min.time())
+            entries = db.milk_entries.find(
+                {"collection.date": collection_date, "collection.shift": shift},
+                {"farmer.name": 1, "milk": 1, "_id": 0}
+            ).sort("farmer.name", 1)
+            return [(
                 {
-                    "farmer.name": farmer_name,
-                    "$expr": {
-                        "$and": [
-                            {"$eq": [{"$month": "$collection.date"}, month]},
-                            {"$eq": [{"$year": "$collection.date"}, year]}
-                        ]
-                    }
+                    'date': collection_date.strftime('%d-%m-%Y'),
+                    'shift': shift,
+                    'quantity': entry['milk']['quantity'],
+                    'fat': entry['milk']['fat'],
+                    'snf': entry['milk'].get('snf', '-'),
+                    'clr': entry['milk'].get('clr', '-'),
+                    'amount': f"{entry['milk']['total_amount']:.2f}"
                 },
-                {
-                    "collection.date": 1,
-                    "collection.shift": 1,
-                    "milk.quantity": 1,
-                    "milk.fat": 1,
-                    "milk.total_amount": 1,
-                    "_id": 0
-                }
-            ).hint([("farmer.name", 1), ("collection.date", 1)]))
+                {'name': entry['farmer']['name']}
+            ) for entry in entries]
+        except Exception as e:
+            st.error(f"Error fetching shift entries: {e}")
+            return []
+    return []
+
+# Only the fields the recent entries feed shows or edits
+RECENT_ENTRY_PROJECTION = {
+    "farmer.name": 1,
+    "farmer.village": 1,
+    "collection.date": 1,
+    "collection.shift": 1,
+    "milk.quantity": 1,
+    "milk.fat": 1,
+    "milk.snf": 1,
+    "milk.rate_per_liter": 1,
+    "milk.total_amount": 1,
+    "timestamp": 1
+}
+
+@instrumented
+def get_recent_entries(shift: str = None, entry_date=None, farmer_name: str = None,
+                       after=None, limit: int = 20):
+    """Get one page of the newest entries, keyed on (timestamp, _id)
+
+    `after` is the cursor returned with the previous page. Returns
+    `(entries, next_cursor)` where `next_cursor` is None on the last page.
+    """
+    db = init_connection()
+    if db is not None:
+        try:
+            query = {}
+            if shift:
+                query["collection.shift"] = shift
+            if entry_date:
+                query["collection.date"] = datetime.combine(entry_date, datetime.min.time())
+            if farmer_name:
+                query["farmer.name"] = farmer_name
+            if after:
+                after_timestamp, after_id = after
+                query["$or"] = [
+                    {"timestamp": {"$lt": after_timestamp}},
+                    {"timestamp": after_timestamp, "_id": {"$lt": after_id}}
+                ]
+            entries = list(db.milk_entries.find(query, RECENT_ENTRY_PROJECTION).sort([
+                ("timestamp", -1),
+                ("_id", -1)
+            ]).limit(limit + 1))
+            if len(entries) > limit:
+                last = entries[limit - 1]
+                return entries[:limit], (last['timestamp'], last['_id'])
+            return entries, None
+        except Exception as e:
+            st.error(f"Error fetching recent entries: {e}")
+            return [], None
+    return [], None
+
+def month_range(month: int, year: int):
+    """Get the half-open [start, end) datetime range of a month"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+def monthly_report_pipeline(farmer_name: str, month: int, year: int):
+    """Build the monthly report query over the farmer's rollup cells"""
+    return rollups.rollup_cells_pipeline({"farmer": farmer_name, "year": year, "month": month})
+
+@instrumented
+def get_monthly_report(farmer_name: str, month: int, year: int, columnar: bool = False):
+    """Get one pre-summed cell per day and shift for a farmer's month
+
+    Cells are read from the rollups rather than grouped from raw entries.
+    With `columnar`, returns the compact DataFrame of get_report_columns
+    instead of a list of dicts.
+    """
+    db = init_connection()
+    if db is not None:
+        try:
+            cells = db.milk_rollups.aggregate(
+                monthly_report_pipeline(farmer_name, month, year)
+            )
+            if columnar:
+                return decode_report_cells(cells)
             
-            # Optimized transformation
+            # Fat is reported as the liter-weighted average of the cell
             return [{
-                'date': entry['collection']['date'],
-                'shift': entry['collection']['shift'].lower(),
-                'liters': entry['milk']['quantity'],
-                'fat': entry['milk']['fat'],
-                'amount': entry['milk']['total_amount']
-            } for entry in entries]
+                'date': datetime(year, month, cell['_id']['day']),
+                'shift': cell['_id']['shift'],
+                'liters': float(cell['liters']),
+                'fat': float(cell['fat_liters'] / cell['liters']) if cell['liters'] else 0.0,
+                'amount': float(cell['amount']),
+                'entries': cell['entries']
+            } for cell in cells]
             
         except Exception as e:
+            st.error(f"Error fetching report: {e}")
+    return decode_report_cells([]) if columnar else []
+
+def report_columns_pipeline(match: dict, by_farmer: bool) -> list:
+    """Group entries into day/shift cells for any date range"""
+    group_id = {
+        "year": {"$year": "$collection.date"},
+        "month": {"$month": "$collection.date"},
+        "day": {"$dayOfMonth": "$collection.date"},
+        "shift": {"$toLower": "$collection.shift"}
+    }
+    sort = {"_id.year": 1, "_id.month": 1, "_id.day": 1}
+    if by_farmer:
+        group_id["farmer"] = "$farmer.name"
+        sort = {"_id.farmer": 1, **sort}
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": group_id,
+                "liters": {"$sum": "$milk.quantity"},
+                "fat_liters": {"$sum": {"$multiply": ["$milk.fat", "$milk.quantity"]}},
+                "amount": {"$sum": "$milk.total_amount"},
+                "entries": {"$sum": 1}
+            }
+        },
+        {"$sort": sort}
+    ]
+
+@instrumented
+def get_report_columns(start: datetime, end: datetime, farmer_name: str = None,
+                       village: str = None, batch_size: int = 1000):
+    """Get day/shift cells in `[start, end)` as a columnar DataFrame
+
+    Without `farmer_name` every farmer's cells are returned with a
+    categorical `farmer` column. See utils.report_columns for the layout.
+    """
+    match = {"collection.date": {"$gte": start, "$lt": end}}
+    if farmer_name:
+        match["farmer.name"] = farmer_name
+    elif village:
+        match["farmer.village"] = village
+    db = init_connection()
+    if db is not None:
+        try:
+            cells = db.milk_entries.aggregate(
+                report_columns_pipeline(match, by_farmer=not farmer_name),
+                allowDiskUse=True,
+                batchSize=batch_size
+            )
+            return decode_report_cells(cells, batch_size, with_farmer=not farmer_name)
+        except Exception as e:
+            st.error(f"Error fetching report: {e}")
+    return decode_report_cells([], with_farmer=not farmer_name)
+
+def farmer_statement_pipeline(farmer_name: str, start_month: tuple, end_month: tuple) -> list:
+    """Per-month totals with month-over-month change for one farmer"""
+    return [
+        {"$match": rollups.month_range_match(farmer_name, start_month, end_month)},
+        {
+            "$group": {
+                "_id": {"year": "$year", "month": "$month"},
+                "liters": {"$sum": "$liters"},
+                "fat_liters": {"$sum": "$fat_liters"},
+                "amount": {"$sum": "$amount"},
+                "entries": {"$sum": "$entries"},
+                "days": {"$addToSet": "$day"}
+            }
+        },
+        {
+            "$set": {
+                "avg_fat": {
+                    "$cond": [{"$gt": ["$liters", 0]}, {"$divide": ["$fat_liters", "$liters"]}, 0]
+                },
+                "days": {"$size": "$days"}
+            }
+        },
+        {
+            "$setWindowFields": {
+                "sortBy": {"_id.year": 1, "_id.month": 1},
+                "output": {
+                    "previous_liters": {"$shift": {"output": "$liters", "by": -1}},
+                    "previous_amount": {"$shift": {"output": "$amount", "by": -1}},
+                    "previous_fat": {"$shift": {"output": "$avg_fat", "by": -1}},
+                    "running_amount": {
+                        "$sum": "$amount",
+                        "window": {"documents": ["unbounded", "current"]}
+                    }
+                }
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "year": "$_id.year",
+                "month": "$_id.month",
+                "liters": 1,
+                "avg_fat": 1,
+                "amount": 1,
+                "entries": 1,
+                "days": 1,
+                "running_amount": 1,
+                # Changes are null for the first month in the range
+                "liters_change": {"$subtract": ["$liters", "$previous_liters"]},
+                "amount_change": {"$subtract": ["$amount", "$previous_amount"]},
+                "fat_change": {"$subtract": ["$avg_fat", "$previous_fat"]}
+            }
+        },
+        {"$sort": {"year": 1, "month": 1}}
+    ]
+
+@instrumented
+def get_farmer_statement(farmer_name: str, start_month: tuple, end_month: tuple) -> list:
+    """Get a farmer's per-month statement from `(year, month)` to `(year, month)`
+
+    One aggregation over the rollups returns every month's liters, weighted
+    average fat, amount, running amount and change from the previous month
+    with entries.
+    """
+    db = init_connection()
+    if db is not None:
+        try:
+            return list(db.milk_rollups.aggregate(
+                farmer_statement_pipeline(farmer_name, start_month, end_month)
+            ))
+        except Exception as e:
+            st.error(f"Error fetching statement: {e}")
+            return []
+    return []
+
+def batch_report_match(month: int, year: int, village: str = None) -> dict:
+    """Build the filter for a whole month, optionally limited to a village"""
+    start, end = month_range(month, year)
+    match = {"collection.date": {"$gte": start, "$lt": end}}
+    if village:
+        match["farmer.village"] = village
+    return match
+
+@instrumented
+def count_report_farmers(month: int, year: int, village: str = None) -> int:
+    """Count farmers with entries in the month, for batch progress"""
+    db = init_connection()
+    if db is not None:
+        try:
+            return len(db.milk_entries.distinct(
+                "farmer.name", batch_report_match(month, year, village)
+            ))
+        except Exception as e:
+            st.error(f"Error counting farmers: {e}")
+            return 0
+    return 0
+
+@instrumented
+def iter_batch_report_cells(month: int, year: int, village: str = None, batch_size: int = 1000):
+    """Stream day/shift cells for every farmer in the month, sorted by farmer
+
+    One aggregation groups by farmer, day and shift on the server; cells are
+    fetched in batches so callers can build one farmer at a time.
+    """
+    db = init_connection()
+    if db is None:
+        return
+    pipeline = [
+        {"$match": batch_report_match(month, year, village)},
+        {
+            "$group": {
+                "_id": {
+                    "farmer": "$farmer.name",
+                    "day": {"$dayOfMonth": "$collection.date"},
+                    "shift": {"$toLower": "$collection.shift"}
+                },
+                "liters": {"$sum": "$milk.quantity"},
+                "fat_liters": {"$sum": {"$multiply": ["$milk.fat", "$milk.quantity"]}},
+                "amount": {"$sum": "$milk.total_amount"}
+            }
+        },
+        {"$sort": {"_id.farmer": 1, "_id.day": 1}}
+    ]
+    cells = db.milk_entries.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    for cell in cells:
+        yield {
+            'farmer': cell['_id']['farmer'],
+            'day': cell['_id']['day'],
+            'shift': cell['_id']['shift'],
+            'liters': float(cell['liters']),
+            'fat': float(cell['fat_liters'] / cell['liters']) if cell['liters'] else 0.0,
+            'amount': float(cell['amount'])
+        }
+
+@instrumented
+def explain_monthly_report(farmer_name: str, month: int, year: int, db=None) -> list:
+    """Get the winning plan stages of the monthly report query"""
+    if db is None:
+        db = init_connection()
+    if db is None:
+        return []
+    explain = db.command(
+        "aggregate",
+        "milk_rollups",
+        pipeline=monthly_report_pipeline(farmer_name, month, year),
+        explain=True
+    )
+    # Stages of rejected plans are left out
+    return migrations.winning_plan_values(explain, "stage")
+
+def check_monthly_report_index(farmer_name: str = "index-check", month: int = 1, year: int = 2024,
+                               db=None) -> bool:
+    """Check that the monthly report query is answered by an index scan
+
+    Run by `python migrations.py explain`, which fails when it doesn't hold.
+    """
+    stages = explain_monthly_report(farmer_name, month, year, db)
+    return "IXSCAN" in stages and "COLLSCAN" not in stages
+
+@cached(["entries:{year}-{month}"], ttl=300)
+@instrumented
+def get_monthly_totals(month: int, year: int, farmer_name: str = None):
+    """Get per-farmer monthly totals from the rollup collection"""
+    db = init_connection()
+    if db is not None:
+        try:
+            return rollups.get_rollup_totals(db, month, year, farmer_name)
+        except Exception as e:
+            st.error(f"Error fetching monthly totals: {e}")
+            return []
+    return []
+
+@cached(["dashboard"], ttl=30)
+@instrumented
+def get_daily_totals():
+    """Get per-day, per-village, per-shift totals for the last 30 days"""
+    db = init_connection()
+    if db is not None:
+        try:
+            totals = daily_totals.get_daily_totals_state()
+            totals.refresh(db)
+            return totals.rows()
+        except Exception as e:
+            st.error(f"Error fetching daily totals: {e}")
             return []
     return []
 
 # Payment functions
+@instrumented
 def save_payment(payment_data: dict) -> bool:
     db = init_connection()
     if db is not None:
         try:
             result = db.payments.insert_one(payment_data)
+            apply_payment_deltas(db, [payment_data], 1)
             return bool(result.inserted_id)
         except Exception as e:
             st.error(f"Error saving payment: {e}")
             return False
     return False
 
+@cached(["ledger"], ttl=300)
+@instrumented
+def get_outstanding_balances():
+    """Get what we owe every farmer from the running ledger, largest first"""
+    db = init_connection()
+    if db is not None:
+        try:
+            return ledger.get_outstanding_balances(db)
+        except Exception as e:
+            st.error(f"Error fetching outstanding balances: {e}")
+            return []
+    return []
+
+@instrumented
 def get_payments(farmer_id: str, start_date: datetime, end_date: datetime):
     db = init_connection()
     if db is not None:
@@ -249,6 +747,7 @@ def get_payments(farmer_id: str, start_date: datetime, end_date: datetime):
             return []
     return []
 
+@instrumented
 def get_payment_details(month: int, year: int):
     db = init_connection()
     if db is not None:
@@ -263,18 +762,143 @@ def get_payment_details(month: int, year: int):
             return []
     return []
 
+def payment_filter(farmer_name: str = None, village: str = None,
+                   start_date=None, end_date=None) -> dict:
+    """Build a payments query from the Payment Details filters"""
+    query = {}
+    if farmer_name:
+        query["farmer_name"] = farmer_name
+    elif village:
+        # Payments only store the farmer name, so resolve the village's farmers
+        query["farmer_name"] = {"$in": [
+            farmer['name'] for farmer in get_farmer_directory()
+            if farmer.get('village') == village
+        ]}
+    if start_date or end_date:
+        query["payment_date"] = {}
+        if start_date:
+            query["payment_date"]["$gte"] = datetime.combine(start_date, datetime.min.time())
+        if end_date:
+            query["payment_date"]["$lt"] = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    return query
+
+@instrumented
+def get_payments_page(filters: dict, after=None, limit: int = 25):
+    """Get one page of payments, newest first, keyed on (payment_date, _id)
+
+    `after` is the cursor returned with the previous page. Returns
+    `(payments, next_cursor)` where `next_cursor` is None on the last page.
+    """
+    db = init_connection()
+    if db is not None:
+        try:
+            query = payment_filter(**filters)
+            if after:
+                after_date, after_id = after
+                query = {"$and": [query, {"$or": [
+                    {"payment_date": {"$lt": after_date}},
+                    {"payment_date": after_date, "_id": {"$lt": after_id}}
+                ]}]}
+            payments = list(db.payments.find(query).sort([
+                ("payment_date", -1),
+                ("_id", -1)
+            ]).limit(limit + 1))
+            if len(payments) > limit:
+                last = payments[limit - 1]
+                return payments[:limit], (last['payment_date'], last['_id'])
+            return payments, None
+        except Exception as e:
+            st.error(f"Error fetching payments: {e}")
+            return [], None
+    return [], None
+
+@instrumented
+def get_payment_summary(filters: dict) -> dict:
+    """Get overall and per-month payment totals in one $facet aggregation
+
+    Each month also carries `earned`, the milk amount for that month read
+    from the rollups.
+    """
+    db = init_connection()
+    if db is not None:
+        try:
+            result = list(db.payments.aggregate([
+                {"$match": payment_filter(**filters)},
+                {
+                    "$facet": {
+                        "overall": [
+                            {
+                                "$group": {
+                                    "_id": None,
+                                    "total": {"$sum": "$amount_paid"},
+                                    "count": {"$sum": 1},
+                                    "farmers": {"$addToSet": "$farmer_name"}
+                                }
+                            },
+                            {"$project": {"_id": 0, "total": 1, "count": 1, "farmers": {"$size": "$farmers"}}}
+                        ],
+                        "by_month": [
+                            {
+                                "$group": {
+                                    "_id": {"year": "$year", "month": "$month"},
+                                    "total": {"$sum": "$amount_paid"},
+                                    "count": {"$sum": 1}
+                                }
+                            },
+                            {"$sort": {"_id.year": -1, "_id.month": -1}}
+                        ]
+                    }
+                }
+            ]))[0]
+            overall = result["overall"][0] if result["overall"] else {"total": 0, "count": 0, "farmers": 0}
+            earned = rollups.get_rollup_month_amounts(
+                db, [(row["_id"]["year"], row["_id"]["month"]) for row in result["by_month"]],
+                filters.get("farmer_name"), filters.get("village")
+            )
+            for row in result["by_month"]:
+                row["earned"] = earned.get((row["_id"]["year"], row["_id"]["month"]), 0.0)
+            return {"overall": overall, "by_month": result["by_month"]}
+        except Exception as e:
+            st.error(f"Error fetching payment summary: {e}")
+    return {"overall": {"total": 0, "count": 0, "farmers": 0}, "by_month": []}
+
+# Date field each exportable collection is filtered and sorted on
+EXPORT_DATE_FIELDS = {
+    "milk_entries": "collection.date",
+    "payments": "payment_date"
+}
+
+def open_export_cursor(collection: str, start_date, end_date, projection: dict,
+                       batch_size: int = 1000):
+    """Open a date-ordered cursor over a collection for streaming exports"""
+    db = init_connection()
+    if db is None:
+        return None
+    date_field = EXPORT_DATE_FIELDS[collection]
+    return db[collection].find(
+        {date_field: {
+            "$gte": datetime.combine(start_date, datetime.min.time()),
+            "$lt": datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        }},
+        projection
+    ).sort(date_field, 1).batch_size(batch_size)
+
 # Rate functions
+@instrumented
 def save_rate(rate_data: dict) -> bool:
     db = init_connection()
     if db is not None:
         try:
             result = db.rates.insert_one(rate_data)
+            # Rate charts are loaded from the same collection
+            invalidate("rates")
             return bool(result.inserted_id)
         except Exception as e:
             st.error(f"Error saving rate: {e}")
             return False
     return False
 
+@instrumented
 def get_rates():
     db = init_connection()
     if db is not None:
@@ -286,6 +910,7 @@ def get_rates():
             return []
     return []
 
+@instrumented
 def get_current_rate():
     db = init_connection()
     if db is not None:
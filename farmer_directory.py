@@ -0,0 +1,113 @@
+import threading
+import streamlit as st
+from connection import get_db
+from tagged_cache import invalidate
+from farmer_search import FarmerSearchIndex, SEARCH_LIMIT, search_farmers_db
+
+# Bumped by every farmer write; the cached directory is keyed on it
+_version_lock = threading.Lock()
+_farmer_version = 0
+
+
+def bump_farmer_version():
+    """Mark the farmer list as changed so the next lookup reloads it"""
+    global _farmer_version
+    with _version_lock:
+        _farmer_version += 1
+    # Other cached farmer queries share the "farmers" tag
+    invalidate("farmers")
+
+
+def get_farmer_version() -> int:
+    with _version_lock:
+        return _farmer_version
+
+
+def farmer_label(farmer: dict) -> str:
+    """Display label used by farmer pickers"""
+    if farmer.get('father_name'):
+        return f"{farmer['name']} ({farmer['father_name']}) - {farmer.get('village', 'N/A')}"
+    return f"{farmer['name']} - {farmer.get('village', 'N/A')}"
+
+
+class FarmerDirectory:
+    """Read-only farmer list with O(1) lookups by id, name and code
+
+    The directory is shared across sessions, so callers must not modify
+    the farmer documents it returns.
+    """
+
+    def __init__(self, farmers):
+        self.farmers = list(farmers)
+        self.by_id = {}
+        self.by_name = {}
+        self.by_code = {}
+        for farmer in self.farmers:
+            self.by_id[str(farmer['_id'])] = farmer
+            self.by_name.setdefault(farmer['name'], farmer)
+            if farmer.get('code') is not None:
+                self.by_code.setdefault(str(farmer['code']), farmer)
+        # Built on the first search, since not every page searches
+        self._search_lock = threading.Lock()
+        self._search_index = None
+
+    def __len__(self):
+        return len(self.farmers)
+
+    def __iter__(self):
+        return iter(self.farmers)
+
+    def get(self, farmer_id):
+        return self.by_id.get(str(farmer_id))
+
+    def find_by_name(self, name: str):
+        return self.by_name.get(name)
+
+    def find_by_code(self, code):
+        return self.by_code.get(str(code))
+
+    def ids(self) -> list:
+        return [str(farmer['_id']) for farmer in self.farmers]
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list:
+        """Best matches for a typed name, father's name, village or phone"""
+        with self._search_lock:
+            if self._search_index is None:
+                self._search_index = FarmerSearchIndex(self.farmers)
+        return self._search_index.search(query, limit)
+
+    def label(self, farmer_id) -> str:
+        """Display label used by farmer pickers"""
+        farmer = self.get(farmer_id)
+        if farmer is None:
+            return str(farmer_id)
+        return farmer_label(farmer)
+
+
+@st.cache_resource(max_entries=1)
+def _load_directory(version: int) -> FarmerDirectory:
+    # An exception here is not cached, so a failed load is retried next time
+    return FarmerDirectory(get_db().farmers.find().sort("name", 1))
+
+
+def get_farmer_directory() -> FarmerDirectory:
+    """Get the shared farmer directory for the current farmer version"""
+    try:
+        return _load_directory(get_farmer_version())
+    except Exception as e:
+        st.error(f"Error fetching farmers: {e}")
+        return FarmerDirectory([])
+
+
+def search_farmers(query: str, limit: int = SEARCH_LIMIT) -> list:
+    """Search the shared directory, or the database if the directory is empty"""
+    directory = get_farmer_directory()
+    if len(directory):
+        return directory.search(query, limit)
+    # The directory failed to load (or there are no farmers yet); ask the
+    # server, which answers from the search_keys index
+    try:
+        return search_farmers_db(get_db(), query, limit)
+    except Exception as e:
+        st.error(f"Error searching farmers: {e}")
+        return []
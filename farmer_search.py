@@ -0,0 +1,222 @@
+"""Prefix search over farmers by name, father's name, village and phone.
+
+Names are typed many ways ("Kachhaliya", "Kachaliya", "कछालिया"), so both
+the indexed values and the query go through `normalize`, which
+transliterates Devanagari and folds common romanization variants (aspirated
+consonants, doubled letters, w/v, y/i, the short "a") to one key.
+
+`FarmerSearchIndex` keeps those keys in a sorted list and answers prefix
+queries with binary search. Farmer documents also store the keys in
+`search_keys`, indexed in Mongo, so `search_farmers_db` can answer the
+same query on the server. Backfill existing farmers with:
+
+    python farmer_search.py backfill
+"""
+import re
+import sys
+import heapq
+import unicodedata
+from bisect import bisect_left
+from pymongo import UpdateOne
+
+SEARCH_LIMIT = 20
+
+# Score for a query token matching each field; exact matches score double
+FIELD_WEIGHTS = {"name": 4, "phone": 3, "father_name": 2, "village": 1}
+
+_DEVANAGARI_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au",
+}
+_DEVANAGARI_SIGNS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au",
+}
+_DEVANAGARI_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "श": "sh",
+    "ष": "sh", "स": "s", "ह": "h", "ळ": "l",
+}
+_DEVANAGARI_OTHER = {"ं": "n", "ँ": "n", "ः": "h", "़": ""}
+_DEVANAGARI_OTHER.update(_DEVANAGARI_VOWELS)
+_DEVANAGARI_OTHER.update({chr(0x0966 + digit): str(digit) for digit in range(10)})
+_VIRAMA = "्"
+
+
+def transliterate(text: str) -> str:
+    """Romanize Devanagari, leaving other characters as they are"""
+    out = []
+    # A consonant carries an implicit "a" unless a vowel sign or virama follows
+    inherent_a = False
+    for char in text:
+        if char in _DEVANAGARI_CONSONANTS:
+            if inherent_a:
+                out.append("a")
+            out.append(_DEVANAGARI_CONSONANTS[char])
+            inherent_a = True
+        elif char in _DEVANAGARI_SIGNS:
+            out.append(_DEVANAGARI_SIGNS[char])
+            inherent_a = False
+        elif char == _VIRAMA:
+            inherent_a = False
+        else:
+            if inherent_a:
+                out.append("a")
+            inherent_a = False
+            out.append(_DEVANAGARI_OTHER.get(char, char))
+    if inherent_a:
+        out.append("a")
+    return "".join(out)
+
+
+_FOLDS = [
+    (re.compile(r"(?<=[bcdgjkpst])h+"), ""),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"z"), "j"),
+    (re.compile(r"q"), "k"),
+    (re.compile(r"ck"), "k"),
+    (re.compile(r"ee|y"), "i"),
+    (re.compile(r"oo"), "u"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+
+
+def _fold(token: str) -> str:
+    for pattern, replacement in _FOLDS:
+        token = pattern.sub(replacement, token)
+    # Romanizations disagree most on the short "a" (the inherent vowel of
+    # Devanagari consonants), so keep it only at the start of a word
+    return token[:1] + token[1:].replace("a", "")
+
+
+def normalize_tokens(text) -> list:
+    """Split text into folded search tokens"""
+    if text is None:
+        return []
+    text = unicodedata.normalize("NFKD", transliterate(str(text)))
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    tokens = []
+    for token in re.findall(r"[a-z]+|[0-9]+", text):
+        tokens.append(token if token.isdigit() else _fold(token))
+    return [token for token in tokens if token]
+
+
+def normalize(text) -> str:
+    return " ".join(normalize_tokens(text))
+
+
+def field_keys(farmer: dict) -> list:
+    """`(key, field)` pairs indexed for one farmer"""
+    keys = []
+    for field in ("name", "father_name", "village"):
+        keys.extend((token, field) for token in normalize_tokens(farmer.get(field)))
+    phone = re.sub(r"\D", "", str(farmer.get("phone") or ""))
+    if phone:
+        keys.append((phone, "phone"))
+        # Numbers are often typed without the country code
+        if len(phone) > 10:
+            keys.append((phone[-10:], "phone"))
+    return keys
+
+
+def search_keys(farmer: dict) -> list:
+    """The `search_keys` array stored on a farmer document"""
+    return sorted({key for key, _ in field_keys(farmer)})
+
+
+def with_search_keys(farmer_data: dict) -> dict:
+    return {**farmer_data, "search_keys": search_keys(farmer_data)}
+
+
+class FarmerSearchIndex:
+    """Sorted in-memory index of farmer search keys"""
+
+    def __init__(self, farmers):
+        self.farmers = {}
+        entries = []
+        for farmer in farmers:
+            farmer_id = str(farmer["_id"])
+            self.farmers[farmer_id] = farmer
+            for key, field in field_keys(farmer):
+                entries.append((key, farmer_id, FIELD_WEIGHTS[field]))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.postings = [(farmer_id, weight) for _, farmer_id, weight in entries]
+
+    def _token_scores(self, token: str) -> dict:
+        scores = {}
+        index = bisect_left(self.keys, token)
+        while index < len(self.keys) and self.keys[index].startswith(token):
+            farmer_id, weight = self.postings[index]
+            score = weight * 2 if self.keys[index] == token else weight
+            if score > scores.get(farmer_id, 0):
+                scores[farmer_id] = score
+            index += 1
+        return scores
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list:
+        """Farmers matching every query token as a prefix, best first"""
+        tokens = normalize_tokens(query)
+        if not tokens:
+            return []
+        totals = None
+        for token in tokens:
+            scores = self._token_scores(token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {
+                    farmer_id: totals[farmer_id] + score
+                    for farmer_id, score in scores.items() if farmer_id in totals
+                }
+            if not totals:
+                return []
+        best = heapq.nsmallest(
+            limit, totals.items(),
+            key=lambda item: (-item[1], self.farmers[item[0]]["name"])
+        )
+        return [self.farmers[farmer_id] for farmer_id, _ in best]
+
+
+def search_farmers_db(db, query: str, limit: int = SEARCH_LIMIT) -> list:
+    """Answer a prefix query from the indexed `search_keys` field"""
+    tokens = normalize_tokens(query)
+    if not tokens:
+        return []
+    return list(db.farmers.find(
+        {"$and": [{"search_keys": {"$regex": f"^{re.escape(token)}"}} for token in tokens]}
+    ).sort("name", 1).limit(limit))
+
+
+def refresh_search_keys(db, query: dict) -> int:
+    """Recompute `search_keys` for the farmers matching a query"""
+    updates = [
+        UpdateOne({"_id": farmer["_id"]}, {"$set": {"search_keys": search_keys(farmer)}})
+        for farmer in db.farmers.find(query)
+    ]
+    if updates:
+        db.farmers.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def main(argv) -> int:
+    from db_operations import init_connection
+
+    command = argv[1] if len(argv) > 1 else ""
+    db = init_connection()
+    if db is None:
+        print("Could not connect to database")
+        return 1
+    if command == "backfill":
+        print(f"Updated search keys for {refresh_search_keys(db, {})} farmers")
+        return 0
+    print("Usage: python farmer_search.py backfill")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
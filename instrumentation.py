@@ -0,0 +1,287 @@
+"""Latency, volume and error counters for every data-access function.
+
+Two sources feed the same registry:
+
+* `QueryCommandListener` is registered on the shared MongoClient and sees
+  every command the driver sends, with the server round-trip time, the
+  documents in the reply and failures. Re-encoding every reply to count
+  its bytes costs about as much as decoding it, so reply bytes are an
+  estimate: one reply in `REPLY_SIZE_SAMPLE_EVERY` is measured per
+  function and collection pair (always including the first), and each
+  key's bytes are its mean sampled size times its reply count.
+* `@instrumented` wraps the functions in `database.py`/`db_operations.py`.
+  It times the whole call and keeps the function name in a thread-local
+  so every command issued inside it is attributed to that function.
+
+Errors those functions swallow into `st.error` still show up here because
+the failed command (or the exception the call raised) is counted first.
+"""
+import time
+import inspect
+import functools
+import threading
+from bisect import bisect_left
+from collections import deque, defaultdict
+from bson import encode
+from pymongo import monitoring
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# Recent samples kept per function/collection for percentiles
+SAMPLE_SIZE = 1000
+RECENT_COMMANDS = 200
+# Encode one reply in this many per function/collection to estimate reply bytes
+REPLY_SIZE_SAMPLE_EVERY = 20
+
+_context = threading.local()
+
+
+def current_function():
+    """Name of the innermost instrumented function running on this thread"""
+    stack = getattr(_context, "stack", None)
+    return stack[-1] if stack else None
+
+
+class LatencyStats:
+    """Counters, a fixed-bucket histogram and recent samples for one key"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.docs = 0
+        self.replies = 0
+        self.sampled_bytes = 0
+        self.sampled_replies = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def observe(self, duration_ms: float):
+        self.calls += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.samples.append(duration_ms)
+
+    def add_reply(self, docs: int, size):
+        """Count a reply; `size` is None when its bytes were not sampled"""
+        self.replies += 1
+        self.docs += docs
+        if size is not None:
+            self.sampled_bytes += size
+            self.sampled_replies += 1
+
+    def estimated_bytes(self) -> int:
+        if not self.sampled_replies:
+            return 0
+        return round(self.sampled_bytes / self.sampled_replies * self.replies)
+
+    def percentile(self, samples: list, fraction: float) -> float:
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "docs": self.docs,
+            "bytes": self.estimated_bytes(),
+            "mean_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentile(samples, 0.50),
+            "p95_ms": self.percentile(samples, 0.95),
+            "p99_ms": self.percentile(samples, 0.99),
+            "histogram": dict(zip(
+                [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"],
+                self.buckets
+            )),
+        }
+
+
+class QueryStats:
+    """Process-wide per-function and per-collection query statistics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.functions = defaultdict(LatencyStats)
+            self.collections = defaultdict(LatencyStats)
+            self.recent = deque(maxlen=RECENT_COMMANDS)
+
+    def record_call(self, function: str, duration_ms: float, failed: bool):
+        with self._lock:
+            stats = self.functions[function]
+            stats.observe(duration_ms)
+            if failed:
+                stats.errors += 1
+
+    def record_command(self, function, collection: str, command: str,
+                       duration_ms: float, docs: int, size, failed: bool):
+        with self._lock:
+            stats = self.collections[collection]
+            stats.observe(duration_ms)
+            if failed:
+                stats.errors += 1
+            else:
+                stats.add_reply(docs, size)
+            if function is not None:
+                # Call latency is recorded by the decorator; add the volume here
+                if failed:
+                    self.functions[function].errors += 1
+                else:
+                    self.functions[function].add_reply(docs, size)
+            self.recent.append({
+                "at": time.time(),
+                "function": function or "-",
+                "collection": collection,
+                "command": command,
+                "duration_ms": duration_ms,
+                "docs": docs,
+                "failed": failed
+            })
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "functions": {name: stats.snapshot() for name, stats in self.functions.items()},
+                "collections": {name: stats.snapshot() for name, stats in self.collections.items()},
+                "recent": list(self.recent),
+            }
+
+
+_stats = QueryStats()
+
+
+def _reply_docs(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if isinstance(reply.get("values"), list):
+        return len(reply["values"])
+    return int(reply.get("n", 0) or 0)
+
+
+class QueryCommandListener(monitoring.CommandListener):
+    """Attributes each driver command to a collection and calling function"""
+
+    def __init__(self, stats: QueryStats):
+        self.stats = stats
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reply_counts = defaultdict(int)
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            collection = "-"
+        # started() runs on the thread that issued the command, so the
+        # thread-local function name is the caller's
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, current_function())
+
+    def _finish(self, event, reply, failed: bool):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, function = pending
+        docs, size = 0, None
+        if reply:
+            docs = _reply_docs(reply)
+            with self._lock:
+                count = self._reply_counts[pending]
+                self._reply_counts[pending] = count + 1
+            if count % REPLY_SIZE_SAMPLE_EVERY == 0:
+                size = len(encode(reply))
+        self.stats.record_command(
+            function, collection, event.command_name,
+            event.duration_micros / 1000.0, docs, size, failed
+        )
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, False)
+
+    def failed(self, event):
+        self._finish(event, None, True)
+
+
+command_listener = QueryCommandListener(_stats)
+
+
+def instrumented(func):
+    """Time a data-access function and attribute its commands to it"""
+    name = f"{func.__module__}.{func.__name__}"
+
+    def enter():
+        stack = getattr(_context, "stack", None)
+        if stack is None:
+            stack = _context.stack = []
+        stack.append(name)
+        return stack
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            # Only time spent producing items counts, not the caller's work
+            # between them, and only the producer's commands are attributed
+            generator = func(*args, **kwargs)
+            elapsed = 0.0
+            failed = False
+            try:
+                while True:
+                    stack = enter()
+                    start = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    except Exception:
+                        failed = True
+                        raise
+                    finally:
+                        stack.pop()
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                generator.close()
+                _stats.record_call(name, elapsed * 1000.0, failed)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = enter()
+        start = time.perf_counter()
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            stack.pop()
+            _stats.record_call(name, (time.perf_counter() - start) * 1000.0, failed)
+
+    return wrapper
+
+
+def query_stats() -> dict:
+    """Snapshot of every function and collection counter plus recent commands"""
+    return _stats.snapshot()
+
+
+def slowest_queries(limit: int = 20) -> list:
+    """The slowest of the recently recorded commands, slowest first"""
+    return sorted(_stats.snapshot()["recent"], key=lambda row: row["duration_ms"], reverse=True)[:limit]
+
+
+def reset_query_stats():
+    _stats.reset()
@@ -0,0 +1,231 @@
+"""Local write-ahead journal for milk entries.
+
+Entries are written to a SQLite file in the app directory first, so the
+counter never waits on the network. A background flusher drains the journal
+to MongoDB in batches. Every entry carries an `entry_key`, and a unique index
+on it makes re-flushing an entry harmless.
+
+Entries rejected `MAX_FLUSH_ATTEMPTS` times (not connection failures) are
+moved to a `dead_entries` table so they can't hold up the rest of the queue.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import streamlit as st
+from bson import json_util
+from pymongo.errors import ConnectionFailure
+from connection import get_db
+from db_operations import ensure_indexes, insert_milk_entries
+
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "milk_journal.db")
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 5
+MAX_BACKOFF_SECONDS = 120
+MAX_FLUSH_ATTEMPTS = 5
+
+
+class MilkEntryJournal:
+    """Durable SQLite queue of milk entries waiting to reach MongoDB"""
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_entries (
+                entry_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_entries (
+                entry_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT
+            )
+        """)
+
+    def append(self, entries: list) -> list:
+        """Durably queue entries, assigning idempotency keys, and return the keys"""
+        now = time.time()
+        rows = []
+        for entry in entries:
+            entry.setdefault("entry_key", uuid.uuid4().hex)
+            payload = {key: value for key, value in entry.items() if key != "_id"}
+            rows.append((entry["entry_key"], json_util.dumps(payload), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pending_entries (entry_key, payload, created_at) VALUES (?, ?, ?)",
+                rows
+            )
+        return [row[0] for row in rows]
+
+    def pending(self, limit: int = FLUSH_BATCH_SIZE) -> list:
+        """Get the oldest queued entries as `(entry_key, entry)` pairs
+
+        Entries that have failed before go after ones that haven't.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry_key, payload FROM pending_entries ORDER BY attempts, created_at LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [(key, json_util.loads(payload)) for key, payload in rows]
+
+    def remove(self, keys: list):
+        """Drop entries that are now stored in MongoDB"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM pending_entries WHERE entry_key = ?",
+                [(key,) for key in keys]
+            )
+
+    def record_failure(self, keys: list, error: str):
+        """Keep failed entries queued and remember why they failed
+
+        Entries that have now failed `MAX_FLUSH_ATTEMPTS` times are moved
+        to `dead_entries`.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE pending_entries SET attempts = attempts + 1, last_error = ? WHERE entry_key = ?",
+                    [(error, key) for key in keys]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_entries "
+                    "SELECT entry_key, payload, created_at, attempts, last_error FROM pending_entries "
+                    "WHERE attempts >= ?",
+                    (MAX_FLUSH_ATTEMPTS,)
+                )
+                self._conn.execute(
+                    "DELETE FROM pending_entries WHERE attempts >= ?", (MAX_FLUSH_ATTEMPTS,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        """Get queue depth, age of the oldest entry, the latest error and dead entries"""
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM pending_entries"
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_entries").fetchone()[0]
+            last_error = self._conn.execute(
+                "SELECT last_error FROM pending_entries WHERE last_error IS NOT NULL "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+        return {
+            "depth": depth,
+            "oldest_age_seconds": time.time() - oldest if oldest else 0.0,
+            "last_error": last_error[0] if last_error else None,
+            "dead": dead
+        }
+
+
+class JournalFlusher(threading.Thread):
+    """Background thread that drains the journal to MongoDB in batches"""
+
+    def __init__(self, journal: MilkEntryJournal, batch_size: int = FLUSH_BATCH_SIZE,
+                 interval: float = FLUSH_INTERVAL_SECONDS):
+        super().__init__(name="milk-journal-flusher", daemon=True)
+        self.journal = journal
+        self.batch_size = batch_size
+        self.interval = interval
+        self.last_flush = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._backoff = interval
+
+    def wake(self):
+        """Ask for a flush now instead of at the next interval"""
+        self._wake.set()
+
+    def flush_once(self) -> int:
+        """Flush one batch, returning how many entries left the journal"""
+        batch = self.journal.pending(self.batch_size)
+        if not batch:
+            return 0
+        keys = [key for key, _ in batch]
+        entries = [entry for _, entry in batch]
+        db = get_db()
+        ensure_indexes(db)
+        _, errors = insert_milk_entries(db, entries, duplicates_ok=True)
+        failed = [keys[index] for index in errors]
+        flushed = [key for index, key in enumerate(keys) if index not in errors]
+        self.journal.remove(flushed)
+        if failed:
+            self.journal.record_failure(failed, "; ".join(set(errors.values())))
+        self.last_flush = time.time()
+        return len(flushed)
+
+    def run(self):
+        while True:
+            try:
+                # Keep draining while full batches come back
+                while self.flush_once() >= self.batch_size:
+                    pass
+                self.last_error = None
+                self._backoff = self.interval
+            except ConnectionFailure as e:
+                self.last_error = str(e)
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF_SECONDS)
+            except Exception as e:
+                self.last_error = str(e)
+            self._wake.wait(self._backoff)
+            self._wake.clear()
+
+
+@st.cache_resource
+def get_journal():
+    """Get the process-wide journal with its flusher thread running"""
+    journal = MilkEntryJournal()
+    journal.flusher = JournalFlusher(journal)
+    journal.flusher.start()
+    return journal
+
+
+def queue_milk_entries(entries: list) -> list:
+    """Accept entries into the local journal and wake the flusher"""
+    journal = get_journal()
+    keys = journal.append(entries)
+    journal.flusher.wake()
+    return keys
+
+
+def save_or_queue_milk_entries(entries: list):
+    """Write entries straight to MongoDB, queueing them if it is unreachable
+
+    Returns `(saved_count, errors, queued_count)` with errors keyed by row.
+    """
+    for entry in entries:
+        entry.setdefault("entry_key", uuid.uuid4().hex)
+    try:
+        db = get_db()
+        ensure_indexes(db)
+        saved, errors = insert_milk_entries(db, entries, duplicates_ok=True)
+        return saved, errors, 0
+    except ConnectionFailure:
+        queue_milk_entries(entries)
+        return 0, {}, len(entries)
+
+
+def get_journal_status() -> dict:
+    """Get journal stats plus the flusher's last flush and error"""
+    journal = get_journal()
+    status = journal.stats()
+    status["last_flush"] = journal.flusher.last_flush
+    status["flusher_error"] = journal.flusher.last_error
+    return status
@@ -0,0 +1,331 @@
+"""Per-farmer running ledger of milk earned versus payments made.
+
+`ledger_months` holds one document per (farmer, year, month) with the
+month's `earned` and `paid` amounts; closed months also carry
+`opening_balance` and `closing_balance` snapshots. `ledger_balances` holds
+one running `balance` per farmer so outstanding amounts for every farmer
+come back from a single indexed query.
+
+Entry and payment writes update both incrementally. The first write in a
+new month closes every month before it, in order, and the month closed
+last is recorded in `settings`. A write into a closed month re-snapshots
+that month and every later closed one for the farmers it touched, so
+closing balances and the openings carried from them stay current. The
+command line rebuilds the ledger from raw data or snapshots a month:
+
+    python ledger.py rebuild
+    python ledger.py snapshot 2024-01
+"""
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pymongo import UpdateOne
+
+CLOSED_SETTING = "ledger_closed_through"
+
+# The month this process last checked for months to close
+_closed_check = None
+
+
+def _other_field(field: str) -> dict:
+    # Start new documents with both totals; the one being $inc'd can't be set too
+    return {"paid" if field == "earned" else "earned": 0.0}
+
+
+def _month_updates(amounts: dict, field: str) -> list:
+    return [
+        UpdateOne(
+            {"farmer": farmer, "year": year, "month": month},
+            {"$inc": {field: amount}, "$setOnInsert": _other_field(field)},
+            upsert=True
+        )
+        for (farmer, year, month), amount in amounts.items()
+    ]
+
+
+def _balance_updates(amounts: dict, field: str, sign: int) -> list:
+    totals = defaultdict(float)
+    for (farmer, _, _), amount in amounts.items():
+        totals[farmer] += amount
+    return [
+        UpdateOne(
+            {"farmer": farmer},
+            {
+                "$inc": {field: amount, "balance": sign * amount},
+                "$set": {"updated_at": datetime.now()},
+                "$setOnInsert": _other_field(field)
+            },
+            upsert=True
+        )
+        for farmer, amount in totals.items()
+    ]
+
+
+def _apply(db, amounts: dict, field: str, balance_sign: int):
+    if not amounts:
+        return
+    close_previous_months(db)
+    db.ledger_months.bulk_write(_month_updates(amounts, field), ordered=False)
+    db.ledger_balances.bulk_write(_balance_updates(amounts, field, balance_sign), ordered=False)
+    _refresh_closed_months(db, amounts)
+
+
+def _refresh_closed_months(db, amounts: dict):
+    """Re-snapshot closed months that a write just changed"""
+    closed = get_closed_through(db)
+    if closed is None:
+        return
+    earliest = {}
+    for farmer, year, month in amounts:
+        if (year, month) <= closed and (year, month) < earliest.get(farmer, (10000, 1)):
+            earliest[farmer] = (year, month)
+    by_month = defaultdict(list)
+    for farmer, year_month in earliest.items():
+        by_month[year_month].append(farmer)
+    for (year, month), farmers in sorted(by_month.items()):
+        snapshot_month(db, year, month, farmers)
+
+
+def apply_earnings(db, entries, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) entry amounts from the ledger"""
+    amounts = defaultdict(float)
+    for entry in entries:
+        date = entry["collection"]["date"]
+        key = (entry["farmer"]["name"], date.year, date.month)
+        amounts[key] += sign * float(entry["milk"]["total_amount"])
+    _apply(db, amounts, "earned", 1)
+
+
+def apply_payments(db, payments, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) payments from the ledger"""
+    amounts = defaultdict(float)
+    for payment in payments:
+        key = (payment["farmer_name"], payment["year"], payment["month"])
+        amounts[key] += sign * float(payment["amount_paid"])
+    _apply(db, amounts, "paid", -1)
+
+
+def _previous_month(year: int, month: int):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def _next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _before(year: int, month: int) -> dict:
+    return {"$or": [{"year": {"$lt": year}}, {"year": year, "month": {"$lt": month}}]}
+
+
+def get_closed_through(db):
+    """`(year, month)` of the last closed month, or None"""
+    doc = db.settings.find_one({"setting_type": CLOSED_SETTING})
+    return (doc["year"], doc["month"]) if doc else None
+
+
+def _record_closed_through(db, year: int, month: int):
+    db.settings.update_one(
+        {"setting_type": CLOSED_SETTING},
+        {"$set": {"year": year, "month": month, "updated_at": datetime.now()}},
+        upsert=True
+    )
+
+
+def _snapshot_one(db, year: int, month: int, farmers: list = None) -> int:
+    previous_year, previous_month = _previous_month(year, month)
+    farmer_filter = {} if farmers is None else {"farmer": {"$in": farmers}}
+    openings = {
+        doc["farmer"]: doc.get("closing_balance", 0.0)
+        for doc in db.ledger_months.find(
+            {"year": previous_year, "month": previous_month, **farmer_filter},
+            {"farmer": 1, "closing_balance": 1}
+        )
+    }
+    activity = {
+        doc["farmer"]: doc
+        for doc in db.ledger_months.find({"year": year, "month": month, **farmer_filter})
+    }
+    now = datetime.now()
+    updates = []
+    for farmer in set(openings) | set(activity):
+        opening = openings.get(farmer, 0.0)
+        earned = activity.get(farmer, {}).get("earned", 0.0)
+        paid = activity.get(farmer, {}).get("paid", 0.0)
+        updates.append(UpdateOne(
+            {"farmer": farmer, "year": year, "month": month},
+            {
+                "$set": {
+                    "opening_balance": opening,
+                    "closing_balance": opening + earned - paid,
+                    "closed_at": now
+                },
+                "$setOnInsert": {"earned": 0.0, "paid": 0.0}
+            },
+            upsert=True
+        ))
+    if updates:
+        db.ledger_months.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def snapshot_month(db, year: int, month: int, farmers: list = None) -> int:
+    """Store opening and closing balances for a month, for every farmer or just `farmers`
+
+    Openings come from the previous month's closing snapshot, so that month
+    must be closed first unless the ledger has nothing earlier; otherwise
+    ValueError is raised. Snapshotting an already closed month also
+    re-snapshots every later closed month, since their openings carry
+    forward from it.
+    """
+    closed = get_closed_through(db)
+    previous = _previous_month(year, month)
+    if (closed is None or closed < previous) and db.ledger_months.find_one(_before(year, month)):
+        raise ValueError(f"Snapshot {previous[0]}-{previous[1]:02d} first")
+    count = _snapshot_one(db, year, month, farmers)
+    if closed is not None and (year, month) <= closed:
+        current = (year, month)
+        while current < closed:
+            current = _next_month(*current)
+            _snapshot_one(db, *current, farmers)
+    elif farmers is None:
+        _record_closed_through(db, year, month)
+    return count
+
+
+def close_months(db, year: int, month: int) -> int:
+    """Snapshot, in order, every month not yet closed up to and including `year`-`month`"""
+    closed = get_closed_through(db)
+    if closed is None:
+        earliest = db.ledger_months.find_one({}, {"year": 1, "month": 1}, sort=[("year", 1), ("month", 1)])
+        if earliest is None:
+            return 0
+        closed = _previous_month(earliest["year"], earliest["month"])
+    count = 0
+    while closed < (year, month):
+        closed = _next_month(*closed)
+        snapshot_month(db, *closed)
+        count += 1
+    return count
+
+
+def close_previous_months(db, today: datetime = None) -> int:
+    """Close every month before the current one, checking once per month per process"""
+    global _closed_check
+    today = today or datetime.now()
+    if _closed_check == (today.year, today.month):
+        return 0
+    count = close_months(db, *_previous_month(today.year, today.month))
+    _closed_check = (today.year, today.month)
+    return count
+
+
+def get_outstanding_balances(db, min_balance: float = 0.01) -> list:
+    """Get every farmer we still owe money, largest balance first"""
+    return list(db.ledger_balances.find(
+        {"balance": {"$gte": min_balance}},
+        {"_id": 0, "farmer": 1, "earned": 1, "paid": 1, "balance": 1}
+    ).sort("balance", -1))
+
+
+def get_farmer_ledger(db, farmer_name: str) -> list:
+    """Get a farmer's ledger months, newest first"""
+    return list(db.ledger_months.find(
+        {"farmer": farmer_name},
+        {"_id": 0}
+    ).sort([("year", -1), ("month", -1)]))
+
+
+def rebuild_ledger(db) -> int:
+    """Recompute monthly earned/paid and running balances from raw data"""
+    months = defaultdict(lambda: {"earned": 0.0, "paid": 0.0})
+    for doc in db.milk_entries.aggregate([
+        {
+            "$group": {
+                "_id": {
+                    "farmer": "$farmer.name",
+                    "year": {"$year": "$collection.date"},
+                    "month": {"$month": "$collection.date"}
+                },
+                "amount": {"$sum": "$milk.total_amount"}
+            }
+        }
+    ], allowDiskUse=True):
+        months[(doc["_id"]["farmer"], doc["_id"]["year"], doc["_id"]["month"])]["earned"] = doc["amount"]
+    for doc in db.payments.aggregate([
+        {
+            "$group": {
+                "_id": {"farmer": "$farmer_name", "year": "$year", "month": "$month"},
+                "amount": {"$sum": "$amount_paid"}
+            }
+        }
+    ], allowDiskUse=True):
+        months[(doc["_id"]["farmer"], doc["_id"]["year"], doc["_id"]["month"])]["paid"] = doc["amount"]
+
+    balances = defaultdict(lambda: {"earned": 0.0, "paid": 0.0})
+    for (farmer, _, _), totals in months.items():
+        balances[farmer]["earned"] += totals["earned"]
+        balances[farmer]["paid"] += totals["paid"]
+
+    now = datetime.now()
+    month_updates = [
+        UpdateOne(
+            {"farmer": farmer, "year": year, "month": month},
+            {"$set": totals},
+            upsert=True
+        )
+        for (farmer, year, month), totals in months.items()
+    ]
+    balance_updates = [
+        UpdateOne(
+            {"farmer": farmer},
+            {
+                "$set": {
+                    "earned": totals["earned"],
+                    "paid": totals["paid"],
+                    "balance": totals["earned"] - totals["paid"],
+                    "updated_at": now
+                }
+            },
+            upsert=True
+        )
+        for farmer, totals in balances.items()
+    ]
+    db.ledger_months.update_many({}, {"$set": {"earned": 0.0, "paid": 0.0}})
+    db.ledger_balances.delete_many({"farmer": {"$nin": list(balances)}})
+    if month_updates:
+        db.ledger_months.bulk_write(month_updates, ordered=False)
+    if balance_updates:
+        db.ledger_balances.bulk_write(balance_updates, ordered=False)
+    # Recompute the closing snapshots from the rebuilt months
+    closed = get_closed_through(db)
+    earliest = db.ledger_months.find_one({}, {"year": 1, "month": 1}, sort=[("year", 1), ("month", 1)])
+    if closed is not None and earliest is not None and (earliest["year"], earliest["month"]) <= closed:
+        snapshot_month(db, earliest["year"], earliest["month"])
+    return len(balances)
+
+
+def main(argv) -> int:
+    from db_operations import init_connection
+
+    command = argv[1] if len(argv) > 1 else ""
+    db = init_connection()
+    if db is None:
+        print("Could not connect to database")
+        return 1
+    if command == "rebuild":
+        print(f"Rebuilt ledger for {rebuild_ledger(db)} farmers")
+        return 0
+    if command == "snapshot" and len(argv) > 2:
+        year, month = (int(part) for part in argv[2].split("-"))
+        try:
+            print(f"Snapshotted {snapshot_month(db, year, month)} farmers for {year}-{month:02d}")
+        except ValueError as e:
+            print(f"Cannot snapshot {year}-{month:02d}: {e}")
+            return 1
+        return 0
+    print("Usage: python ledger.py [rebuild|snapshot YYYY-MM]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,281 @@
+"""Declared indexes and schema version for every collection.
+
+`INDEXES` is the single list of indexes the app relies on. `migrate`
+creates them idempotently, reporting each failure (e.g. duplicates blocking
+a unique index) without stopping the rest, and records `SCHEMA_VERSION` in
+`settings` once every index and data migration is in place. The app runs
+it once per process on first connection; the command line runs it on
+demand or prints an explain-plan report for the queries the app issues,
+failing if the monthly report query isn't answered by an index scan:
+
+    python migrations.py migrate
+    python migrations.py status
+    python migrations.py explain
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from pymongo.errors import PyMongoError
+from rollups import ROLLUP_KEY
+from farmer_search import refresh_search_keys
+
+# Bump whenever INDEXES changes so running apps pick up the new indexes
+SCHEMA_VERSION = 2
+SCHEMA_SETTING = "schema_version"
+
+# (collection, keys, options)
+INDEXES = [
+    ("users", [("username", 1)], {"unique": True}),
+    ("farmers", [("name", 1), ("father_name", 1)], {"unique": True}),
+    ("farmers", [("search_keys", 1)], {}),
+    ("settings", [("setting_type", 1)], {}),
+    ("settings", [("setting_type", 1), ("value", 1)], {
+        "unique": True,
+        "partialFilterExpression": {"setting_type": "fat_rate"}
+    }),
+    ("rates", [("effective_date", -1)], {}),
+    ("milk_entries", [("farmer.name", 1), ("collection.date", 1)], {}),
+    ("milk_entries", [("collection.date", 1), ("farmer.village", 1)], {}),
+    ("milk_entries", [("timestamp", -1), ("_id", -1)], {}),
+    ("milk_entries", [("farmer.name", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ("milk_entries", [("collection.date", 1), ("collection.shift", 1), ("timestamp", -1)], {}),
+    ("milk_entries", [("entry_key", 1)], {
+        "unique": True,
+        "partialFilterExpression": {"entry_key": {"$exists": True}}
+    }),
+    ("milk_rollups", [(key, 1) for key in ROLLUP_KEY], {"unique": True}),
+    ("payments", [("farmer_name", 1), ("year", 1), ("month", 1)], {}),
+    ("payments", [("payment_date", -1), ("_id", -1)], {}),
+    ("payments", [("farmer_name", 1), ("payment_date", -1), ("_id", -1)], {}),
+    ("ledger_months", [("farmer", 1), ("year", 1), ("month", 1)], {"unique": True}),
+    ("ledger_balances", [("farmer", 1)], {"unique": True}),
+    ("ledger_balances", [("balance", 1)], {}),
+]
+
+
+# (version, description, function) data changes, run once when upgrading
+# past that version
+DATA_MIGRATIONS = [
+    (2, "backfill farmer search keys",
+     lambda db: refresh_search_keys(db, {"search_keys": {"$exists": False}})),
+]
+
+
+def create_indexes(db) -> list:
+    """Create every declared index, returning `(collection, name, error)` rows
+
+    `error` is None for indexes that exist or were created.
+    """
+    results = []
+    for collection, keys, options in INDEXES:
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        try:
+            name = db[collection].create_index(keys, **options)
+            results.append((collection, name, None))
+        except PyMongoError as e:
+            results.append((collection, name, str(e)))
+    return results
+
+
+def get_schema_version(db) -> int:
+    doc = db.settings.find_one({"setting_type": SCHEMA_SETTING})
+    return int(doc["value"]) if doc else 0
+
+
+def record_schema_version(db, version: int, indexes: list):
+    db.settings.update_one(
+        {"setting_type": SCHEMA_SETTING},
+        {"$set": {"value": version, "indexes": indexes, "applied_at": datetime.now()}},
+        upsert=True
+    )
+
+
+def migrate(db, force: bool = False) -> list:
+    """Bring indexes up to date and record the schema version
+
+    Skips the work when the recorded version is current unless `force` is
+    set. The version is only recorded when every index succeeded, so a
+    failed index is retried on the next run.
+    """
+    current = get_schema_version(db)
+    if not force and current >= SCHEMA_VERSION:
+        return []
+    results = create_indexes(db)
+    for version, description, run in DATA_MIGRATIONS:
+        if current < version or force:
+            try:
+                run(db)
+            except PyMongoError as e:
+                results.append(("-", description, str(e)))
+    failures = [row for row in results if row[2]]
+    for collection, name, error in failures:
+        print(f"Index {collection}.{name} failed: {error}")
+    if not failures:
+        record_schema_version(db, SCHEMA_VERSION, [f"{collection}.{name}" for collection, name, _ in results])
+    if os.environ.get("SCHEMA_EXPLAIN") == "1":
+        print_explain_report(db)
+    return results
+
+
+def app_queries() -> list:
+    """Representative `(label, collection, command)` for each app query"""
+    from db_operations import (
+        monthly_report_pipeline, farmer_statement_pipeline, batch_report_match, RECENT_ENTRY_PROJECTION
+    )
+
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    month_start = today.replace(day=1)
+    farmer = "explain-check"
+    return [
+        ("Login", "users", {"filter": {"username": "admin"}, "limit": 1}),
+        ("Farmer list", "farmers", {"filter": {}, "sort": {"name": 1}}),
+        ("Farmer search", "farmers", {"filter": {"search_keys": {"$regex": "^rm"}}, "sort": {"name": 1}, "limit": 20}),
+        ("Farmer exists", "farmers", {"filter": {"name": farmer, "father_name": farmer}, "limit": 1}),
+        ("Rate table", "settings", {"filter": {"setting_type": {"$in": ["fat_rate", "snf_rate"]}}}),
+        ("Fat rate exists", "settings", {"filter": {"setting_type": "fat_rate", "value": 4.5}, "limit": 1}),
+        ("Current rate", "rates", {"filter": {}, "sort": {"effective_date": -1}, "limit": 1}),
+        ("Monthly report", "milk_rollups", {
+            "pipeline": monthly_report_pipeline(farmer, today.month, today.year)
+        }),
+        ("Farmer statement", "milk_rollups", {
+            "pipeline": farmer_statement_pipeline(
+                farmer, (today.year - 1, today.month), (today.year, today.month)
+            )
+        }),
+        ("Batch report", "milk_entries", {
+            "pipeline": [{"$match": batch_report_match(today.month, today.year, "Chapda")}]
+        }),
+        ("Recent entries", "milk_entries", {
+            "filter": {}, "projection": RECENT_ENTRY_PROJECTION,
+            "sort": {"timestamp": -1, "_id": -1}, "limit": 21
+        }),
+        ("Farmer entries", "milk_entries", {
+            "filter": {"farmer.name": farmer}, "sort": {"timestamp": -1, "_id": -1}, "limit": 100
+        }),
+        ("Shift receipts", "milk_entries", {
+            "filter": {"collection.date": today, "collection.shift": "Morning"},
+            "sort": {"farmer.name": 1}
+        }),
+        ("Dashboard window", "milk_entries", {
+            "pipeline": [{"$match": {"collection.date": {"$gte": today - timedelta(days=29)}}}]
+        }),
+        ("Dashboard new entries", "milk_entries", {
+            "filter": {
+                "timestamp": {"$gte": datetime.now() - timedelta(minutes=5)},
+                "collection.date": {"$gte": today - timedelta(days=29)}
+            }
+        }),
+        ("Rollup cells", "milk_rollups", {
+            "filter": {"farmer": farmer, "year": today.year, "month": today.month},
+            "sort": {"day": 1, "shift": -1}
+        }),
+        ("Farmer month payments", "payments", {
+            "pipeline": [{"$match": {"farmer_name": farmer, "year": today.year, "month": today.month}}]
+        }),
+        ("Payments page", "payments", {
+            "filter": {"payment_date": {"$gte": month_start, "$lt": today + timedelta(days=1)}},
+            "sort": {"payment_date": -1, "_id": -1}, "limit": 26
+        }),
+        ("Farmer payments", "payments", {
+            "filter": {"farmer_name": farmer}, "sort": {"payment_date": -1}
+        }),
+        ("Outstanding balances", "ledger_balances", {
+            "filter": {"balance": {"$gte": 0.01}}, "sort": {"balance": -1}
+        }),
+        ("Farmer ledger", "ledger_months", {
+            "filter": {"farmer": farmer}, "sort": {"year": -1, "month": -1}
+        }),
+    ]
+
+
+def winning_plan_values(explain, key: str) -> list:
+    """Collect every `key` value found under the winning plans of an explain"""
+    values = []
+
+    def walk(node, in_winner):
+        if isinstance(node, dict):
+            if in_winner and isinstance(node.get(key), str):
+                values.append(node[key])
+            for name, value in node.items():
+                if name != "rejectedPlans":
+                    walk(value, in_winner or name == "winningPlan")
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, in_winner)
+
+    walk(explain, False)
+    return values
+
+
+def explain_query(db, collection: str, command: dict) -> dict:
+    if "pipeline" in command:
+        explain = db.command("aggregate", collection, pipeline=command["pipeline"], explain=True)
+    else:
+        explain = db.command("explain", {"find": collection, **command}, verbosity="queryPlanner")
+    stages = winning_plan_values(explain, "stage")
+    return {
+        "stages": stages,
+        "indexes": sorted(set(winning_plan_values(explain, "indexName"))),
+        "collection_scan": "COLLSCAN" in stages
+    }
+
+
+def explain_report(db) -> list:
+    """Explain every app query and report the winning plan for each"""
+    report = []
+    for label, collection, command in app_queries():
+        try:
+            row = explain_query(db, collection, command)
+        except PyMongoError as e:
+            row = {"stages": [], "indexes": [], "collection_scan": None, "error": str(e)}
+        report.append({"query": label, "collection": collection, **row})
+    return report
+
+
+def print_explain_report(db) -> bool:
+    """Print the explain report, returning whether the index checks passed"""
+    from db_operations import check_monthly_report_index
+
+    for row in explain_report(db):
+        if row.get("error"):
+            status = f"ERROR {row['error']}"
+        elif row["collection_scan"]:
+            status = "COLLSCAN"
+        else:
+            status = ", ".join(row["indexes"]) or "no index"
+        print(f"{row['collection']:<16} {row['query']:<24} {status}")
+    try:
+        passed = check_monthly_report_index(db=db)
+    except PyMongoError as e:
+        print(f"Monthly report index check: ERROR {e}")
+        return False
+    print(f"Monthly report index check: {'OK' if passed else 'FAILED, expected IXSCAN and no COLLSCAN'}")
+    return passed
+
+
+def main(argv) -> int:
+    from connection import get_db
+
+    command = argv[1] if len(argv) > 1 else ""
+    try:
+        db = get_db()
+    except Exception as e:
+        print(f"Could not connect to database: {e}")
+        return 1
+    if command == "migrate":
+        results = migrate(db, force=True)
+        failed = sum(1 for row in results if row[2])
+        print(f"Indexes ready: {len(results) - failed}, failed: {failed}, "
+              f"schema version: {get_schema_version(db)}")
+        return 1 if failed else 0
+    if command == "status":
+        print(f"Schema version: {get_schema_version(db)} (code expects {SCHEMA_VERSION})")
+        return 0
+    if command == "explain":
+        return 0 if print_explain_report(db) else 1
+    print("Usage: python migrations.py [migrate|status|explain]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
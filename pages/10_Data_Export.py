@@ -0,0 +1,82 @@
+import os
+import streamlit as st
+from auth_utils import has_permission, can_access_page, is_authenticated
+from database import open_export_cursor
+from utils.export import (
+    ENTRY_COLUMNS, PAYMENT_COLUMNS, EXPORT_MAX_BYTES,
+    export_projection, export_to_tempfile, remove_stale_exports
+)
+from datetime import date
+
+EXPORTS = {
+    "Milk Entries": ("milk_entries", ENTRY_COLUMNS),
+    "Payments": ("payments", PAYMENT_COLUMNS)
+}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+}
+
+# Check access
+if not is_authenticated():
+    st.error("Please login to access this page")
+    st.stop()
+
+if not can_access_page('10_Data_Export') or not has_permission('admin'):
+    st.error("You don't have permission to access this page")
+    st.stop()
+
+st.title("Data Export")
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    export_name = st.selectbox("Data", list(EXPORTS))
+with col2:
+    today = date.today()
+    date_range = st.date_input("Date Range", (today.replace(day=1), today))
+with col3:
+    file_format = st.selectbox("Format", ["csv", "xlsx"], format_func=str.upper)
+
+start_date, end_date = (list(date_range) + [None, None])[:2]
+
+
+# Clear out files from exports that never finished
+remove_stale_exports()
+
+if st.button("Prepare Export", type="primary", disabled=end_date is None):
+    collection, columns = EXPORTS[export_name]
+    cursor = open_export_cursor(collection, start_date, end_date, export_projection(columns))
+    if cursor is None:
+        st.error("Database connection failed")
+    else:
+        path = None
+        try:
+            with st.spinner("Writing export..."):
+                # Rows go from the cursor to disk in chunks, so writing the
+                # file never holds the whole export in memory
+                path, row_count = export_to_tempfile(cursor, columns, file_format)
+            size = os.path.getsize(path)
+            if size > EXPORT_MAX_BYTES:
+                # The download button copies its data into Streamlit's
+                # in-memory media store; there is no file-backed download
+                st.error(
+                    f"The export is {size / 2**20:,.0f} MB, over the {EXPORT_MAX_BYTES / 2**20:,.0f} MB "
+                    "limit. Please choose a shorter date range."
+                )
+            else:
+                # Served once from this run; the file is gone by the next rerun
+                st.success(f"Export ready: {row_count:,} rows")
+                with open(path, "rb") as handle:
+                    st.download_button(
+                        "📥 Download",
+                        data=handle,
+                        file_name=f"{collection}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{file_format}",
+                        mime=MIME_TYPES[file_format]
+                    )
+                st.caption("Prepare the export again to download another copy")
+        except Exception as e:
+            st.error(f"Error exporting data: {e}")
+        finally:
+            cursor.close()
+            if path and os.path.exists(path):
+                os.remove(path)
@@ -1,10 +1,19 @@
 import streamlit as st
-from database import get_all_farmers, save_milk_entry
-from auth_utils import has_permission, can_access_page
+from database import (
+    make_milk_entry, get_shift_receipts, get_shift_farmers, get_recent_entries,
+    update_milk_entry, delete_milk_entry
+)
+from farmer_directory import get_farmer_directory
+from utils.farmer_picker import farmer_picker
+from rate_chart import get_rate_charts
+from utils.receipt import render_receipts
+from journal import queue_milk_entries, save_or_queue_milk_entries, get_journal_status
+from auth_utils import has_permission, can_access_page, is_authenticated
 from datetime import datetime, date
+import pandas as pd
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -14,89 +23,316 @@ if not can_access_page('1_Milk_Entry'):
 
 st.title("🥛 Milk Collection Entry")
 
-# Get all farmers for dropdown
-farmers = get_all_farmers()
-farmer_names = [f"{farmer['name']} - {farmer.get('village', 'N/A')}" for farmer in farmers]
+# Effective-dated fat x SNF rate charts, set on the Rate Management page
+rate_charts = get_rate_charts()
+# Never price at a fallback rate, an entry keeps its amount once saved
+PRICING_UNAVAILABLE = "Rate charts could not be loaded, so entries can't be priced. Please try again shortly."
 
-# Form for milk entry
-with st.form("milk_entry_form"):
+# Shared farmer directory, reloaded only when a farmer is added or changed
+directory = get_farmer_directory()
+farmers = directory.farmers
+
+# Entries are journaled locally first; show what is still waiting to sync
+journal_status = get_journal_status()
+if journal_status["depth"]:
     col1, col2 = st.columns(2)
-    
     with col1:
-        # Farmer selection
-        selected_farmer_full = st.selectbox("Select Farmer", ["Select Farmer"] + farmer_names)
-        
-        # Date selection (default to today)
-        entry_date = st.date_input("Collection Date", date.today())
-        
-        # Shift selection
-        shift = st.selectbox("Shift", ["Morning", "Evening"])
-        
+        st.metric("Entries Waiting to Sync", journal_status["depth"])
     with col2:
-        # Milk details
-        quantity = st.number_input("Quantity (Liters)", min_value=0.0, step=0.1)
-        fat = st.number_input("Fat %", min_value=0.0, max_value=12.0, step=0.1)
-        snf = st.number_input("SNF %", min_value=0.0, max_value=12.0, step=0.1)
+        st.metric("Oldest Waiting", f"{journal_status['oldest_age_seconds'] / 60:.0f} min")
+    if journal_status["flusher_error"]:
+        st.warning(f"Database unreachable, entries are kept locally: {journal_status['flusher_error']}")
+if journal_status["dead"]:
+    st.error(
+        f"{journal_status['dead']} entries were rejected by the database after repeated attempts "
+        "and are kept in the local journal's dead_entries table"
+    )
+
+# One farmer per save, or a whole shift as an editable grid
+entry_mode = st.radio("Entry Mode", ["Single Entry", "Bulk Shift Entry"], horizontal=True)
+
+def reading_errors(rows: pd.DataFrame, labels: pd.Series) -> list:
+    """Check quantity, fat and SNF of every row, returning one message per problem"""
+    errors = []
+    bad_quantity = rows[~(rows["Quantity"].fillna(0) > 0)]
+    bad_fat = rows[(rows["Fat %"].fillna(-1) < 0) | (rows["Fat %"].fillna(-1) > 12)]
+    bad_snf = rows[(rows["SNF %"].fillna(-1) < 0) | (rows["SNF %"].fillna(-1) > 12)]
+    for label in labels[bad_quantity.index]:
+        errors.append(f"{label}: Quantity must be more than 0")
+    for label in labels[bad_fat.index]:
+        errors.append(f"{label}: Fat % must be between 0 and 12")
+    for label in labels[bad_snf.index]:
+        errors.append(f"{label}: SNF % must be between 0 and 12")
+    return errors
+
+def validate_bulk_rows(grid: pd.DataFrame):
+    """Validate all grid rows together, returning filled rows and row errors"""
+    filled = grid[grid["Quantity"].fillna(0) > 0]
+    return filled, reading_errors(filled, filled["Farmer"])
+
+if entry_mode == "Bulk Shift Entry":
+    col1, col2 = st.columns(2)
+    with col1:
+        bulk_date = st.date_input("Collection Date", date.today(), key="bulk_date")
+    with col2:
+        bulk_shift = st.selectbox("Shift", ["Morning", "Evening"], key="bulk_shift")
+    
+    # Print every receipt of the selected shift as one PDF
+    if st.button("🧾 Prepare Shift Receipts"):
+        receipts = get_shift_receipts(bulk_date, bulk_shift)
+        if receipts:
+            st.download_button(
+                label=f"Download {len(receipts)} Receipts",
+                data=render_receipts(receipts),
+                file_name=f"receipts_{bulk_date}_{bulk_shift}.pdf",
+                mime="application/pdf"
+            )
+        else:
+            st.info("No entries saved for this shift yet")
+    
+    # Results of the last save, shown after the grid is cleared
+    for kind, message in st.session_state.pop("bulk_results", []):
+        getattr(st, kind)(message)
+    
+    # Farmers already entered for this shift are marked and skipped on save
+    entered = get_shift_farmers(bulk_date, bulk_shift)
+    
+    with st.form("bulk_entry_form"):
+        grid = pd.DataFrame({
+            "Farmer": [farmer['name'] for farmer in farmers],
+            "Village": [farmer.get('village', 'N/A') for farmer in farmers],
+            "Entered": [farmer['name'] in entered for farmer in farmers],
+            "Quantity": 0.0,
+            "Fat %": 0.0,
+            "SNF %": 0.0
+        })
+        edited = st.data_editor(
+            grid,
+            column_config={
+                "Quantity": st.column_config.NumberColumn("Quantity (Liters)", min_value=0.0, step=0.1),
+                "Fat %": st.column_config.NumberColumn("Fat %", min_value=0.0, max_value=12.0, step=0.1),
+                "SNF %": st.column_config.NumberColumn("SNF %", min_value=0.0, max_value=12.0, step=0.1)
+            },
+            disabled=["Farmer", "Village", "Entered"],
+            hide_index=True,
+            use_container_width=True,
+            # A new key after each save starts the next shift from an empty grid
+            key=f"bulk_grid_{bulk_date}_{bulk_shift}_{st.session_state.get('bulk_saves', 0)}"
+        )
+        bulk_submitted = st.form_submit_button("Save Shift")
+    
+    if bulk_submitted:
+        # Rows already entered are skipped before validation so they can't block the save
+        skipped = edited[edited["Entered"] & (edited["Quantity"].fillna(0) > 0)]
+        filled, errors = validate_bulk_rows(edited[~edited["Entered"]])
+        for farmer_name in skipped["Farmer"]:
+            st.warning(f"{farmer_name} already has a {bulk_shift} entry for {bulk_date:%d-%m-%Y}, skipped")
+        if rate_charts is None:
+            st.error(PRICING_UNAVAILABLE)
+        elif filled.empty:
+            st.error("Please enter quantity for at least one farmer without an entry")
+        elif errors:
+            for error in errors:
+                st.error(error)
+        else:
+            # Price every row in one chart lookup, then write them all in one insert_many
+            rates, amounts = rate_charts.price_batch(
+                bulk_date, filled["Fat %"], filled["SNF %"], filled["Quantity"]
+            )
+            filled = filled.assign(Rate=rates, Amount=amounts)
+            entries = [
+                make_milk_entry(
+                    farmers[index], float(row["Quantity"]), float(row["Fat %"]),
+                    float(row["SNF %"]), float(row["Rate"]), bulk_date, bulk_shift
+                )
+                for index, row in filled.iterrows()
+            ]
+            try:
+                saved, failed, queued = save_or_queue_milk_entries(entries)
+                results = []
+                if saved:
+                    results.append(("success",
+                        f"Saved {saved} entries for {bulk_shift} shift, "
+                        f"total {filled['Quantity'].sum():.1f} L, ₹{filled['Amount'].sum():.2f}"
+                    ))
+                if queued:
+                    results.append(("warning", f"Database unreachable, {queued} entries saved locally and will sync automatically"))
+                for row_index, message in failed.items():
+                    results.append(("error", f"{entries[row_index]['farmer']['name']}: {message}"))
+                if failed:
+                    # Keep the grid so rejected rows can be corrected
+                    for kind, message in results:
+                        getattr(st, kind)(message)
+                else:
+                    st.session_state.bulk_results = results
+                    st.session_state.bulk_saves = st.session_state.get('bulk_saves', 0) + 1
+                    st.rerun()
+            except Exception as e:
+                st.error(f"Error saving milk entries: {e}")
+
+else:
+    # Farmer search sits outside the form so matches update as you search
+    farmer = farmer_picker("Select Farmer", key="entry_farmer")
+
+    # Form for milk entry
+    with st.form("milk_entry_form"):
+        col1, col2 = st.columns(2)
+    
+        with col1:
+            # Date selection (default to today)
+            entry_date = st.date_input("Collection Date", date.today())
         
-        # Calculate rate based on fat content
-        rate_per_liter = 39.0  # Default rate, you can modify this based on your rate card
-        total_amount = quantity * rate_per_liter
+            # Shift selection
+            shift = st.selectbox("Shift", ["Morning", "Evening"])
         
-        st.write(f"Rate per liter: ₹{rate_per_liter:.2f}")
-        st.write(f"Total Amount: ₹{total_amount:.2f}")
+        with col2:
+            # Milk details
+            quantity = st.number_input("Quantity (Liters)", min_value=0.0, step=0.1)
+            fat = st.number_input("Fat %", min_value=0.0, max_value=12.0, step=0.1)
+            snf = st.number_input("SNF %", min_value=0.0, max_value=12.0, step=0.1)
+        
+            # Rate from the fat x SNF chart in force on the collection date
+            if rate_charts is not None:
+                rate_per_liter, total_amount = rate_charts.price(entry_date, fat, snf, quantity)
+                st.write(f"Rate per liter: ₹{rate_per_liter:.2f}")
+                st.write(f"Total Amount: ₹{total_amount:.2f}")
     
-    # Submit button
-    submitted = st.form_submit_button("Save Entry")
+        # Submit button
+        submitted = st.form_submit_button("Save Entry")
     
-    if submitted:
-        if selected_farmer_full == "Select Farmer":
-            st.error("Please select a farmer")
-        elif quantity <= 0:
-            st.error("Please enter valid quantity")
-        else:
-            # Extract farmer name and find farmer details
-            farmer_name = selected_farmer_full.split(" - ")[0]
-            farmer = next((f for f in farmers if f['name'] == farmer_name), None)
-            
-            if farmer:
+        if submitted:
+            if rate_charts is None:
+                st.error(PRICING_UNAVAILABLE)
+            elif farmer is None:
+                st.error("Please select a farmer")
+            elif quantity <= 0:
+                st.error("Please enter valid quantity")
+            else:
                 # Prepare entry data
-                entry_data = {
-                    "farmer": {
-                        "name": farmer['name'],
-                        "father_name": farmer.get('father_name', ''),
-                        "village": farmer.get('village', '')
-                    },
-                    "milk": {
-                        "quantity": quantity,
-                        "fat": fat,
-                        "snf": snf,
-                        "rate_per_liter": rate_per_liter,
-                        "total_amount": total_amount
-                    },
-                    "collection": {
-                        "date": datetime.combine(entry_date, datetime.min.time()),
-                        "shift": shift
-                    },
-                    "timestamp": datetime.now()
-                }
-                
-                # Save to database
-                if save_milk_entry(entry_data):
+                entry_data = make_milk_entry(
+                    farmer, quantity, fat, snf, rate_per_liter, entry_date, shift
+                )
+            
+                # Save to the local journal, the flusher writes it to the database
+                try:
+                    queue_milk_entries([entry_data])
                     st.success(f"Successfully saved milk entry for {farmer['name']}")
                     # Clear form (rerun the app)
                     st.rerun()
-                else:
-                    st.error("Failed to save milk entry")
-            else:
-                st.error("Farmer not found")
+                except Exception as e:
+                    st.error(f"Failed to save milk entry: {e}")
 
 # Show recent entries
 st.markdown("---")
 st.header("Recent Entries")
 
+RECENT_PAGE_SIZE = 20
+
+# Feed filters
+col1, col2, col3 = st.columns(3)
+with col1:
+    feed_shift = st.selectbox("Shift", ["All Shifts", "Morning", "Evening"], key="feed_shift")
+with col2:
+    feed_farmer = farmer_picker("Farmer", key="feed_farmer", none_label="All Farmers")
+with col3:
+    feed_filter_date = st.checkbox("Filter by date", key="feed_filter_date")
+    feed_date = st.date_input("Date", date.today(), key="feed_date", disabled=not feed_filter_date)
+
+feed_filters = {
+    "shift": None if feed_shift == "All Shifts" else feed_shift,
+    "entry_date": feed_date if feed_filter_date else None,
+    "farmer_name": None if feed_farmer is None else feed_farmer['name']
+}
+
+# Start from the newest entries whenever the filters change
+if st.session_state.get("feed_filters") != feed_filters:
+    st.session_state.feed_filters = feed_filters
+    st.session_state.feed_cursors = [None]
+
 # Add a refresh button
 if st.button("🔄 Refresh"):
+    st.session_state.feed_cursors = [None]
     st.rerun()
 
-# Display recent entries in a table
-# You can add this functionality later when needed
+feed_cursors = st.session_state.feed_cursors
+recent_entries, next_cursor = get_recent_entries(
+    **feed_filters, after=feed_cursors[-1], limit=RECENT_PAGE_SIZE
+)
+
+if recent_entries:
+    can_delete = has_permission('admin')
+    feed = pd.DataFrame({
+        "id": [str(entry['_id']) for entry in recent_entries],
+        "Date": [entry['collection']['date'].strftime('%d-%m-%Y') for entry in recent_entries],
+        "Shift": [entry['collection']['shift'] for entry in recent_entries],
+        "Farmer": [entry['farmer']['name'] for entry in recent_entries],
+        "Quantity": [float(entry['milk']['quantity']) for entry in recent_entries],
+        "Fat %": [float(entry['milk']['fat']) for entry in recent_entries],
+        "SNF %": [float(entry['milk'].get('snf', 0.0)) for entry in recent_entries],
+        "Amount": [float(entry['milk']['total_amount']) for entry in recent_entries],
+        "Delete": False
+    })
+    edited_feed = st.data_editor(
+        feed,
+        column_config={
+            "id": None,
+            "Quantity": st.column_config.NumberColumn("Quantity (Liters)", min_value=0.0, step=0.1),
+            "Fat %": st.column_config.NumberColumn("Fat %", min_value=0.0, max_value=12.0, step=0.1),
+            "SNF %": st.column_config.NumberColumn("SNF %", min_value=0.0, max_value=12.0, step=0.1),
+            "Amount": st.column_config.NumberColumn("Amount (₹)", format="%.2f"),
+            "Delete": st.column_config.CheckboxColumn("Delete", disabled=not can_delete)
+        },
+        disabled=["Date", "Shift", "Farmer", "Amount"],
+        hide_index=True,
+        use_container_width=True,
+        key=f"feed_editor_{len(feed_cursors)}"
+    )
+    
+    if st.button("💾 Save Changes"):
+        reading_columns = ["Quantity", "Fat %", "SNF %"]
+        edited_rows = edited_feed[
+            ~edited_feed["Delete"] & (edited_feed[reading_columns] != feed[reading_columns]).any(axis=1)
+        ]
+        # Check every edited row before writing any of them
+        errors = reading_errors(
+            edited_rows, edited_rows["Farmer"] + " (" + edited_rows["Date"] + " " + edited_rows["Shift"] + ")"
+        )
+        if not edited_rows.empty and rate_charts is None:
+            errors.append(PRICING_UNAVAILABLE)
+        for error in errors:
+            st.error(error)
+        if errors:
+            st.stop()
+        changed = 0
+        for index, entry in enumerate(recent_entries):
+            row = edited_feed.iloc[index]
+            if row["Delete"]:
+                changed += delete_milk_entry(entry['_id'])
+            elif index in edited_rows.index:
+                # Re-price from the chart in force on the collection date
+                rate = rate_charts.price(
+                    entry['collection']['date'], float(row["Fat %"]), float(row["SNF %"])
+                )[0]
+                changed += update_milk_entry(entry['_id'], {
+                    "milk.quantity": float(row["Quantity"]),
+                    "milk.fat": float(row["Fat %"]),
+                    "milk.snf": float(row["SNF %"]),
+                    "milk.rate_per_liter": rate,
+                    "milk.total_amount": float(row["Quantity"]) * rate
+                })
+        st.success(f"Updated {changed} entries")
+        st.rerun()
+else:
+    st.info("No entries found")
+
+col1, col2, col3 = st.columns([1, 2, 1])
+with col1:
+    if st.button("⬅ Newer", disabled=len(feed_cursors) == 1, use_container_width=True):
+        feed_cursors.pop()
+        st.rerun()
+with col2:
+    st.caption(f"Page {len(feed_cursors)}")
+with col3:
+    if st.button("Older ➡", disabled=next_cursor is None, use_container_width=True):
+        feed_cursors.append(next_cursor)
+        st.rerun()
@@ -0,0 +1,85 @@
+import streamlit as st
+from database import get_daily_totals
+from auth_utils import can_access_page, is_authenticated
+from datetime import datetime
+import pandas as pd
+
+# Check access
+if not is_authenticated():
+    st.error("Please login to access this page")
+    st.stop()
+
+if not can_access_page('2_Daily_Dashboard'):
+    st.error("You don't have permission to access this page")
+    st.stop()
+
+st.title("Daily Dashboard")
+
+if st.button("🔄 Refresh"):
+    st.rerun()
+
+# Totals are refreshed from new entries at most every 30 seconds
+rows = get_daily_totals()
+if not rows:
+    st.info("No milk collected in the last 30 days")
+    st.stop()
+
+totals = pd.DataFrame(rows)
+totals['fat_liters'] = totals['fat'] * totals['liters']
+
+
+def summarize(frame: pd.DataFrame, by: list) -> pd.DataFrame:
+    """Sum liters and amount and take the liter-weighted fat per group"""
+    grouped = frame.groupby(by, as_index=False)[['liters', 'fat_liters', 'amount', 'entries']].sum()
+    grouped['fat'] = (grouped['fat_liters'] / grouped['liters']).where(grouped['liters'] > 0, 0.0)
+    return grouped
+
+
+def village_table(frame: pd.DataFrame) -> pd.DataFrame:
+    """One row per village plus an overall row, with morning and evening liters"""
+    shifts = summarize(frame, ['village', 'shift']).pivot(index='village', columns='shift', values='liters')
+    villages = summarize(frame, ['village']).set_index('village')
+    overall = summarize(frame.assign(village='All Villages'), ['village']).set_index('village')
+    overall_shifts = summarize(frame, ['shift']).set_index('shift')['liters']
+    table = pd.concat([villages, overall])
+    for shift in ('morning', 'evening'):
+        by_village = shifts[shift] if shift in shifts else pd.Series(dtype=float)
+        table[shift] = by_village.reindex(table.index).fillna(0.0)
+        table.loc['All Villages', shift] = overall_shifts.get(shift, 0.0)
+    return pd.DataFrame({
+        "Village": table.index,
+        "Morning (L)": table['morning'].round(1).to_numpy(),
+        "Evening (L)": table['evening'].round(1).to_numpy(),
+        "Total (L)": table['liters'].round(1).to_numpy(),
+        "Avg Fat": table['fat'].round(1).to_numpy(),
+        "Amount": [f"₹{amount:,.0f}" for amount in table['amount']],
+        "Entries": table['entries'].to_numpy()
+    })
+
+
+# Today
+today = datetime.combine(datetime.now().date(), datetime.min.time())
+today_rows = totals[totals['date'] == today]
+st.subheader(f"Today ({today:%d-%m-%Y})")
+if today_rows.empty:
+    st.info("No milk collected today yet")
+else:
+    overall = summarize(today_rows.assign(all=1), ['all']).iloc[0]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Morning", f"{today_rows.loc[today_rows['shift'] == 'morning', 'liters'].sum():.1f} L")
+    with col2:
+        st.metric("Evening", f"{today_rows.loc[today_rows['shift'] == 'evening', 'liters'].sum():.1f} L")
+    with col3:
+        st.metric("Average Fat", f"{overall['fat']:.1f}%")
+    with col4:
+        st.metric("Amount", f"₹{overall['amount']:,.0f}")
+    st.dataframe(village_table(today_rows), hide_index=True, use_container_width=True)
+
+# Last 30 days
+st.subheader("Last 30 Days")
+st.dataframe(village_table(totals), hide_index=True, use_container_width=True)
+
+daily = summarize(totals, ['date', 'shift']).pivot(index='date', columns='shift', values='liters').fillna(0.0)
+daily = daily.rename(columns=str.title)
+st.bar_chart(daily)
@@ -1,12 +1,18 @@
 import streamlit as st
-from database import get_all_farmers, get_monthly_report
-from auth_utils import has_permission, can_access_page
+from database import (
+    get_all_farmers, get_monthly_report, get_all_villages,
+    count_report_farmers, iter_batch_report_cells, get_farmer_statement
+)
+from auth_utils import has_permission, can_access_page, is_authenticated
+from utils.register import build_register, day_columns
+from utils.batch_report import iter_registers, registers_to_workbook, registers_to_zip
+from utils.farmer_picker import farmer_picker
 from datetime import datetime, timedelta
 import pandas as pd
 import calendar
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -26,86 +32,87 @@ if not farmers:
 # Filters in main page
 st.subheader("Select Filters")
 
+# Single farmer register, every farmer (optionally one village) at once,
+# or one farmer's statement over a range of months
+report_mode = st.radio("Report Type", ["Single Farmer", "All Farmers", "Farmer Statement"], horizontal=True)
+
 # Create three columns for filters
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    # Farmer selection
-    farmer_names = [farmer['name'] for farmer in farmers]
-    selected_farmer = st.selectbox("Select Farmer", farmer_names)
+    if report_mode in ("Single Farmer", "Farmer Statement"):
+        # Farmer selection
+        farmer = farmer_picker("Select Farmer", key="report_farmer")
+        selected_farmer = farmer['name'] if farmer else None
+    else:
+        # Village selection, "All Villages" means no village filter
+        villages = ["All Villages"] + get_all_villages()[1:]
+        selected_village = st.selectbox("Select Village", villages)
+        export_format = st.radio("Format", ["Excel workbook", "ZIP of CSVs"], horizontal=True)
 
-with col2:
-    # Month selection
-    months = {
-        1: "January", 2: "February", 3: "March", 4: "April",
-        5: "May", 6: "June", 7: "July", 8: "August",
-        9: "September", 10: "October", 11: "November", 12: "December"
-    }
-    current_month = datetime.now().month
-    selected_month = st.selectbox("Select Month", 
-        list(months.values()), 
-        index=current_month-1
-    )
-
-with col3:
-    # Year selection
-    current_year = datetime.now().year
-    selected_year = st.selectbox("Select Year", 
-        range(current_year-5, current_year+1), 
-        index=5
-    )
-
-# Convert month name to number
-month_num = list(months.keys())[list(months.values()).index(selected_month)]
+# Month selection
+months = {
+    1: "January", 2: "February", 3: "March", 4: "April",
+    5: "May", 6: "June", 7: "July", 8: "August",
+    9: "September", 10: "October", 11: "November", 12: "December"
+}
+current_month = datetime.now().month
+current_year = datetime.now().year
+
+if report_mode == "Farmer Statement":
+    # Any range of months over the last five years
+    month_options = [
+        (year, month) for year in range(current_year - 5, current_year + 1)
+        for month in range(1, 13)
+        if (year, month) <= (current_year, current_month)
+    ]
+    with col2:
+        start_month = st.selectbox(
+            "From", month_options, index=max(len(month_options) - 12, 0),
+            format_func=lambda option: f"{months[option[1]][:3]} {option[0]}"
+        )
+    with col3:
+        end_month = st.selectbox(
+            "To", month_options, index=len(month_options) - 1,
+            format_func=lambda option: f"{months[option[1]][:3]} {option[0]}"
+        )
+else:
+    with col2:
+        selected_month = st.selectbox("Select Month", 
+            list(months.values()), 
+            index=current_month-1
+        )
+
+    with col3:
+        # Year selection
+        selected_year = st.selectbox("Select Year", 
+            range(current_year-5, current_year+1), 
+            index=5
+        )
+
+    # Convert month name to number
+    month_num = list(months.keys())[list(months.values()).index(selected_month)]
 
 # Generate Report button - centered
 col1, col2, col3 = st.columns([1, 1, 1])
 with col2:
     generate_report = st.button("Generate Report", use_container_width=True)
 
-if generate_report:
+if generate_report and report_mode != "All Farmers" and selected_farmer is None:
+    st.error("Please select a farmer")
+    st.stop()
+
+if generate_report and report_mode == "Single Farmer":
     with st.spinner('Generating report...'):
-        entries = get_monthly_report(selected_farmer, month_num, selected_year)
+        entries = get_monthly_report(selected_farmer, month_num, selected_year, columnar=True)
         
-        if entries:
+        if not entries.empty:
             try:
-                # Get number of days in the selected month
-                num_days = calendar.monthrange(selected_year, month_num)[1]
-                
-                # Initialize data dictionary
-                data = {
-                    'Shift': ['M', 'E']  # Morning and Evening rows
-                }
-                
-                # Initialize totals
-                total_liters = 0
-                total_fat = 0
-                total_amount = 0
-                day_counts = 0
-                
-                # Process each day
-                for day in range(1, num_days + 1):
-                    date_str = f"{day:02d}"
-                    data[date_str] = ['', '']
-                    
-                    # Find entries for this date
-                    day_date = datetime(selected_year, month_num, day).date()
-                    for entry in entries:
-                        if entry['date'].date() == day_date:
-                            shift_idx = 0 if entry['shift'] == 'morning' else 1
-                            if entry['liters'] > 0:
-                                data[date_str][shift_idx] = f"{entry['liters']:.1f}({entry['fat']:.1f})"
-                                total_liters += entry['liters']
-                                total_fat += entry['fat']
-                                total_amount += entry['amount']
-                                day_counts += 1
-                
-                # Add totals
-                avg_fat = total_fat / day_counts if day_counts > 0 else 0
-                data['Total'] = [f"{total_liters:.1f}({avg_fat:.1f})", ""]
-                
-                # Create DataFrame
-                df = pd.DataFrame(data)
+                # Build the register grid and totals in one vectorized pass
+                df, totals = build_register(entries, selected_year, month_num)
+                total_liters = totals['total_liters']
+                avg_fat = totals['avg_fat']
+                total_amount = totals['total_amount']
                 
                 # Display summary
                 st.subheader("Monthly Summary")
@@ -128,10 +135,10 @@ if generate_report:
                             width="small",
                         ),
                         **{
-                            str(i): st.column_config.TextColumn(
-                                str(i),
+                            day: st.column_config.TextColumn(
+                                day,
                                 width="small",
-                            ) for i in range(1, num_days + 1)
+                            ) for day in day_columns(selected_year, month_num)
                         },
                         "Total": st.column_config.TextColumn(
                             "Total",
@@ -156,6 +163,101 @@ if generate_report:
         else:
             st.info(f"No entries found for {selected_farmer} in {selected_month} {selected_year}")
 
+elif report_mode == "Farmer Statement":
+    # Keep the statement on screen while months are expanded
+    if generate_report:
+        st.session_state.statement_request = (selected_farmer, start_month, end_month)
+    if st.session_state.get("statement_request") == (selected_farmer, start_month, end_month):
+        if start_month > end_month:
+            st.error("'From' month must not be after 'To' month")
+            st.stop()
+        statement = get_farmer_statement(selected_farmer, start_month, end_month)
+        
+        if statement:
+            col1, col2, col3 = st.columns(3)
+            total_liters = sum(row['liters'] for row in statement)
+            with col1:
+                st.metric("Total Liters", f"{total_liters:.1f} L")
+            with col2:
+                fat_liters = sum(row['avg_fat'] * row['liters'] for row in statement)
+                st.metric("Average Fat", f"{fat_liters / total_liters if total_liters else 0:.1f}%")
+            with col3:
+                st.metric("Total Amount", f"₹{statement[-1]['running_amount']:.0f}")
+            
+            def change(value, digits=1):
+                return "-" if value is None else f"{value:+.{digits}f}"
+            
+            st.subheader("Monthly Statement")
+            st.dataframe(
+                pd.DataFrame([{
+                    "Month": f"{months[row['month']][:3]} {row['year']}",
+                    "Days": row['days'],
+                    "Liters": round(row['liters'], 1),
+                    "Change (L)": change(row['liters_change']),
+                    "Avg Fat": round(row['avg_fat'], 1),
+                    "Change (Fat)": change(row['fat_change']),
+                    "Amount": f"₹{row['amount']:,.0f}",
+                    "Change (₹)": change(row['amount_change'], 0),
+                    "Running Total": f"₹{row['running_amount']:,.0f}"
+                } for row in statement]),
+                hide_index=True,
+                use_container_width=True
+            )
+            
+            # Daily registers are only queried for months the user opens
+            st.subheader("Daily Details")
+            for row in statement:
+                label = f"{months[row['month']]} {row['year']}"
+                with st.expander(label):
+                    if st.toggle("Show daily register", key=f"statement_days_{row['year']}_{row['month']}"):
+                        cells = get_monthly_report(selected_farmer, row['month'], row['year'], columnar=True)
+                        register, _ = build_register(cells, row['year'], row['month'])
+                        st.dataframe(register, hide_index=True)
+        else:
+            st.info(f"No entries found for {selected_farmer} in the selected months")
+
+elif generate_report:
+    village = None if selected_village == "All Villages" else selected_village
+    farmer_count = count_report_farmers(month_num, selected_year, village)
+    
+    if farmer_count:
+        progress_bar = st.progress(0.0, text="Building registers...")
+        
+        def update_progress(done, farmer):
+            progress_bar.progress(
+                min(done / farmer_count, 1.0),
+                text=f"Built {done} of {farmer_count} registers ({farmer})"
+            )
+        
+        try:
+            # One aggregation for the whole month, streamed one farmer at a time
+            cells = iter_batch_report_cells(month_num, selected_year, village)
+            registers = iter_registers(cells, selected_year, month_num)
+            scope = village or "all"
+            
+            if export_format == "Excel workbook":
+                data = registers_to_workbook(registers, progress=update_progress)
+                file_name = f"milk_report_{scope}_{selected_month}_{selected_year}.xlsx"
+                mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            else:
+                data = registers_to_zip(registers, progress=update_progress)
+                file_name = f"milk_report_{scope}_{selected_month}_{selected_year}.zip"
+                mime = "application/zip"
+            
+            progress_bar.progress(1.0, text=f"Built {farmer_count} registers")
+            st.download_button(
+                label="Download Reports",
+                data=data,
+                file_name=file_name,
+                mime=mime
+            )
+        
+        except Exception as e:
+            st.error(f"Error generating batch report: {str(e)}")
+    
+    else:
+        st.info(f"No entries found for {selected_month} {selected_year}")
+
 # Add these optimizations at the top of the file
 @st.cache_data(ttl=3600)  # Cache for 1 hour
 def get_month_days(year: int, month: int):
@@ -1,9 +1,14 @@
 import streamlit as st
-from database import get_payment_details
-from auth_utils import has_permission, can_access_page
+from database import get_payments_page, get_payment_summary, get_all_villages
+from auth_utils import has_permission, can_access_page, is_authenticated
+from farmer_directory import get_farmer_directory
+from datetime import date
+import pandas as pd
+
+PAGE_SIZE = 25
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -11,4 +16,88 @@ if not can_access_page('4_Payment_Details'):
     st.error("You don't have permission to access this page")
     st.stop()
 
-# Rest of your Payment Details page code... 
\ No newline at end of file
+st.title("Payment Details")
+
+# Filters
+st.subheader("Select Filters")
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    farmer_names = ["All Farmers"] + [farmer['name'] for farmer in get_farmer_directory()]
+    selected_farmer = st.selectbox("Farmer", farmer_names)
+
+with col2:
+    villages = ["All Villages"] + get_all_villages()[1:]
+    selected_village = st.selectbox("Village", villages, disabled=selected_farmer != "All Farmers")
+
+with col3:
+    today = date.today()
+    date_range = st.date_input("Date Range", (today.replace(day=1), today))
+
+start_date, end_date = (list(date_range) + [None, None])[:2]
+filters = {
+    "farmer_name": None if selected_farmer == "All Farmers" else selected_farmer,
+    "village": None if selected_village == "All Villages" else selected_village,
+    "start_date": start_date,
+    "end_date": end_date
+}
+
+# Start from the first page whenever the filters change
+if st.session_state.get("payment_filters") != filters:
+    st.session_state.payment_filters = filters
+    st.session_state.payment_cursors = [None]
+
+# Totals for the whole filtered range
+summary = get_payment_summary(filters)
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("Total Paid", f"₹{summary['overall']['total']:,.2f}")
+with col2:
+    st.metric("Payments", summary['overall']['count'])
+with col3:
+    st.metric("Farmers Paid", summary['overall']['farmers'])
+
+if summary['by_month']:
+    st.subheader("Monthly Totals")
+    st.dataframe(
+        pd.DataFrame([{
+            "Month/Year": f"{row['_id']['month']}/{row['_id']['year']}",
+            "Payments": row['count'],
+            "Milk Amount": f"₹{row['earned']:,.2f}",
+            "Amount Paid": f"₹{row['total']:,.2f}"
+        } for row in summary['by_month']]),
+        hide_index=True,
+        use_container_width=True
+    )
+
+# One page of payments, fetched by keyset cursor
+st.subheader("Payments")
+cursors = st.session_state.payment_cursors
+payments, next_cursor = get_payments_page(filters, after=cursors[-1], limit=PAGE_SIZE)
+
+if payments:
+    st.dataframe(
+        pd.DataFrame([{
+            "Date": payment['payment_date'].strftime('%d-%m-%Y'),
+            "Farmer": payment['farmer_name'],
+            "Amount": f"₹{float(payment['amount_paid']):,.2f}",
+            "Month/Year": f"{payment['month']}/{payment['year']}",
+            "Notes": payment.get('notes') or '-'
+        } for payment in payments]),
+        hide_index=True,
+        use_container_width=True
+    )
+else:
+    st.info("No payments found for the selected filters")
+
+col1, col2, col3 = st.columns([1, 2, 1])
+with col1:
+    if st.button("⬅ Previous", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+with col2:
+    st.caption(f"Page {len(cursors)}")
+with col3:
+    if st.button("Next ➡", disabled=next_cursor is None, use_container_width=True):
+        cursors.append(next_cursor)
+        st.rerun()
@@ -1,11 +1,13 @@
 import streamlit as st
 from database import init_connection
-from auth_utils import has_permission, can_access_page
+from auth_utils import has_permission, can_access_page, is_authenticated
+from farmer_directory import get_farmer_directory, bump_farmer_version
+from farmer_search import with_search_keys
 from datetime import datetime
 import pytz
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -54,7 +56,8 @@ with st.form(key="add_farmer_form", clear_on_submit=True):
                         "created_at": datetime.now(pytz.timezone('Asia/Kolkata'))
                     }
                     
-                    result = db.farmers.insert_one(new_farmer)
+                    result = db.farmers.insert_one(with_search_keys(new_farmer))
+                    bump_farmer_version()
                     if result.inserted_id:
                         st.success(f"Farmer {name} added successfully!")
                     else:
@@ -68,7 +71,7 @@ with st.form(key="add_farmer_form", clear_on_submit=True):
 # Display Existing Farmers
 st.subheader("Existing Farmers")
 try:
-    farmers = list(db.farmers.find().sort("name", 1))
+    farmers = get_farmer_directory().farmers
     
     if farmers:
         # Create a dataframe for display
@@ -1,6 +1,8 @@
 import streamlit as st
-from database import init_connection
-from auth_utils import has_permission, can_access_page
+from database import init_connection, save_payment, get_outstanding_balances
+from auth_utils import has_permission, can_access_page, is_authenticated
+from tagged_cache import cached, invalidate
+from utils.farmer_picker import farmer_picker
 from datetime import datetime
 import pytz
 import pandas as pd
@@ -10,13 +12,8 @@ import pandas as pd
 def get_database():
     return init_connection()
 
-# Cache farmer list
-@st.cache_data(ttl=300)
-def get_farmers(_db):
-    return list(_db.farmers.find({}, {"name": 1, "father_name": 1, "_id": 0}))
-
 # Cache recent payments
-@st.cache_data(ttl=60)
+@cached(["payments"], ttl=60)
 def get_recent_payments(_db):
     try:
         payments = list(_db.payments.find().sort("payment_date", -1).limit(10))
@@ -26,6 +23,7 @@ def get_recent_payments(_db):
         return []
 
 # Get total payments for farmer
+@cached(["payments:{farmer_name}"], ttl=300)
 def get_farmer_total(_db, farmer_name, year, month):
     try:
         total = _db.payments.aggregate([
@@ -50,7 +48,7 @@ def get_farmer_total(_db, farmer_name, year, month):
         return 0
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -66,12 +64,11 @@ if db is None:
     st.error("Database connection failed")
     st.stop()
 
+# Farmer search sits outside the form so matches update as you search
+selected_farmer = farmer_picker("Select Farmer", key="payment_farmer")
+
 # Create form for payment entry
 with st.form("payment_entry_form", clear_on_submit=True):
-    farmers = get_farmers(db)
-    farmer_options = [f"{farmer['name']} ({farmer['father_name']})" for farmer in farmers]
-    
-    selected_farmer = st.selectbox("Select Farmer", options=farmer_options)
     amount = st.number_input("Payment Amount (₹)", min_value=0.0, step=100.0)
     payment_date = st.date_input("Payment Date")
     notes = st.text_area("Notes", height=100)
@@ -84,7 +81,7 @@ with st.form("payment_entry_form", clear_on_submit=True):
                 st.error("Please fill all required fields")
                 st.stop()
             
-            farmer_name = selected_farmer.split(" (")[0]
+            farmer_name = selected_farmer['name']
             
             payment = {
                 "farmer_name": farmer_name,
@@ -95,10 +92,9 @@ with st.form("payment_entry_form", clear_on_submit=True):
                 "notes": notes
             }
             
-            result = db.payments.insert_one(payment)
-            if result.inserted_id:
+            # save_payment updates the ledger and invalidates payment queries
+            if save_payment(payment):
                 st.success(f"Payment of ₹{amount:.2f} recorded for {farmer_name}")
-                st.cache_data.clear()
                 st.rerun()
             else:
                 st.error("Failed to record payment")
@@ -145,3 +141,29 @@ try:
         
 except Exception as e:
     st.error(f"Error loading payment history: {str(e)}") 
+
+# Display what is still owed to each farmer, from the running ledger
+st.subheader("Outstanding Balances")
+try:
+    balances = get_outstanding_balances()
+    
+    if balances:
+        # Balances written before both totals were set on insert may lack one
+        df = pd.DataFrame(balances).reindex(columns=['farmer', 'earned', 'paid', 'balance'])
+        df[['earned', 'paid', 'balance']] = df[['earned', 'paid', 'balance']].fillna(0.0)
+        st.dataframe(
+            pd.DataFrame({
+                'Farmer': df['farmer'],
+                'Earned': df['earned'].apply(lambda x: f"₹{float(x):,.2f}"),
+                'Paid': df['paid'].apply(lambda x: f"₹{float(x):,.2f}"),
+                'Balance': df['balance'].apply(lambda x: f"₹{float(x):,.2f}")
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+        st.metric("Total Outstanding", f"₹{df['balance'].sum():,.2f}")
+    else:
+        st.info("No outstanding balances")
+        
+except Exception as e:
+    st.error(f"Error loading outstanding balances: {str(e)}")
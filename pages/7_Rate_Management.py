@@ -1,7 +1,14 @@
 import streamlit as st
 from database import init_connection
-from auth_utils import has_permission, can_access_page
-from datetime import datetime
+from auth_utils import has_permission, can_access_page, is_authenticated
+from rates import get_rate_table, invalidate_rate_table
+from rate_chart import (
+    RateChart, get_rate_charts, save_rate_chart, grid_values,
+    DEFAULT_RATE_PER_LITER, DEFAULT_FAT_RANGE, DEFAULT_SNF_RANGE, DEFAULT_STEP
+)
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
 import pytz
 
 # Cache database connection
@@ -9,12 +16,12 @@ import pytz
 def get_database():
     return init_connection()
 
-# Cache rate query
-@st.cache_data(ttl=60)
-def get_current_rates(_db):
+# Read current rates from the shared in-memory rate table
+def get_current_rates():
     try:
-        fat_rate = _db.settings.find_one({"setting_type": "fat_rate"})
-        snf_rate = _db.settings.find_one({"setting_type": "snf_rate"})
+        rate_table = get_rate_table()
+        fat_rate = rate_table.current_rate("fat_rate")
+        snf_rate = rate_table.current_rate("snf_rate")
         return {
             "fat_rate": fat_rate.get('value', 0) if fat_rate else 0,
             "snf_rate": snf_rate.get('value', 0) if snf_rate else 0,
@@ -25,7 +32,7 @@ def get_current_rates(_db):
         return None
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -42,7 +49,7 @@ if db is None:
     st.stop()
 
 # Display current rates
-current_rates = get_current_rates(db)
+current_rates = get_current_rates()
 if current_rates:
     st.info(f"Current Rates (Last updated: {current_rates['updated_at'].strftime('%d-%m-%Y %H:%M') if current_rates['updated_at'] else 'Never'})")
     col1, col2 = st.columns(2)
@@ -99,9 +106,11 @@ with st.form("rate_entry_form", clear_on_submit=True):
                 upsert=True
             )
             
+            # Reload the shared rate table on the next lookup
+            invalidate_rate_table()
+            
             if fat_result.modified_count > 0 or snf_result.modified_count > 0:
                 st.success("Rates updated successfully")
-                st.cache_data.clear()
                 st.rerun()
             else:
                 st.info("No changes were needed")
@@ -109,11 +118,89 @@ with st.form("rate_entry_form", clear_on_submit=True):
         except Exception as e:
             st.error(f"Error updating rates: {str(e)}")
 
+# Fat x SNF rate charts, priced per liter from their effective date
+st.markdown("---")
+st.subheader("Rate Chart")
+
+rate_charts = get_rate_charts()
+if rate_charts is None:
+    st.stop()
+in_force = rate_charts.chart_for(date.today())
+if in_force is None:
+    st.info(f"No rate chart yet, milk is priced at ₹{DEFAULT_RATE_PER_LITER:.2f} per liter")
+else:
+    st.caption(f"In force since {in_force.effective_date:%d-%m-%Y}")
+
+if rate_charts.charts:
+    st.dataframe(pd.DataFrame({
+        "Effective From": [chart.effective_date.strftime('%d-%m-%Y') for chart in reversed(rate_charts.charts)],
+        "Fat %": [f"{chart.fat_values()[0]:.1f} - {chart.fat_values()[-1]:.1f}" for chart in reversed(rate_charts.charts)],
+        "SNF %": [f"{chart.snf_values()[0]:.1f} - {chart.snf_values()[-1]:.1f}" for chart in reversed(rate_charts.charts)],
+        "Rates (₹/L)": [f"{chart.rates.min():.2f} - {chart.rates.max():.2f}" for chart in reversed(rate_charts.charts)],
+        "Notes": [chart.notes for chart in reversed(rate_charts.charts)]
+    }), hide_index=True, use_container_width=True)
+
+# Grid settings sit outside the form so the grid reshapes as they change
+col1, col2, col3, col4, col5 = st.columns(5)
+with col1:
+    effective_date = st.date_input("Effective From", date.today(), key="chart_effective_date")
+with col2:
+    fat_from = st.number_input("Fat From", value=DEFAULT_FAT_RANGE[0], min_value=0.0, max_value=12.0, step=0.5)
+with col3:
+    fat_to = st.number_input("Fat To", value=DEFAULT_FAT_RANGE[1], min_value=0.0, max_value=12.0, step=0.5)
+with col4:
+    snf_from = st.number_input("SNF From", value=DEFAULT_SNF_RANGE[0], min_value=0.0, max_value=12.0, step=0.5)
+with col5:
+    snf_to = st.number_input("SNF To", value=DEFAULT_SNF_RANGE[1], min_value=0.0, max_value=12.0, step=0.5)
+
+if fat_from > fat_to or snf_from > snf_to:
+    st.error("Each 'From' value must not be above its 'To' value")
+    st.stop()
+
+fat_values = grid_values(fat_from, fat_to, DEFAULT_STEP)
+snf_values = grid_values(snf_from, snf_to, DEFAULT_STEP)
+# Start from the chart in force on that date, or the fat and SNF rates above
+base = rate_charts.chart_for(effective_date)
+if base is not None:
+    start_rates = base.rate(fat_values[:, None], snf_values[None, :])
+elif current_rates and current_rates['fat_rate'] and current_rates['snf_rate']:
+    start_rates = fat_values[:, None] * current_rates['fat_rate'] + snf_values[None, :] * current_rates['snf_rate']
+else:
+    start_rates = np.full((len(fat_values), len(snf_values)), DEFAULT_RATE_PER_LITER)
+
+with st.form("rate_chart_form"):
+    st.caption("Rate per liter (₹), one row per Fat % and one column per SNF %")
+    grid = pd.DataFrame(
+        np.round(start_rates, 2),
+        index=[f"{fat:.1f}" for fat in fat_values],
+        columns=[f"{snf:.1f}" for snf in snf_values]
+    )
+    edited_grid = st.data_editor(
+        grid,
+        use_container_width=True,
+        key=f"rate_chart_{effective_date}_{fat_from}_{fat_to}_{snf_from}_{snf_to}"
+    )
+    chart_notes = st.text_input("Notes", key="chart_notes")
+    chart_submitted = st.form_submit_button("Save Rate Chart")
+
+if chart_submitted:
+    chart_rates = edited_grid.to_numpy(dtype=float)
+    if np.isnan(chart_rates).any() or (chart_rates <= 0).any():
+        st.error("Please enter a rate above zero in every cell")
+    else:
+        chart = RateChart(
+            effective_date, chart_rates, fat_from, DEFAULT_STEP, snf_from, DEFAULT_STEP, chart_notes
+        )
+        if save_rate_chart(chart):
+            st.success(f"Rate chart effective from {effective_date:%d-%m-%Y} saved")
+            st.rerun()
+
 # Add some helpful information
 st.markdown("---")
 st.markdown("""
 ### Notes:
-- Fat rates are used to calculate milk prices
+- Milk is priced per liter from the rate chart in force on its collection date
+- Fat and SNF between chart steps take the rate of the step below
 - Higher fat percentage typically means higher rate per liter
 - Rates should be reviewed and updated periodically
 """) 
@@ -1,12 +1,12 @@
 import streamlit as st
 from database import init_connection
-from auth_utils import has_permission, can_access_page
+from auth_utils import has_permission, can_access_page, is_authenticated
 import pandas as pd
-import bcrypt
+from password_utils import hash_password
 import re
 
 # Check access
-if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+if not is_authenticated():
     st.error("Please login to access this page")
     st.stop()
 
@@ -70,7 +70,7 @@ with tab1:
                     st.stop()
                 
                 # Create new user with default 'user' role
-                hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
+                hashed_password = hash_password(new_password)
                 new_user = {
                     "username": new_username,
                     "password": hashed_password,
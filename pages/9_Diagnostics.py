@@ -0,0 +1,121 @@
+import streamlit as st
+from auth_utils import has_permission, can_access_page, is_authenticated
+from connection import get_pool_stats
+from tagged_cache import cache_stats
+from instrumentation import query_stats, slowest_queries, reset_query_stats
+from datetime import datetime
+import pandas as pd
+
+# Check access
+if not is_authenticated():
+    st.error("Please login to access this page")
+    st.stop()
+
+if not can_access_page('9_Diagnostics') or not has_permission('admin'):
+    st.error("You don't have permission to access this page")
+    st.stop()
+
+st.title("Diagnostics")
+
+# Add a refresh button
+col1, col2 = st.columns(2)
+with col1:
+    if st.button("🔄 Refresh"):
+        st.rerun()
+with col2:
+    if st.button("Reset Query Stats"):
+        reset_query_stats()
+        st.rerun()
+
+# Query cache counters
+st.subheader("Query Cache")
+stats = cache_stats()
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Hit Rate", f"{stats['hit_rate']:.0%}")
+with col2:
+    st.metric("Hits / Misses", f"{stats['hits']} / {stats['misses']}")
+with col3:
+    st.metric("Evictions", stats['evictions'] + stats['expirations'])
+with col4:
+    st.metric("Invalidated", stats['invalidations'])
+
+if stats['tags']:
+    st.dataframe(
+        pd.DataFrame(
+            [{"Tag": tag, "Cached Queries": count} for tag, count in sorted(stats['tags'].items())]
+        ),
+        hide_index=True,
+        use_container_width=True
+    )
+else:
+    st.info("No cached queries yet")
+
+# Connection pool counters
+st.subheader("Connection Pool")
+try:
+    pool = get_pool_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Checked Out", pool['checked_out'])
+    with col2:
+        st.metric("Waiting", pool['wait_queue'])
+    with col3:
+        st.metric("Open / Max", f"{pool['open']} / {pool['max_pool_size']}")
+    with col4:
+        st.metric("Created", pool['created'])
+except Exception as e:
+    st.error(f"Error reading pool stats: {str(e)}")
+
+# Query latency, volume and errors
+queries = query_stats()
+
+
+def latency_table(rows: dict, label: str):
+    return pd.DataFrame([{
+        label: name,
+        "Calls": row['calls'],
+        "Errors": row['errors'],
+        "p50 (ms)": round(row['p50_ms'], 1),
+        "p95 (ms)": round(row['p95_ms'], 1),
+        "p99 (ms)": round(row['p99_ms'], 1),
+        "Max (ms)": round(row['max_ms'], 1),
+        "Docs": row['docs'],
+        # Estimated from a sample of replies
+        "KB (est.)": round(row['bytes'] / 1024, 1)
+    } for name, row in sorted(rows.items(), key=lambda item: item[1]['p95_ms'], reverse=True)])
+
+
+st.subheader("Data Access Functions")
+if queries['functions']:
+    st.dataframe(latency_table(queries['functions'], "Function"), hide_index=True, use_container_width=True)
+else:
+    st.info("No instrumented calls yet")
+
+st.subheader("Collections")
+if queries['collections']:
+    st.dataframe(latency_table(queries['collections'], "Collection"), hide_index=True, use_container_width=True)
+    selected = st.selectbox("Latency histogram", sorted(queries['collections']))
+    histogram = queries['collections'][selected]['histogram']
+    st.dataframe(pd.DataFrame([histogram]), hide_index=True, use_container_width=True)
+else:
+    st.info("No database commands recorded yet")
+
+st.subheader("Slowest Recent Queries")
+slowest = slowest_queries()
+if slowest:
+    st.dataframe(
+        pd.DataFrame([{
+            "Time": datetime.fromtimestamp(row['at']).strftime('%H:%M:%S'),
+            "Function": row['function'],
+            "Collection": row['collection'],
+            "Command": row['command'],
+            "Duration (ms)": round(row['duration_ms'], 1),
+            "Docs": row['docs'],
+            "Failed": "Yes" if row['failed'] else ""
+        } for row in slowest]),
+        hide_index=True,
+        use_container_width=True
+    )
+else:
+    st.info("No database commands recorded yet")
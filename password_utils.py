@@ -1,9 +1,27 @@
+import os
 import bcrypt
 
-def hash_password(password: str) -> bytes:
+DEFAULT_BCRYPT_ROUNDS = 12
+
+def get_bcrypt_rounds() -> int:
+    """Get the bcrypt cost factor, configurable with BCRYPT_ROUNDS"""
+    return int(os.getenv('BCRYPT_ROUNDS', DEFAULT_BCRYPT_ROUNDS))
+
+def _as_bytes(hashed) -> bytes:
+    return hashed.encode('utf-8') if isinstance(hashed, str) else hashed
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or get_bcrypt_rounds()))
 
 def verify_password(password: str, hashed: bytes) -> bool:
     """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed) 
\ No newline at end of file
+    return bcrypt.checkpw(password.encode('utf-8'), _as_bytes(hashed))
+
+def needs_rehash(hashed: bytes, rounds: int = None) -> bool:
+    """Check whether a hash was made with a different cost than configured"""
+    try:
+        cost = int(_as_bytes(hashed).split(b'$')[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != (rounds or get_bcrypt_rounds())
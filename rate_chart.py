@@ -0,0 +1,185 @@
+"""Effective-dated fat x SNF rate charts.
+
+Each document in `rates` holds one chart: a per-liter rate for every fat
+and SNF step from `fat_start`/`snf_start`, and the `effective_date` it
+applies from. Older documents with only a flat `rate_per_liter` are read
+as a one-cell chart, so existing rate history keeps pricing the same.
+
+`RateChartBook` loads every chart into dense NumPy tables once per cache
+generation. Pricing finds the chart in force with a bisect on the
+effective dates and the rate by direct indexing; `price_batch` prices a
+whole shift without a Python loop per row.
+
+Fat and SNF between grid steps take the rate of the step below, and
+values outside a chart take the rate at its nearest edge. Missing (NaN)
+or infinite readings are rejected with ValueError.
+"""
+from datetime import date, datetime
+from bisect import bisect_right
+import numpy as np
+import streamlit as st
+from db_operations import init_connection
+from tagged_cache import cached, invalidate
+
+# Used when no chart is in force yet on a collection date
+DEFAULT_RATE_PER_LITER = 39.0
+DEFAULT_FAT_RANGE = (3.0, 8.0)
+DEFAULT_SNF_RANGE = (7.5, 9.5)
+DEFAULT_STEP = 0.1
+# Absorbs float error when a reading sits exactly on a grid step
+_STEP_EPSILON = 1e-6
+
+
+def _as_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.combine(value, datetime.min.time())
+
+
+def grid_values(start: float, stop: float, step: float = DEFAULT_STEP) -> np.ndarray:
+    """Grid steps from `start` to `stop` inclusive"""
+    count = int(round((stop - start) / step)) + 1
+    return np.round(start + step * np.arange(max(count, 1)), 4)
+
+
+def _check_finite(*readings):
+    for values in readings:
+        if not np.isfinite(values).all():
+            raise ValueError("Fat, SNF and quantity must be numbers")
+
+
+def _grid_index(values, start: float, step: float, size: int) -> np.ndarray:
+    index = np.floor((np.asarray(values, dtype=np.float64) - start) / step + _STEP_EPSILON)
+    return np.clip(index, 0, size - 1).astype(np.intp)
+
+
+class RateChart:
+    """One fat x SNF table of per-liter rates"""
+
+    def __init__(self, effective_date, rates, fat_start: float = 0.0, fat_step: float = DEFAULT_STEP,
+                 snf_start: float = 0.0, snf_step: float = DEFAULT_STEP, notes: str = ""):
+        self.effective_date = _as_datetime(effective_date)
+        self.rates = np.atleast_2d(np.asarray(rates, dtype=np.float64))
+        self.fat_start = float(fat_start)
+        self.fat_step = float(fat_step)
+        self.snf_start = float(snf_start)
+        self.snf_step = float(snf_step)
+        self.notes = notes
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "RateChart":
+        if "chart" not in doc:
+            # A flat rate from before rate charts
+            return cls(doc["effective_date"], [[doc.get("rate_per_liter", DEFAULT_RATE_PER_LITER)]],
+                       notes=doc.get("notes", ""))
+        return cls(
+            doc["effective_date"], doc["chart"],
+            doc["fat_start"], doc["fat_step"], doc["snf_start"], doc["snf_step"],
+            doc.get("notes", "")
+        )
+
+    def to_doc(self) -> dict:
+        return {
+            "effective_date": self.effective_date,
+            "fat_start": self.fat_start,
+            "fat_step": self.fat_step,
+            "snf_start": self.snf_start,
+            "snf_step": self.snf_step,
+            "chart": self.rates.round(2).tolist(),
+            "notes": self.notes
+        }
+
+    def fat_values(self) -> np.ndarray:
+        return np.round(self.fat_start + self.fat_step * np.arange(self.rates.shape[0]), 4)
+
+    def snf_values(self) -> np.ndarray:
+        return np.round(self.snf_start + self.snf_step * np.arange(self.rates.shape[1]), 4)
+
+    def rate(self, fat, snf):
+        """Per-liter rate for a reading, or an array of rates for arrays of readings"""
+        rows = _grid_index(fat, self.fat_start, self.fat_step, self.rates.shape[0])
+        cols = _grid_index(snf, self.snf_start, self.snf_step, self.rates.shape[1])
+        return self.rates[rows, cols]
+
+
+class RateChartBook:
+    """Every rate chart, sorted by effective date"""
+
+    def __init__(self, charts):
+        self.charts = sorted(charts, key=lambda chart: chart.effective_date)
+        self.dates = [chart.effective_date for chart in self.charts]
+        self._date_array = np.array(self.dates, dtype="datetime64[s]")
+
+    def chart_for(self, entry_date):
+        """The chart in force on a collection date, or None"""
+        index = bisect_right(self.dates, _as_datetime(entry_date))
+        return self.charts[index - 1] if index else None
+
+    def price(self, entry_date, fat: float, snf: float, quantity: float = 1.0):
+        """`(rate_per_liter, total_amount)` for one reading"""
+        _check_finite(np.float64(fat), np.float64(snf), np.float64(quantity))
+        chart = self.chart_for(entry_date)
+        rate = DEFAULT_RATE_PER_LITER if chart is None else float(chart.rate(fat, snf))
+        return rate, rate * quantity
+
+    def price_batch(self, entry_dates, fat, snf, quantity):
+        """Vectorized `price` over equal-length sequences, returning `(rates, amounts)`
+
+        A single date may be passed for the whole batch.
+        """
+        fat = np.asarray(fat, dtype=np.float64)
+        snf = np.asarray(snf, dtype=np.float64)
+        quantity = np.asarray(quantity, dtype=np.float64)
+        _check_finite(fat, snf, quantity)
+        if isinstance(entry_dates, (date, datetime)):
+            entry_dates = [entry_dates]
+        dates = np.array([_as_datetime(value) for value in entry_dates], dtype="datetime64[s]")
+        chart_index = np.searchsorted(self._date_array, dates, side="right") - 1
+        chart_index = np.broadcast_to(chart_index, fat.shape)
+
+        rates = np.full(fat.shape, DEFAULT_RATE_PER_LITER)
+        # Batches rarely span more than one or two charts
+        for index in np.unique(chart_index):
+            if index < 0:
+                continue
+            rows = chart_index == index
+            rates[rows] = self.charts[index].rate(fat[rows], snf[rows])
+        return rates, rates * quantity
+
+
+@cached(["rates"])
+def _load_rate_charts():
+    db = init_connection()
+    if db is None:
+        # Raise so an unreachable database is not cached as an empty book
+        raise ConnectionError("Database connection failed")
+    return RateChartBook(RateChart.from_doc(doc) for doc in db.rates.find())
+
+
+def get_rate_charts():
+    """Get the shared rate charts, loading them on first use
+
+    Returns None when they can't be loaded, so callers can refuse to price
+    rather than fall back to the flat default rate.
+    """
+    try:
+        return _load_rate_charts()
+    except Exception as e:
+        st.error(f"Error loading rate charts: {e}")
+        return None
+
+
+def save_rate_chart(chart: RateChart) -> bool:
+    """Store a chart, replacing any chart with the same effective date"""
+    db = init_connection()
+    if db is not None:
+        try:
+            doc = chart.to_doc()
+            doc["updated_at"] = datetime.now()
+            db.rates.replace_one({"effective_date": chart.effective_date}, doc, upsert=True)
+            invalidate("rates")
+            return True
+        except Exception as e:
+            st.error(f"Error saving rate chart: {e}")
+            return False
+    return False
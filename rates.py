@@ -0,0 +1,55 @@
+from bisect import bisect_right
+import streamlit as st
+from db_operations import init_connection
+from tagged_cache import cached, invalidate
+
+RATE_SETTING_TYPES = ["fat_rate", "snf_rate"]
+
+
+class RateTable:
+    """In-memory copy of the fat/SNF rate settings, sorted for binary search"""
+
+    def __init__(self, settings_docs):
+        self.current = {}
+        fat_docs = []
+        for doc in settings_docs:
+            # Mirror find_one(): the first document of each type is current
+            self.current.setdefault(doc["setting_type"], doc)
+            if doc["setting_type"] == "fat_rate":
+                fat_docs.append(doc)
+        self.fat_docs = sorted(fat_docs, key=lambda doc: float(doc["value"]))
+        self.fat_values = [float(doc["value"]) for doc in self.fat_docs]
+
+    def rate_for_fat(self, fat_content: float) -> float:
+        """Get the exact fat rate, or the closest lower one, without a query"""
+        index = bisect_right(self.fat_values, float(fat_content))
+        if index == 0:
+            return 0.0
+        return self.fat_values[index - 1]
+
+    def current_rate(self, setting_type: str):
+        """Get the current settings document for a rate type"""
+        return self.current.get(setting_type)
+
+
+@cached(["rates"])
+def _load_rate_table():
+    db = init_connection()
+    if db is None:
+        # Raise so an unreachable database is not cached as an empty table
+        raise ConnectionError("Database connection failed")
+    return RateTable(db.settings.find({"setting_type": {"$in": RATE_SETTING_TYPES}}))
+
+
+def get_rate_table() -> RateTable:
+    """Get the shared rate table, loading it on first use"""
+    try:
+        return _load_rate_table()
+    except Exception as e:
+        st.error(f"Error loading rates: {e}")
+        return RateTable([])
+
+
+def invalidate_rate_table():
+    """Drop the shared rate table so the next lookup reloads it"""
+    invalidate("rates")
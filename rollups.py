@@ -0,0 +1,252 @@
+"""Materialized day/shift rollups of milk entries.
+
+`milk_rollups` holds one document per (farmer, year, month, day, shift) with
+the summed liters, fat x liters, amount and entry count. Entry writes keep it
+up to date with `apply_entries`; `rebuild_rollups` and `verify_rollups`
+reconstruct or check it from the raw `milk_entries` collection.
+
+    python rollups.py verify
+    python rollups.py rebuild
+"""
+import sys
+from pymongo import UpdateOne
+
+ROLLUP_KEY = ["farmer", "year", "month", "day", "shift"]
+
+
+def _rollup_key(entry: dict) -> dict:
+    date = entry["collection"]["date"]
+    return {
+        "farmer": entry["farmer"]["name"],
+        "year": date.year,
+        "month": date.month,
+        "day": date.day,
+        "shift": entry["collection"]["shift"].lower()
+    }
+
+
+def _rollup_update(entry: dict, sign: int) -> UpdateOne:
+    quantity = float(entry["milk"]["quantity"])
+    fat = float(entry["milk"]["fat"])
+    return UpdateOne(
+        _rollup_key(entry),
+        {
+            "$inc": {
+                "liters": sign * quantity,
+                "fat_liters": sign * fat * quantity,
+                "amount": sign * float(entry["milk"]["total_amount"]),
+                "entries": sign
+            },
+            "$set": {"village": entry["farmer"].get("village", "")}
+        },
+        upsert=True
+    )
+
+
+def apply_entries(db, entries, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) entries from their rollup cells"""
+    entries = list(entries)
+    updates = [_rollup_update(entry, sign) for entry in entries]
+    if updates:
+        db.milk_rollups.bulk_write(updates, ordered=False)
+    if sign < 0 and updates:
+        # Drop cells whose last entry was removed, looking only at the cells
+        # just updated so the delete uses the rollup key index
+        keys = list({tuple(_rollup_key(entry).items()): None for entry in entries})
+        db.milk_rollups.delete_many({
+            "$or": [dict(key) for key in keys],
+            "entries": {"$lte": 0}
+        })
+
+
+def _rollup_pipeline(match: dict = None) -> list:
+    """Aggregate raw entries into rollup-shaped documents"""
+    return [
+        {"$match": match or {}},
+        {
+            "$group": {
+                "_id": {
+                    "farmer": "$farmer.name",
+                    "year": {"$year": "$collection.date"},
+                    "month": {"$month": "$collection.date"},
+                    "day": {"$dayOfMonth": "$collection.date"},
+                    "shift": {"$toLower": "$collection.shift"}
+                },
+                "village": {"$last": "$farmer.village"},
+                "liters": {"$sum": "$milk.quantity"},
+                "fat_liters": {"$sum": {"$multiply": ["$milk.fat", "$milk.quantity"]}},
+                "amount": {"$sum": "$milk.total_amount"},
+                "entries": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "farmer": "$_id.farmer",
+                "year": "$_id.year",
+                "month": "$_id.month",
+                "day": "$_id.day",
+                "shift": "$_id.shift",
+                "village": 1,
+                "liters": 1,
+                "fat_liters": 1,
+                "amount": 1,
+                "entries": 1
+            }
+        }
+    ]
+
+
+def rebuild_rollups(db) -> int:
+    """Recompute every rollup cell from raw entries, replacing the collection"""
+    db.milk_entries.aggregate(
+        _rollup_pipeline() + [{"$out": "milk_rollups"}],
+        allowDiskUse=True
+    )
+    return db.milk_rollups.count_documents({})
+
+
+def verify_rollups(db, tolerance: float = 0.01) -> list:
+    """Compare stored rollups with raw entries and list mismatched cells"""
+    stored = {
+        tuple(cell[key] for key in ROLLUP_KEY): cell
+        for cell in db.milk_rollups.find({}, {"_id": 0})
+    }
+    mismatches = []
+    for expected in db.milk_entries.aggregate(_rollup_pipeline(), allowDiskUse=True):
+        key = tuple(expected[field] for field in ROLLUP_KEY)
+        actual = stored.pop(key, None)
+        if actual is None or any(
+            abs(actual[field] - expected[field]) > tolerance
+            for field in ("liters", "fat_liters", "amount", "entries")
+        ):
+            mismatches.append({"key": key, "expected": expected, "actual": actual})
+    for key, actual in stored.items():
+        mismatches.append({"key": key, "expected": None, "actual": actual})
+    return mismatches
+
+
+def get_rollup_cells(db, farmer_name: str, month: int, year: int) -> list:
+    """Get a farmer's day/shift cells for a month from the rollups"""
+    return list(db.milk_rollups.find(
+        {"farmer": farmer_name, "year": year, "month": month},
+        {"_id": 0}
+    ).sort([("day", 1), ("shift", -1)]))
+
+
+def rollup_cells_pipeline(match: dict, by_farmer: bool = False) -> list:
+    """Read rollup cells in the `_id` shape of the report aggregations"""
+    cell_id = {"year": "$year", "month": "$month", "day": "$day", "shift": "$shift"}
+    sort = {"year": 1, "month": 1, "day": 1, "shift": -1}
+    if by_farmer:
+        cell_id["farmer"] = "$farmer"
+        sort = {"farmer": 1, **sort}
+    return [
+        {"$match": match},
+        {"$sort": sort},
+        {
+            "$project": {
+                "_id": cell_id,
+                "liters": 1,
+                "fat_liters": 1,
+                "amount": 1,
+                "entries": 1
+            }
+        }
+    ]
+
+
+def month_range_match(farmer_name: str, start_month: tuple, end_month: tuple) -> dict:
+    """Match a farmer's cells from `(year, month)` to `(year, month)` inclusive"""
+    month_index = {"$add": [{"$multiply": ["$year", 12]}, "$month"]}
+    return {
+        "farmer": farmer_name,
+        "year": {"$gte": start_month[0], "$lte": end_month[0]},
+        "$expr": {
+            "$and": [
+                {"$gte": [month_index, start_month[0] * 12 + start_month[1]]},
+                {"$lte": [month_index, end_month[0] * 12 + end_month[1]]}
+            ]
+        }
+    }
+
+
+def get_rollup_month_amounts(db, months: list, farmer_name: str = None, village: str = None) -> dict:
+    """Get the milk amount of each `(year, month)` in `months` from the rollups"""
+    if not months:
+        return {}
+    match = {"$or": [{"year": year, "month": month} for year, month in months]}
+    if farmer_name:
+        match["farmer"] = farmer_name
+    elif village:
+        match["village"] = village
+    return {
+        (row["_id"]["year"], row["_id"]["month"]): row["amount"]
+        for row in db.milk_rollups.aggregate([
+            {"$match": match},
+            {"$group": {"_id": {"year": "$year", "month": "$month"}, "amount": {"$sum": "$amount"}}}
+        ])
+    }
+
+
+def get_rollup_totals(db, month: int, year: int, farmer_name: str = None) -> list:
+    """Get per-farmer liters, average fat and amount for a month"""
+    match = {"year": year, "month": month}
+    if farmer_name:
+        match["farmer"] = farmer_name
+    return list(db.milk_rollups.aggregate([
+        {"$match": match},
+        {
+            "$group": {
+                "_id": "$farmer",
+                "village": {"$last": "$village"},
+                "liters": {"$sum": "$liters"},
+                "fat_liters": {"$sum": "$fat_liters"},
+                "amount": {"$sum": "$amount"},
+                "entries": {"$sum": "$entries"}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "farmer": "$_id",
+                "village": 1,
+                "liters": 1,
+                "amount": 1,
+                "entries": 1,
+                "avg_fat": {
+                    "$cond": [
+                        {"$gt": ["$liters", 0]},
+                        {"$divide": ["$fat_liters", "$liters"]},
+                        0
+                    ]
+                }
+            }
+        },
+        {"$sort": {"farmer": 1}}
+    ]))
+
+
+def main(argv) -> int:
+    from db_operations import init_connection
+
+    command = argv[1] if len(argv) > 1 else "verify"
+    db = init_connection()
+    if db is None:
+        print("Could not connect to database")
+        return 1
+    if command == "rebuild":
+        print(f"Rebuilt {rebuild_rollups(db)} rollup cells")
+        return 0
+    if command == "verify":
+        mismatches = verify_rollups(db)
+        for mismatch in mismatches[:20]:
+            print(f"{mismatch['key']}: expected {mismatch['expected']}, found {mismatch['actual']}")
+        print(f"{len(mismatches)} mismatched rollup cells")
+        return 1 if mismatches else 0
+    print("Usage: python rollups.py [verify|rebuild]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,134 @@
+"""Process-wide query cache with tag-based invalidation.
+
+Cached functions declare tags such as "farmers", "rates",
+"payments:{farmer_name}" or "entries:{year}-{month}"; placeholders are
+filled from the call's arguments. Writes call `invalidate()` with the
+tags they touch, so only the affected entries are dropped instead of
+clearing every cached query for every user.
+
+Cached values are shared across sessions and must not be modified by
+callers.
+"""
+import time
+import inspect
+import functools
+import threading
+from collections import OrderedDict, defaultdict
+
+MAX_ENTRIES = 2048
+
+
+class TaggedCache:
+    """LRU cache whose entries carry tags and an optional expiry"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        """Return `(found, value)` for a key"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return False, None
+            value, expires_at, _ = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._drop(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, value
+
+    def set(self, key, value, tags, ttl=None):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._entries[key] = (value, expires_at, frozenset(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, *tags) -> int:
+        """Drop every entry carrying any of the tags, returning how many"""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["tags"] = {tag: len(keys) for tag, keys in self._tags.items()}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = TaggedCache()
+
+
+def cached(tags, ttl=None):
+    """Cache a function's result under tags filled from its arguments
+
+    Arguments whose names start with an underscore (such as `_db`) are left
+    out of the cache key, matching st.cache_data. Exceptions are not cached.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {
+                name: value for name, value in bound.arguments.items()
+                if not name.startswith("_")
+            }
+            key = (func.__module__, func.__qualname__, repr(sorted(arguments.items())))
+            found, value = _cache.get(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            _cache.set(key, value, [tag.format(**arguments) for tag in tags], ttl)
+            return value
+
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags) -> int:
+    """Drop cached results carrying any of the given tags"""
+    return _cache.invalidate(*tags)
+
+
+def cache_stats() -> dict:
+    """Get hit, miss, eviction and invalidation counters"""
+    return _cache.stats()
@@ -0,0 +1,71 @@
+import io
+import re
+import zipfile
+from itertools import groupby
+import pandas as pd
+from utils.register import build_register
+
+SUMMARY_COLUMNS = ['Farmer', 'Total Liters', 'Average Fat', 'Total Amount']
+
+
+def iter_registers(cells, year: int, month: int):
+    """Yield `(farmer, register_df, totals)` from farmer-sorted cells
+
+    Only one farmer's cells are held at a time, so memory stays bounded by
+    the largest register rather than the whole month.
+    """
+    for farmer, farmer_cells in groupby(cells, key=lambda cell: cell['farmer']):
+        register, totals = build_register(list(farmer_cells), year, month)
+        yield farmer, register, totals
+
+
+def _sheet_name(farmer: str, used: set) -> str:
+    """Make a valid, unique Excel sheet name for a farmer"""
+    base = re.sub(r'[\[\]:*?/\\]', '_', farmer)[:28] or 'Farmer'
+    name = base
+    suffix = 2
+    while name.lower() in used:
+        name = f"{base[:25]}~{suffix}"
+        suffix += 1
+    used.add(name.lower())
+    return name
+
+
+def _summary_row(farmer: str, totals: dict) -> dict:
+    return {
+        'Farmer': farmer,
+        'Total Liters': round(totals['total_liters'], 1),
+        'Average Fat': round(totals['avg_fat'], 1),
+        'Total Amount': round(totals['total_amount'], 2)
+    }
+
+
+def registers_to_workbook(registers, progress=None) -> bytes:
+    """Write every register to its own sheet plus a leading Summary sheet"""
+    buffer = io.BytesIO()
+    summary = []
+    used = {'summary'}
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        pd.DataFrame(columns=SUMMARY_COLUMNS).to_excel(writer, sheet_name='Summary', index=False)
+        for done, (farmer, register, totals) in enumerate(registers, start=1):
+            register.to_excel(writer, sheet_name=_sheet_name(farmer, used), index=False)
+            summary.append(_summary_row(farmer, totals))
+            if progress:
+                progress(done, farmer)
+        pd.DataFrame(summary, columns=SUMMARY_COLUMNS).to_excel(writer, sheet_name='Summary', index=False)
+    return buffer.getvalue()
+
+
+def registers_to_zip(registers, progress=None) -> bytes:
+    """Write every register as its own CSV plus summary.csv into a ZIP"""
+    buffer = io.BytesIO()
+    summary = []
+    used = {'summary'}
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for done, (farmer, register, totals) in enumerate(registers, start=1):
+            archive.writestr(f"{_sheet_name(farmer, used)}.csv", register.to_csv(index=False))
+            summary.append(_summary_row(farmer, totals))
+            if progress:
+                progress(done, farmer)
+        archive.writestr('summary.csv', pd.DataFrame(summary, columns=SUMMARY_COLUMNS).to_csv(index=False))
+    return buffer.getvalue()
@@ -0,0 +1,139 @@
+import csv
+import os
+import glob
+import time
+import tempfile
+from itertools import islice
+from datetime import datetime
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_PREFIX = "milkmagic_export_"
+# Streamlit 1.31 keeps download data in memory until the session moves on,
+# so larger exports are refused rather than served
+EXPORT_MAX_BYTES = int(os.getenv('EXPORT_MAX_MB', '100')) * 1024 * 1024
+# Export files left behind (e.g. by a crashed run) are removed after this long
+EXPORT_TTL_SECONDS = 60 * 60
+# Excel's row limit, less the header row
+XLSX_MAX_ROWS = 1048575
+
+# (header, dotted document path) for each export
+ENTRY_COLUMNS = [
+    ("Date", "collection.date"),
+    ("Shift", "collection.shift"),
+    ("Farmer", "farmer.name"),
+    ("Father Name", "farmer.father_name"),
+    ("Village", "farmer.village"),
+    ("Quantity", "milk.quantity"),
+    ("Fat %", "milk.fat"),
+    ("SNF %", "milk.snf"),
+    ("Rate", "milk.rate_per_liter"),
+    ("Amount", "milk.total_amount"),
+    ("Recorded At", "timestamp"),
+]
+PAYMENT_COLUMNS = [
+    ("Date", "payment_date"),
+    ("Farmer", "farmer_name"),
+    ("Month", "month"),
+    ("Year", "year"),
+    ("Amount", "amount_paid"),
+    ("Notes", "notes"),
+]
+
+
+def export_projection(columns) -> dict:
+    """Project only the exported fields"""
+    projection = {path: 1 for _, path in columns}
+    projection["_id"] = 0
+    return projection
+
+
+def _value(doc, path):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+def iter_rows(cursor, columns):
+    paths = [path for _, path in columns]
+    for doc in cursor:
+        yield [_value(doc, path) for path in paths]
+
+
+def _chunks(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(cursor, columns, path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Stream cursor documents into a CSV file, one chunk at a time"""
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow([header for header, _ in columns])
+        for chunk in _chunks(iter_rows(cursor, columns), chunk_size):
+            writer.writerows(
+                [value.isoformat(sep=" ") if isinstance(value, datetime) else value for value in row]
+                for row in chunk
+            )
+            written += len(chunk)
+    return written
+
+
+def write_xlsx(cursor, columns, path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Stream cursor documents into a write-only XLSX workbook
+
+    Rows beyond Excel's sheet limit continue on a new sheet.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    headers = [header for header, _ in columns]
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    written = 0
+    for chunk in _chunks(iter_rows(cursor, columns), chunk_size):
+        for row in chunk:
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                sheet.append(headers)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        written += len(chunk)
+    if sheet is None:
+        workbook.create_sheet("Sheet1").append(headers)
+    workbook.save(path)
+    return written
+
+
+def export_to_tempfile(cursor, columns, file_format: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Write an export to a temporary file and return `(path, row_count)`"""
+    suffix = ".xlsx" if file_format == "xlsx" else ".csv"
+    handle, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=suffix)
+    os.close(handle)
+    try:
+        writer = write_xlsx if file_format == "xlsx" else write_csv
+        return path, writer(cursor, columns, path, chunk_size)
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def remove_stale_exports(max_age_seconds: float = EXPORT_TTL_SECONDS) -> int:
+    """Delete export files older than `max_age_seconds`, returning how many"""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{EXPORT_PREFIX}*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # Already removed by another session
+            pass
+    return removed
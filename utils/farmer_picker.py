@@ -0,0 +1,34 @@
+import streamlit as st
+from farmer_directory import get_farmer_directory, search_farmers, farmer_label
+from farmer_search import SEARCH_LIMIT
+
+
+def farmer_picker(label: str = "Farmer", key: str = "farmer", limit: int = SEARCH_LIMIT,
+                  none_label: str = "Select Farmer"):
+    """Search box plus a short list of matching farmers
+
+    Only the best `limit` matches are sent to the browser instead of every
+    farmer. With an empty search the first farmers by name are listed.
+    Returns the chosen farmer document, or None. Widgets inside a form don't
+    rerun until submit, so call this outside any st.form.
+    """
+    directory = get_farmer_directory()
+    query = st.text_input(
+        "Search farmers", key=f"{key}_query",
+        placeholder="Name, father's name, village or phone"
+    )
+    if query.strip():
+        matches = search_farmers(query, limit)
+        if not matches:
+            st.caption("No farmers match that search")
+    else:
+        matches = directory.farmers[:limit]
+    # Matches may come from the database when the directory couldn't load
+    by_id = {str(farmer['_id']): farmer for farmer in matches}
+    farmer_id = st.selectbox(
+        label,
+        [None] + list(by_id),
+        key=f"{key}_id",
+        format_func=lambda farmer_id: none_label if farmer_id is None else farmer_label(by_id[farmer_id])
+    )
+    return by_id.get(farmer_id)
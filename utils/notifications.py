@@ -1,24 +1,203 @@
-from twilio.rest import Client
 import os
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+from datetime import datetime
 
-def send_sms(to_number, message):
-    try:
-        client = Client(
-            os.getenv('TWILIO_ACCOUNT_SID'),
-            os.getenv('TWILIO_AUTH_TOKEN')
-        )
-        
-        message = client.messages.create(
-            body=message,
+SMS_WORKERS = int(os.getenv('SMS_WORKERS', '2'))
+SMS_RATE_PER_SECOND = float(os.getenv('SMS_RATE_PER_SECOND', '1'))
+SMS_MAX_RETRIES = int(os.getenv('SMS_MAX_RETRIES', '3'))
+SMS_BACKOFF_SECONDS = float(os.getenv('SMS_BACKOFF_SECONDS', '2'))
+DELIVERY_LOG_SIZE = 500
+
+
+class TwilioTransport:
+    """Sends SMS through Twilio with one client reused for every message"""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(
+                    os.getenv('TWILIO_ACCOUNT_SID'),
+                    os.getenv('TWILIO_AUTH_TOKEN')
+                )
+            return self._client
+
+    def send(self, to_number, body):
+        message = self._get_client().messages.create(
+            body=body,
             from_=os.getenv('TWILIO_PHONE_NUMBER'),
             to=to_number
         )
-        
-        return True, message.sid
+        return message.sid
+
+
+class FakeTransport:
+    """Records messages locally instead of sending them, for tests and dev"""
+
+    def __init__(self, fail_times=0):
+        self.sent = []
+        self.fail_times = fail_times
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body):
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise RuntimeError("Simulated send failure")
+            self.sent.append({'to': to_number, 'body': body})
+            return f"FAKE{len(self.sent):06d}"
+
+
+class RateLimiter:
+    """Token bucket shared by all workers"""
+
+    def __init__(self, rate_per_second, burst=1):
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class NotificationQueue:
+    """Queue of SMS messages drained by a pool of worker threads
+
+    Sends are capped at `rate_per_second` in total across all workers. Each
+    message is retried with exponential backoff and recorded in a bounded
+    delivery log.
+    """
+
+    def __init__(self, transport, workers=SMS_WORKERS, rate_per_second=SMS_RATE_PER_SECOND,
+                 max_retries=SMS_MAX_RETRIES, backoff_seconds=SMS_BACKOFF_SECONDS):
+        self.transport = transport
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.limiter = RateLimiter(rate_per_second)
+        self.delivery_log = deque(maxlen=DELIVERY_LOG_SIZE)
+        self._queue = queue.Queue()
+        self._log_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"sms-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(self, to_number, body):
+        """Queue a message and return its id without waiting for delivery"""
+        notification_id = uuid.uuid4().hex
+        self._queue.put({'id': notification_id, 'to': to_number, 'body': body})
+        return notification_id
+
+    def _log(self, item, status, attempts, detail):
+        with self._log_lock:
+            self.delivery_log.append({
+                'id': item['id'],
+                'to': item['to'],
+                'status': status,
+                'attempts': attempts,
+                'detail': detail,
+                'at': datetime.now()
+            })
+
+    def _deliver(self, item):
+        for attempt in range(1, self.max_retries + 2):
+            self.limiter.acquire()
+            try:
+                sid = self.transport.send(item['to'], item['body'])
+                self._log(item, 'delivered', attempt, sid)
+                return
+            except Exception as e:
+                if attempt > self.max_retries:
+                    self._log(item, 'failed', attempt, str(e))
+                    return
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._deliver(item)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Block until every queued message has been delivered or given up"""
+        self._queue.join()
+
+    def shutdown(self):
+        """Stop the workers after the queued messages are handled"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        with self._log_lock:
+            log = list(self.delivery_log)
+        return {
+            'queued': self._queue.qsize(),
+            'delivered': sum(1 for item in log if item['status'] == 'delivered'),
+            'failed': sum(1 for item in log if item['status'] == 'failed')
+        }
+
+
+def make_transport():
+    """Pick the transport from SMS_TRANSPORT ('twilio' or 'fake')"""
+    if os.getenv('SMS_TRANSPORT', 'twilio') == 'fake':
+        return FakeTransport()
+    return TwilioTransport()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_notification_queue():
+    """Get the process-wide notification queue, starting it on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = NotificationQueue(make_transport())
+        return _queue
+
+
+def send_sms(to_number, message):
+    """Send one SMS synchronously through the shared transport and rate limit"""
+    notifications = get_notification_queue()
+    try:
+        notifications.limiter.acquire()
+        sid = notifications.transport.send(to_number, message)
+        return True, sid
     except Exception as e:
         return False, str(e)
 
+
 def send_milk_receipt(phone_number, entry_data):
+    """Queue a milk receipt SMS and return its notification id immediately"""
     message = (
         f"MilkMagic Receipt\n"
         f"Date: {entry_data['date']}\n"
@@ -27,5 +206,5 @@ def send_milk_receipt(phone_number, entry_data):
         f"Amount: ₹{entry_data['amount']}\n"
         "Thank you!"
     )
-    
-    return send_sms(phone_number, message) 
\ No newline at end of file
+
+    return True, get_notification_queue().enqueue(phone_number, message)
@@ -1,46 +1,110 @@
 from fpdf import FPDF
+from concurrent.futures import ProcessPoolExecutor
 import datetime
+import os
+
+# Fixed receipt layout, shared by every page that is rendered
+TITLE = 'MilkMagic'
+FOOTER = "Thank you for your business!"
+HEADER_LINES = (
+    ("Supplier", 'name', 'user'),
+    ("Date", 'date', 'entry'),
+    ("Shift", 'shift', 'entry'),
+)
+DETAIL_ROWS = (
+    ("Quantity", "{quantity} L"),
+    ("Fat %", "{fat}"),
+    ("SNF %", "{snf}"),
+    ("CLR", "{clr}"),
+    ("Amount", "Rs. {amount}"),
+)
+RECEIPTS_PER_CHUNK = 100
+
+
+def _draw_receipt(pdf, entry_data, user_data):
+    """Draw one receipt on a new page of an existing document"""
+    pdf.add_page()
+    sources = {'entry': entry_data, 'user': user_data}
+    values = dict(entry_data)
+    values.setdefault('clr', '-')
+
+    # Header
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(190, 10, TITLE, 0, 1, 'C')
+
+    # User Details
+    pdf.set_font('Arial', '', 12)
+    for label, key, source in HEADER_LINES:
+        pdf.cell(190, 10, f"{label}: {sources[source][key]}", 0, 1)
+
+    # Milk Details
+    pdf.ln(10)
+    pdf.cell(95, 10, "Parameter", 1)
+    pdf.cell(95, 10, "Value", 1)
+    pdf.ln()
+
+    for label, template in DETAIL_ROWS:
+        pdf.cell(95, 10, label, 1)
+        pdf.cell(95, 10, template.format(**values), 1)
+        pdf.ln()
+
+    # Footer
+    pdf.ln(10)
+    pdf.cell(190, 10, FOOTER, 0, 1, 'C')
+
+
+def _new_document():
+    pdf = FPDF()
+    pdf.set_compression(True)
+    return pdf
+
 
 class Receipt:
     def __init__(self, entry_data, user_data):
-        self.pdf = FPDF()
+        self.pdf = _new_document()
         self.entry_data = entry_data
         self.user_data = user_data
-    
+
     def generate(self):
-        self.pdf.add_page()
-        
-        # Header
-        self.pdf.set_font('Arial', 'B', 16)
-        self.pdf.cell(190, 10, 'MilkMagic', 0, 1, 'C')
-        
-        # User Details
-        self.pdf.set_font('Arial', '', 12)
-        self.pdf.cell(190, 10, f"Supplier: {self.user_data['name']}", 0, 1)
-        self.pdf.cell(190, 10, f"Date: {self.entry_data['date']}", 0, 1)
-        self.pdf.cell(190, 10, f"Shift: {self.entry_data['shift']}", 0, 1)
-        
-        # Milk Details
-        self.pdf.ln(10)
-        self.pdf.cell(95, 10, "Parameter", 1)
-        self.pdf.cell(95, 10, "Value", 1)
-        self.pdf.ln()
-        
-        details = [
-            ("Quantity", f"{self.entry_data['quantity']} L"),
-            ("Fat %", f"{self.entry_data['fat']}"),
-            ("SNF %", f"{self.entry_data['snf']}"),
-            ("CLR", f"{self.entry_data['clr']}"),
-            ("Amount", f"₹ {self.entry_data['amount']}")
-        ]
-        
-        for label, value in details:
-            self.pdf.cell(95, 10, label, 1)
-            self.pdf.cell(95, 10, value, 1)
-            self.pdf.ln()
-        
-        # Footer
-        self.pdf.ln(10)
-        self.pdf.cell(190, 10, "Thank you for your business!", 0, 1, 'C')
-        
-        return self.pdf.output(dest='S').encode('latin1') 
\ No newline at end of file
+        _draw_receipt(self.pdf, self.entry_data, self.user_data)
+        return self.pdf.output(dest='S').encode('latin1')
+
+
+def render_receipts(receipts):
+    """Render `(entry_data, user_data)` pairs into one multi-page PDF"""
+    pdf = _new_document()
+    for entry_data, user_data in receipts:
+        _draw_receipt(pdf, entry_data, user_data)
+    return pdf.output(dest='S').encode('latin1')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def render_receipts_parallel(receipts, processes=None, chunk_size=RECEIPTS_PER_CHUNK):
+    """Render receipts in a process pool, one multi-page PDF per chunk"""
+    receipts = list(receipts)
+    if len(receipts) <= chunk_size:
+        return [render_receipts(receipts)] if receipts else []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(render_receipts, _chunks(receipts, chunk_size)))
+
+
+def _write_receipt(job):
+    path, entry_data, user_data = job
+    with open(path, 'wb') as output:
+        output.write(render_receipts([(entry_data, user_data)]))
+    return path
+
+
+def render_receipt_files(receipts, out_dir, processes=None):
+    """Render each receipt to its own PDF file in `out_dir` using a process pool"""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [
+        (os.path.join(out_dir, f"receipt_{index + 1:04d}.pdf"), entry_data, user_data)
+        for index, (entry_data, user_data) in enumerate(receipts)
+    ]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_write_receipt, jobs, chunksize=max(1, len(jobs) // 32)))
@@ -0,0 +1,90 @@
+import calendar
+import numpy as np
+import pandas as pd
+
+# Row of the register each shift is written to
+SHIFT_ROWS = {'morning': 0, 'evening': 1}
+SHIFT_LABELS = ['M', 'E']
+
+
+def day_columns(year: int, month: int) -> list:
+    """Get the register's day column names for a month"""
+    num_days = calendar.monthrange(year, month)[1]
+    return [f"{day:02d}" for day in range(1, num_days + 1)]
+
+
+def _to_frame(entries) -> pd.DataFrame:
+    """Accept a list of entry dicts or an existing DataFrame"""
+    if isinstance(entries, pd.DataFrame):
+        return entries
+    entries = list(entries)
+    if not entries:
+        return pd.DataFrame(columns=['date', 'shift', 'liters', 'fat', 'amount'])
+    return pd.DataFrame(entries)
+
+
+def build_register(entries, year: int, month: int):
+    """Build the monthly register grid and its totals in one vectorized pass
+
+    `entries` holds `date` (or a day-of-month `day`), `shift`, `liters`, `fat`
+    and `amount` values, as returned by get_monthly_report. Columnar reports
+    (utils.report_columns) with `year`/`month` columns and shift codes are
+    accepted too. Entries outside the month are ignored and
+    entries sharing a day and shift are summed into one cell.
+    Returns `(register_df, totals)`.
+    """
+    columns = day_columns(year, month)
+    num_days = len(columns)
+    frame = _to_frame(entries)
+
+    if 'day' in frame.columns:
+        days = frame['day'].to_numpy(dtype=np.int64)
+        if 'month' in frame.columns:
+            in_month = ((frame['year'] == year) & (frame['month'] == month)).to_numpy()
+        else:
+            in_month = np.ones(len(frame), dtype=bool)
+    else:
+        dates = pd.to_datetime(frame['date'])
+        days = dates.dt.day.to_numpy(dtype=np.int64)
+        in_month = ((dates.dt.year == year) & (dates.dt.month == month)).to_numpy()
+
+    if pd.api.types.is_integer_dtype(frame['shift']):
+        # Columnar reports already hold the row code; -1 marks an unknown shift
+        rows = frame['shift'].to_numpy(dtype=float)
+        rows[rows < 0] = np.nan
+    else:
+        rows = frame['shift'].astype(str).str.lower().map(SHIFT_ROWS).to_numpy(dtype=float, na_value=np.nan)
+    liters = frame['liters'].to_numpy(dtype=np.float64)
+    keep = in_month & ~np.isnan(rows) & (liters > 0)
+
+    # Pivot every entry onto a flat (shift, day) cell index and sum per cell
+    cells = rows[keep].astype(np.int64) * num_days + days[keep] - 1
+    liters = liters[keep]
+    fat = frame['fat'].to_numpy(dtype=np.float64)[keep]
+    amount = frame['amount'].to_numpy(dtype=np.float64)[keep]
+    size = 2 * num_days
+    cell_liters = np.bincount(cells, weights=liters, minlength=size)
+    cell_fat_liters = np.bincount(cells, weights=fat * liters, minlength=size)
+    filled = cell_liters > 0
+    cell_fat = np.divide(cell_fat_liters, cell_liters, out=np.zeros(size), where=filled)
+
+    text = np.char.add(
+        np.char.add(np.char.mod('%.1f', cell_liters), '('),
+        np.char.add(np.char.mod('%.1f', cell_fat), ')')
+    )
+    text = np.where(filled, text, '').reshape(2, num_days)
+
+    filled_cells = int(filled.sum())
+    total_liters = float(cell_liters.sum())
+    avg_fat = float(cell_fat[filled].sum() / filled_cells) if filled_cells else 0.0
+    totals = {
+        'total_liters': total_liters,
+        'avg_fat': avg_fat,
+        'total_amount': float(amount.sum()),
+        'filled_cells': filled_cells
+    }
+
+    register = pd.DataFrame(text, columns=columns)
+    register.insert(0, 'Shift', SHIFT_LABELS)
+    register['Total'] = [f"{total_liters:.1f}({avg_fat:.1f})", ""]
+    return register, totals
@@ -0,0 +1,80 @@
+from itertools import islice
+import numpy as np
+import pandas as pd
+from utils.register import SHIFT_ROWS
+
+# Column dtypes of a columnar report; shift holds the SHIFT_ROWS code
+COLUMN_DTYPES = {
+    'year': np.int16,
+    'month': np.int8,
+    'day': np.int8,
+    'shift': np.int8,
+    'liters': np.float32,
+    'fat': np.float32,
+    'amount': np.float32,
+    'entries': np.int32,
+}
+
+
+def _batch_arrays(batch: list, farmer_codes: dict):
+    count = len(batch)
+    ids = [cell['_id'] for cell in batch]
+    arrays = {
+        'year': np.fromiter((key['year'] for key in ids), np.int16, count),
+        'month': np.fromiter((key['month'] for key in ids), np.int8, count),
+        'day': np.fromiter((key['day'] for key in ids), np.int8, count),
+        'shift': np.fromiter((SHIFT_ROWS.get(key['shift'], -1) for key in ids), np.int8, count),
+        'liters': np.fromiter((cell['liters'] for cell in batch), np.float64, count),
+        'fat_liters': np.fromiter((cell['fat_liters'] for cell in batch), np.float64, count),
+        'amount': np.fromiter((cell['amount'] for cell in batch), np.float32, count),
+        'entries': np.fromiter((cell['entries'] for cell in batch), np.int32, count),
+    }
+    if farmer_codes is not None:
+        arrays['farmer'] = np.fromiter(
+            (farmer_codes.setdefault(key['farmer'], len(farmer_codes)) for key in ids),
+            np.int32, count
+        )
+    return arrays
+
+
+def decode_report_cells(cells, batch_size: int = 1000, with_farmer: bool = False) -> pd.DataFrame:
+    """Decode aggregated day/shift cells into a compact columnar DataFrame
+
+    `cells` is the cursor of report_columns_pipeline. Cells are read
+    `batch_size` at a time straight into typed arrays, so no per-cell dict,
+    datetime or Python float is kept. Shift is stored as its SHIFT_ROWS
+    code and fat is the liter-weighted average of the cell. With
+    `with_farmer`, a categorical `farmer` column is added.
+    """
+    farmer_codes = {} if with_farmer else None
+    batches = []
+    cells = iter(cells)
+    while True:
+        batch = list(islice(cells, batch_size))
+        if not batch:
+            break
+        batches.append(_batch_arrays(batch, farmer_codes))
+
+    # Liters and fat x liters stay float64 until fat has been derived
+    dtypes = dict(COLUMN_DTYPES, liters=np.float64, fat_liters=np.float64)
+    del dtypes['fat']
+    if with_farmer:
+        dtypes['farmer'] = np.int32
+    if batches:
+        columns = {key: np.concatenate([batch[key] for batch in batches]) for key in dtypes}
+    else:
+        columns = {key: np.empty(0, dtype=dtype) for key, dtype in dtypes.items()}
+
+    liters = columns.pop('liters')
+    fat_liters = columns.pop('fat_liters')
+    columns['liters'] = liters.astype(np.float32)
+    columns['fat'] = np.divide(
+        fat_liters, liters, out=np.zeros(len(liters)), where=liters > 0
+    ).astype(np.float32)
+    frame = pd.DataFrame({key: columns[key] for key in COLUMN_DTYPES})
+    if with_farmer:
+        frame.insert(0, 'farmer', pd.Categorical.from_codes(
+            columns['farmer'], categories=list(farmer_codes)
+        ))
+    return frame
+